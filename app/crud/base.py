@@ -0,0 +1,102 @@
+from sqlalchemy import Table, and_, bindparam, delete, insert, select, update
+from sqlalchemy.engine import RowMapping
+from sqlalchemy.orm import Session
+from typing import Any, Dict, FrozenSet, Iterable, List, Mapping, Optional, Sequence, Tuple
+
+
+class TableCrud:
+    """
+    Operaciones comunes sobre una tabla de core/schema.py con sentencias reutilizables.
+
+    Cada sentencia (SELECT por columnas y filtros, UPDATE por conjunto de columnas)
+    se construye una sola vez y se guarda; como el objeto es el mismo en cada
+    llamada, SQLAlchemy también reutiliza su versión compilada. Solo se pueden
+    actualizar las columnas de `updatable`.
+
+    No hace commit ni captura errores: eso queda en las funciones de app.crud,
+    que además conocen los mensajes y efectos propios de cada tabla.
+    """
+
+    def __init__(self, table: Table, updatable: Iterable[str]):
+        self.table = table
+        (self.pk,) = table.primary_key.columns
+        self.updatable: FrozenSet[str] = frozenset(updatable)
+        desconocidas = self.updatable - set(table.columns.keys())
+        if desconocidas:
+            raise ValueError(f"Columnas inexistentes en {table.name}: {sorted(desconocidas)}")
+
+        self._insert = insert(table)
+        self._delete = delete(table).where(self.pk == bindparam("pk"))
+        self._selects: Dict[Tuple[Optional[Tuple[str, ...]], Tuple[str, ...]], Any] = {}
+        self._updates: Dict[FrozenSet[str], Any] = {}
+
+    def select_statement(self, columns: Optional[Sequence[str]] = None, where: Sequence[str] = ()):
+        """
+        SELECT de `columns` (todas si es None) filtrado por igualdad en las columnas
+        de `where`; los valores se pasan como parámetros con el nombre de la columna.
+        """
+        key = (tuple(columns) if columns is not None else None, tuple(where))
+        stmt = self._selects.get(key)
+        if stmt is None:
+            cols = [self.table.c[name] for name in columns] if columns is not None else [self.table]
+            stmt = select(*cols)
+            if where:
+                stmt = stmt.where(and_(*(self.table.c[name] == bindparam(name) for name in where)))
+            self._selects[key] = stmt
+        return stmt
+
+    def update_statement(self, columns: Iterable[str]):
+        """
+        UPDATE ... SET de esas columnas WHERE pk = :pk, cacheado por conjunto de columnas.
+        Lanza ValueError si alguna columna no está en la lista de actualizables.
+        """
+        key = frozenset(columns)
+        stmt = self._updates.get(key)
+        if stmt is None:
+            no_permitidas = key - self.updatable
+            if no_permitidas:
+                raise ValueError(f"Columnas no actualizables en {self.table.name}: {sorted(no_permitidas)}")
+            stmt = (
+                update(self.table)
+                .where(self.pk == bindparam("pk"))
+                .values({name: bindparam(name) for name in sorted(key)})
+            )
+            self._updates[key] = stmt
+        return stmt
+
+    def get(self, db: Session, pk: Any, columns: Optional[Sequence[str]] = None) -> Optional[RowMapping]:
+        return db.execute(self.select_statement(columns, (self.pk.name,)), {self.pk.name: pk}).mappings().first()
+
+    def all(self, db: Session, columns: Optional[Sequence[str]] = None) -> Sequence[RowMapping]:
+        return db.execute(self.select_statement(columns)).mappings().all()
+
+    def find(self, db: Session, columns: Optional[Sequence[str]] = None, **criteria) -> Sequence[RowMapping]:
+        return db.execute(self.select_statement(columns, tuple(sorted(criteria))), criteria).mappings().all()
+
+    def insert(self, db: Session, values: Mapping[str, Any]) -> Any:
+        """
+        Inserta una fila y retorna su llave primaria.
+        """
+        return db.execute(self._insert, dict(values)).inserted_primary_key[0]
+
+    def insert_many(self, db: Session, rows: List[Mapping[str, Any]]) -> int:
+        """
+        Inserta varias filas con una sola llamada (executemany); el driver las agrupa
+        en INSERT de múltiples filas. Retorna la cantidad de filas insertadas.
+        """
+        if not rows:
+            return 0
+        return db.execute(self._insert, [dict(row) for row in rows]).rowcount
+
+    def update(self, db: Session, pk: Any, values: Mapping[str, Any]) -> int:
+        """
+        Actualiza las columnas de `values` en la fila `pk`. Retorna las filas afectadas.
+        """
+        if not values:
+            return 0
+        params = dict(values)
+        params["pk"] = pk
+        return db.execute(self.update_statement(values.keys()), params).rowcount
+
+    def delete(self, db: Session, pk: Any) -> int:
+        return db.execute(self._delete, {"pk": pk}).rowcount
@@ -1,65 +1,250 @@
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import text
-from typing import Optional
+from sqlalchemy import bindparam, func, text
+from functools import lru_cache
+from typing import Dict, FrozenSet, List, Optional, Tuple
+from app.crud.base import TableCrud
 from app.schemas.stock import StockCreate, StockUpdate  # Ajusta si usas también StockUpdate
+from core.config import settings
+from core.database import SessionLocal, with_deadlock_retry
+from core.events import EventHub
+from core.query_cache import query_cache
+from core.schema import stock as stock_table
+
+tabla = TableCrud(stock_table, updatable=("unidad_medida", "id_produccion", "cantidad_disponible"))
+
+# El listado (y el stream) no incluyen la versión; solo GET /stock/by-id la usa como ETag
+COLUMNAS_LISTADO = ("id_producto", "unidad_medida", "id_produccion", "cantidad_disponible")
+
+
+def _cargar_stock():
+    # Del servidor principal: los eventos se publican al confirmar ahí y la réplica
+    # puede ir atrasada respecto de ellos
+    db = SessionLocal()
+    try:
+        return get_all_stock(db)
+    finally:
+        db.close()
+
+
+# Huevos por unidad de medida del stock
+FACTORES_UNIDAD = {
+    'unidad': 1,
+    'docena': 12,
+    'medio_panal': 15,
+    'panal': 30,
+}
+
+
+def unidades_de(cantidad_huevos: int, unidad_medida: str) -> int:
+    # Solo cuentan las unidades completas (100 huevos = 8 docenas)
+    return cantidad_huevos // FACTORES_UNIDAD[unidad_medida]
+
+
+# Cambios de stock para /stock/stream; se publican después de cada commit
+stock_events = EventHub(
+    "stock",
+    key="id_producto",
+    load_fn=_cargar_stock,
+    resync_seconds=settings.SSE_RESYNC_SECONDS
+)
 
 
 def create_stock(db: Session, stock: StockCreate) -> Optional[bool]:
     try:
-        sentencia = text("""
-            INSERT INTO stock (
-                unidad_medida, id_produccion, cantidad_disponible
-            ) VALUES (
-                :unidad_medida, :id_produccion, :cantidad_disponible
-            )
-        """)
-        db.execute(sentencia, stock.model_dump())
-        db.commit()
+        def insertar(db: Session):
+            id_producto = tabla.insert(db, stock.model_dump())
+            db.commit()
+            return id_producto
+
+        id_producto = with_deadlock_retry(db, insertar)
+        query_cache.invalidate("stock")
+        stock_events.publish({"id_producto": id_producto, **stock.model_dump()})
         return True
     except SQLAlchemyError as e:
         db.rollback()
         raise Exception(f"Error de base de datos al crear stock: {e}")
 
+@query_cache.cached("stock")
 def get_stock_by_id(db: Session, id_producto: int):
     try:
-        query = text("""
-            SELECT id_producto, unidad_medida, id_produccion, cantidad_disponible
-            FROM stock
-            WHERE id_producto = :id_producto
-        """)
-        result = db.execute(query, {"id_producto": id_producto}).mappings().first()
-        return result
+        return tabla.get(db, id_producto)
     except SQLAlchemyError as e:
         raise Exception(f"Error de base de datos al obtener stock por ID: {e}")
 
 def get_all_stock(db: Session):
     try:
-        query = text("""
-            SELECT id_producto, unidad_medida, id_produccion, cantidad_disponible
-            FROM stock
-        """)
-        result = db.execute(query).mappings().all()
-        return result
+        return tabla.all(db, COLUMNAS_LISTADO)
     except SQLAlchemyError as e:
         raise Exception(f"Error de base de datos al obtener todos los stocks: {e}")
 
-def update_stock_by_id(db: Session, id_producto: int, stock: StockUpdate) -> Optional[bool]:
+@lru_cache(maxsize=64)
+def _update_versionado(columnas: FrozenSet[str], condicional: bool):
+    # LAST_INSERT_ID(expr) deja la nueva versión en lastrowid sin otra consulta
+    sentencia = tabla.update_statement(columnas).values(
+        version=func.last_insert_id(stock_table.c.version + 1)
+    )
+    if condicional:
+        sentencia = sentencia.where(stock_table.c.version == bindparam("version_esperada"))
+    return sentencia
+
+def update_stock_by_id(
+    db: Session,
+    id_producto: int,
+    stock: StockUpdate,
+    version: Optional[int] = None
+) -> Optional[int]:
+    """
+    Actualiza los campos enviados y aumenta la versión de la fila.
+
+    Con `version` la actualización solo ocurre si la fila sigue en esa versión
+    (control optimista para If-Match). Retorna la nueva versión, o None si no se
+    actualizó (no existe, o cambió de versión).
+    """
     try:
         stock_data = stock.model_dump(exclude_unset=True)
         if not stock_data:
-            return False
-        
-        set_clauses = ", ".join([f"{key} = :{key}" for key in stock_data.keys()])
-        sentencia = text(f"""
-            UPDATE stock
-            SET {set_clauses}
-            WHERE id_producto = :id_producto
-        """)
-        stock_data["id_producto"] = id_producto
-        result = db.execute(sentencia, stock_data)
-        db.commit()
-        return result.rowcount > 0
+            return None
+
+        sentencia = _update_versionado(frozenset(stock_data), version is not None)
+        params = dict(stock_data, pk=id_producto)
+        if version is not None:
+            params["version_esperada"] = version
+
+        def actualizar(db: Session):
+            result = db.execute(sentencia, params)
+            db.commit()
+            return result.lastrowid if result.rowcount > 0 else None
+
+        nueva_version = with_deadlock_retry(db, actualizar)
+        if nueva_version is not None:
+            query_cache.invalidate("stock")
+            stock_events.publish(dict(stock_data, id_producto=id_producto))
+        return nueva_version
     except SQLAlchemyError as e:
         db.rollback()
         raise Exception(f"Error de base de datos al actualizar stock {id_producto}: {e}")
+
+# La condición se evalúa sobre la fila bloqueada por el UPDATE, así dos ventas
+# simultáneas del mismo lote nunca dejan el stock por debajo de cero
+_AJUSTE_STOCK = text("""
+    UPDATE stock
+    SET cantidad_disponible = LAST_INSERT_ID(cantidad_disponible + :delta),
+        version = version + 1
+    WHERE id_producto = :id_producto
+      AND cantidad_disponible + :delta >= 0
+""")
+
+def increment_stock(db: Session, id_producto: int, delta: int) -> Optional[int]:
+    """
+    Suma `delta` (positivo o negativo) a cantidad_disponible en una sola sentencia,
+    sin leer antes la fila ni bloquearla de forma explícita.
+
+    Retorna la nueva cantidad, None si el producto no existe y lanza ValueError
+    si la cantidad quedaría negativa (la fila no se modifica).
+    """
+    try:
+        def ajustar(db: Session):
+            result = db.execute(_AJUSTE_STOCK, {"id_producto": id_producto, "delta": delta})
+            db.commit()
+            return result.lastrowid if result.rowcount > 0 else None
+
+        cantidad = with_deadlock_retry(db, ajustar)
+        if cantidad is None:
+            if tabla.get(db, id_producto, ("id_producto",)) is None:
+                return None
+            raise ValueError("Stock insuficiente")
+
+        query_cache.invalidate("stock")
+        stock_events.publish({"id_producto": id_producto, "cantidad_disponible": cantidad})
+        return cantidad
+    except SQLAlchemyError as e:
+        db.rollback()
+        raise Exception(f"Error de base de datos al ajustar stock {id_producto}: {e}")
+
+@lru_cache(maxsize=16)
+def _insert_stock_multiple(filas: int):
+    valores = ", ".join(
+        f"(:unidad_medida_{i}, :id_produccion_{i}, :cantidad_disponible_{i})" for i in range(filas)
+    )
+    return text(f"""
+        INSERT INTO stock (
+            unidad_medida, id_produccion, cantidad_disponible
+        ) VALUES {valores}
+    """)
+
+_PASO_AUTOINCREMENTO = text("SELECT @@auto_increment_increment")
+
+def insert_stock_derivado(
+    db: Session,
+    producciones: List[Tuple[int, int]],
+    unidad_medida: str,
+    chunk_size: int = 1000
+) -> List[Dict]:
+    """
+    Crea el stock de producciones nuevas: (id_produccion, cantidad de huevos) convertido a `unidad_medida`.
+
+    No hace commit: se llama dentro de la transacción que insertó las producciones.
+    Retorna los eventos para publicar en stock_events después del commit.
+    """
+    eventos = []
+    paso = db.execute(_PASO_AUTOINCREMENTO).scalar() if producciones else 1
+    for inicio in range(0, len(producciones), chunk_size):
+        lote = producciones[inicio:inicio + chunk_size]
+        filas = [
+            {
+                "unidad_medida": unidad_medida,
+                "id_produccion": id_produccion,
+                "cantidad_disponible": unidades_de(cantidad, unidad_medida),
+            }
+            for id_produccion, cantidad in lote
+        ]
+        params = {}
+        for i, fila in enumerate(filas):
+            for key, value in fila.items():
+                params[f"{key}_{i}"] = value
+        result = db.execute(_insert_stock_multiple(len(filas)), params)
+        # Un INSERT de varias filas con cantidad conocida recibe ids consecutivos (en pasos de
+        # auto_increment_increment) desde LAST_INSERT_ID(), que es el id de la primera fila
+        ids = range(result.lastrowid, result.lastrowid + result.rowcount * paso, paso)
+        eventos.extend({"id_producto": id_producto, **fila} for id_producto, fila in zip(ids, filas))
+    return eventos
+
+_AJUSTE_STOCK_DERIVADO = text("""
+    UPDATE stock
+    SET cantidad_disponible = GREATEST(cantidad_disponible + CASE unidad_medida
+            WHEN 'unidad' THEN :delta_unidad
+            WHEN 'docena' THEN :delta_docena
+            WHEN 'medio_panal' THEN :delta_medio_panal
+            WHEN 'panal' THEN :delta_panal
+        END, 0),
+        version = version + 1
+    WHERE id_produccion = :id_produccion
+""")
+
+def sync_stock_derivado(
+    db: Session,
+    id_produccion: int,
+    unidad_medida: str,
+    cantidad_anterior: int,
+    cantidad_nueva: int
+) -> List[Dict]:
+    """
+    Ajusta el stock de una producción cuya cantidad de huevos cambió.
+
+    Si ya tiene stock se le suma la diferencia en su propia unidad de medida (así se
+    conservan las ventas ya descontadas, sin bajar de cero); si no tiene, se crea en
+    `unidad_medida`. La fila de produccion_huevos debe estar bloqueada (FOR UPDATE)
+    por la transacción que llama, lo que evita crear dos stocks para la misma producción.
+
+    No hace commit. Retorna los eventos para publicar en stock_events después del commit.
+    """
+    params = {"id_produccion": id_produccion}
+    for unidad in FACTORES_UNIDAD:
+        params[f"delta_{unidad}"] = unidades_de(cantidad_nueva, unidad) - unidades_de(cantidad_anterior, unidad)
+    result = db.execute(_AJUSTE_STOCK_DERIVADO, params)
+    if result.rowcount == 0:
+        return insert_stock_derivado(db, [(id_produccion, cantidad_nueva)], unidad_medida)
+
+    rows = tabla.find(db, ("id_producto", "cantidad_disponible"), id_produccion=id_produccion)
+    return [dict(row) for row in rows]
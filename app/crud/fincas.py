@@ -1,69 +1,79 @@
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import text
-from typing import Optional
+from sqlalchemy import and_, or_, select, text
+from typing import Dict, List, Optional
 import logging
 
+from app.crud.base import TableCrud
 from app.schemas.fincas import FincaCreate, FincaUpdate
+from core import geo
+from core.clusters import ClusterIndex
+from core.config import settings
+from core.database import SessionLocal
+from core.query_cache import query_cache
+from core.schema import fincas
 
 logger = logging.getLogger(__name__)
 
+# geohash no está en FincaUpdate: solo se recalcula aquí cuando cambian las coordenadas
+tabla = TableCrud(fincas, updatable=("nombre", "longitud", "latitud", "estado", "geohash"))
+
+# Columnas de FincaOut (sin geohash) para las búsquedas espaciales
+_COLUMNAS_FINCA = [column for column in fincas.c if column.name != "geohash"]
+
+_COORDENADAS_FINCA = text("""
+    SELECT latitud, longitud
+    FROM fincas
+    WHERE id_finca = :id_finca
+    FOR UPDATE
+""")
+
+def _cargar_coordenadas(db: Session):
+    c = fincas.c
+    return db.execute(select(c.id_finca, c.latitud, c.longitud)).all()
+
+# Clusters del mapa de fincas por zoom; create/update los actualizan después del commit
+mapa_fincas = ClusterIndex(
+    "fincas",
+    load_fn=_cargar_coordenadas,
+    session_factory=SessionLocal,
+    max_zoom=settings.FINCAS_CLUSTER_MAX_ZOOM,
+    max_age=settings.FINCAS_CLUSTER_RESYNC_SECONDS
+)
+
 def create_finca(db: Session, finca: FincaCreate) -> Optional[bool]:
     try:
-        sentencia = text("""
-            INSERT INTO fincas (
-                nombre, longitud, latitud,
-                id_usuario, estado
-            ) VALUES (
-                :nombre, :longitud, :latitud,
-                :id_usuario, :estado
-            )
-        """)
-        db.execute(sentencia, finca.model_dump())
+        values = finca.model_dump()
+        values["geohash"] = geo.encode(finca.latitud, finca.longitud)
+        finca_id = tabla.insert(db, values)
         db.commit()
+        query_cache.invalidate("fincas")
+        mapa_fincas.upsert(finca_id, finca.latitud, finca.longitud)
         return True
     except SQLAlchemyError as e:
         db.rollback()
         logger.error(f"Error al crear finca: {e}")
         raise Exception("Error de base de datos al crear la finca")
 
+@query_cache.cached("fincas")
 def get_finca_by_id(db: Session, finca_id: int):
     try:
-        query = text("""
-            SELECT id_finca, nombre, longitud, latitud,
-            id_usuario, estado
-            FROM fincas
-            WHERE id_finca = :id_finca
-        """)
-        result = db.execute(query, {"id_finca": finca_id}).mappings().first()
-        return result
+        return tabla.get(db, finca_id)
     except SQLAlchemyError as e:
         logger.error(f"Error al obtener finca por ID: {e}")
         raise Exception("Error de base de datos al obtener la finca")
 
 def get_all_finca(db: Session):
     try:
-        query = text("""
-            SELECT id_finca, nombre, longitud, latitud,
-            id_usuario, estado
-            FROM fincas
-        """)
-        result = db.execute(query).mappings().all()
-        return result
+        return tabla.all(db)
     except SQLAlchemyError as e:
         logger.error(f"Error al obtener todas las fincas: {e}")
         raise Exception("Error de base de datos al obtener las fincas")
 
+@query_cache.cached("fincas")
 def get_fincas_by_usuario(db: Session, usuario_id: int):
     try:
-        query = text("""
-            SELECT id_finca, nombre, longitud, latitud,
-            id_usuario, estado
-            FROM fincas
-            WHERE id_usuario = :id_user
-        """)
-        result = db.execute(query, {"id_user": usuario_id}).mappings().all()
-        return result
+        return tabla.find(db, id_usuario=usuario_id)
     except SQLAlchemyError as e:
         logger.error(f"Error al obtener fincas por usuario: {e}")
         raise Exception("Error de base de datos al obtener las fincas")
@@ -74,19 +84,26 @@ def update_finca_by_id(db: Session, finca_id: int, finca: FincaUpdate) -> Option
         if not finca_data:
             return False
 
-        set_clauses = ", ".join([f"{key} = :{key}" for key in finca_data.keys()])
-        sentencia = text(f"""
-            UPDATE fincas 
-            SET {set_clauses}
-            WHERE id_finca = :id_finca
-        """)
-
-        finca_data["id_finca"] = finca_id
+        coordenadas = None
+        if "latitud" in finca_data or "longitud" in finca_data:
+            coordenadas = finca_data
+            if "latitud" not in finca_data or "longitud" not in finca_data:
+                # Solo llegó una coordenada: la otra se lee bloqueando la fila hasta el commit
+                actual = db.execute(_COORDENADAS_FINCA, {"id_finca": finca_id}).mappings().first()
+                if actual is None:
+                    db.rollback()
+                    return False
+                coordenadas = {**actual, **finca_data}
+            if coordenadas["latitud"] is not None and coordenadas["longitud"] is not None:
+                finca_data["geohash"] = geo.encode(coordenadas["latitud"], coordenadas["longitud"])
 
-        result = db.execute(sentencia, finca_data)
+        filas = tabla.update(db, finca_id, finca_data)
         db.commit()
+        query_cache.invalidate("fincas")
+        if filas > 0 and "geohash" in finca_data:
+            mapa_fincas.upsert(finca_id, coordenadas["latitud"], coordenadas["longitud"])
 
-        return result.rowcount > 0
+        return filas > 0
 
     except SQLAlchemyError as e:
         db.rollback()
@@ -94,17 +111,125 @@ def update_finca_by_id(db: Session, finca_id: int, finca: FincaUpdate) -> Option
         raise Exception("Error de base de datos al actualizar la finca")
 
 
+def _buscar_en_cajas(db: Session, cajas: List[geo.Caja]):
+    """
+    Fincas cuyas coordenadas están dentro de alguna de las cajas. Los rangos de
+    geohash que cubren las cajas limitan la lectura a esas partes del índice; la
+    comparación de latitud/longitud descarta lo que sobra de cada celda.
+    """
+    c = fincas.c
+    dentro = or_(*(
+        and_(c.latitud.between(min_lat, max_lat), c.longitud.between(min_lon, max_lon))
+        for min_lat, min_lon, max_lat, max_lon in cajas
+    ))
+    query = select(*_COLUMNAS_FINCA).where(dentro)
+
+    rangos = []
+    for prefijo in geo.prefijos(cajas):
+        inicio, fin = geo.rango(prefijo)
+        rangos.append(c.geohash >= inicio if fin is None else and_(c.geohash >= inicio, c.geohash < fin))
+    if rangos:
+        query = query.where(or_(*rangos))
+    return db.execute(query).mappings().all()
+
+def get_fincas_cercanas(
+    db: Session,
+    latitud: float,
+    longitud: float,
+    radio_km: float,
+    limit: Optional[int] = None
+) -> List[Dict]:
+    """
+    Fincas a `radio_km` o menos del punto, de la más cercana a la más lejana,
+    con su distancia (haversine) en `distancia_km`.
+    """
+    try:
+        rows = _buscar_en_cajas(db, geo.cajas_radio(latitud, longitud, radio_km))
+        cercanas = []
+        for row in rows:
+            distancia = geo.haversine_km(latitud, longitud, row["latitud"], row["longitud"])
+            if distancia <= radio_km:
+                cercanas.append({**row, "distancia_km": round(distancia, 3)})
+        cercanas.sort(key=lambda finca: finca["distancia_km"])
+        return cercanas[:limit] if limit else cercanas
+    except SQLAlchemyError as e:
+        logger.error(f"Error al buscar fincas cercanas: {e}")
+        raise Exception("Error de base de datos al buscar las fincas cercanas")
+
+def get_fincas_en_area(db: Session, min_lat: float, min_lon: float, max_lat: float, max_lon: float):
+    """
+    Fincas dentro del rectángulo; si min_lon > max_lon el área cruza el antimeridiano.
+    """
+    try:
+        return _buscar_en_cajas(db, geo.cajas_area(min_lat, min_lon, max_lat, max_lon))
+    except SQLAlchemyError as e:
+        logger.error(f"Error al buscar fincas en el área: {e}")
+        raise Exception("Error de base de datos al buscar las fincas del área")
+
+def get_fincas_clusters(
+    db: Session,
+    zoom: int,
+    min_lat: float,
+    min_lon: float,
+    max_lat: float,
+    max_lon: float
+) -> List[Dict]:
+    """
+    Clusters del mapa (centroide, cantidad y bbox) en el zoom y viewport pedidos.
+    La primera llamada del worker (y cada FINCAS_CLUSTER_RESYNC_SECONDS) lee las coordenadas.
+    """
+    try:
+        clusters = mapa_fincas.clusters(db, zoom, min_lat, min_lon, max_lat, max_lon)
+        for cluster in clusters:
+            cluster["id_finca"] = cluster.pop("id_punto")
+        return clusters
+    except SQLAlchemyError as e:
+        logger.error(f"Error al cargar las coordenadas de las fincas: {e}")
+        raise Exception("Error de base de datos al obtener los clusters de fincas")
+
+def backfill(db: Session, chunk_size: int = 1000) -> int:
+    """
+    Calcula el geohash de las fincas que no lo tienen (creadas antes de la columna).
+    Retorna cuántas se actualizaron.
+    """
+    try:
+        c = fincas.c
+        rows = db.execute(
+            select(c.id_finca, c.latitud, c.longitud).where(c.geohash.is_(None))
+        ).all()
+        valores = [
+            {"pk": row.id_finca, "geohash": geo.encode(row.latitud, row.longitud)}
+            for row in rows
+        ]
+        sentencia = tabla.update_statement(("geohash",))
+        for inicio in range(0, len(valores), chunk_size):
+            db.execute(sentencia, valores[inicio:inicio + chunk_size])
+        db.commit()
+        query_cache.invalidate("fincas")
+        logger.info(f"Geohash calculado para {len(valores)} fincas")
+        return len(valores)
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Error al calcular el geohash de las fincas: {e}")
+        raise Exception("Error de base de datos al calcular el geohash de las fincas")
+
 
 # def delete_finca(db: Session, finca_id: int) -> Optional[bool]:
 #     try:
-#         query = text("""
-#             DELETE FROM fincas 
-#             WHERE id_finca = :id_finca
-#         """)
-#         result = db.execute(query, {"id_finca": finca_id})
+#         filas = tabla.delete(db, finca_id)
 #         db.commit()
-#         return result.rowcount > 0
+#         return filas > 0
 #     except SQLAlchemyError as e:
 #         db.rollback()
 #         logger.error(f"Error al eliminar finca {finca_id}: {e}")
-#         raise Exception("Error de base de datos al eliminar la finca")
\ No newline at end of file
+#         raise Exception("Error de base de datos al eliminar la finca")
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.crud.fincas (después de `python -m core.schema`)
+    logging.basicConfig(level=logging.INFO)
+    session = SessionLocal()
+    try:
+        backfill(session)
+    finally:
+        session.close()
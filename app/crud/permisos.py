@@ -1,37 +1,139 @@
 from sqlalchemy.exc import SQLAlchemyError
+from fastapi.concurrency import run_in_threadpool
 from fastapi.exceptions import HTTPException
 from sqlalchemy import text
 from sqlalchemy.orm import Session
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
+from typing import Dict, Optional, Tuple
 import logging
+import threading
+import time
+
+from core.config import settings
+from core.database import SessionLocal, lee_de_replica
 
 logger = logging.getLogger(__name__)
 
-def verify_permissions(db: Session, id_rol: int, id_modulo: int, accion: str):
-    try:
+# Cada acción ocupa un bit dentro de la máscara de permisos de (rol, módulo)
+ACCIONES = {
+    'insertar': 1,
+    'actualizar': 2,
+    'seleccionar': 4,
+    'borrar': 8,
+}
+
+
+class PermissionMatrix:
+    """
+    Copia en memoria de la tabla permisos, una por proceso (worker).
+
+    Guarda una máscara de bits por cada par (id_rol, id_modulo), de modo que
+    verificar un permiso es una búsqueda en un diccionario sin ir a la base de
+    datos. La matriz se recarga completa cuando vence su TTL o cuando se llama
+    a `invalidate()` / `reload()`.
+    """
+
+    def __init__(self, ttl: int):
+        self.ttl = ttl
+        self._masks: Dict[Tuple[int, int], int] = {}
+        self._loaded_at: Optional[float] = None
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _expired(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.ttl
+
+    def reload(self, db: Session) -> None:
         query = text("""
-                     SELECT insertar, actualizar, seleccionar, borrar
+                     SELECT id_rol, id_modulo, insertar, actualizar, seleccionar, borrar
                      FROM permisos
-                     WHERE id_rol = :rol AND id_modulo = :modulo
                      """)
-        result = db.execute(query, {"rol": id_rol, "modulo": id_modulo}).mappings().first()
+        rows = db.execute(query).mappings().all()
+
+        masks = {}
+        for row in rows:
+            mask = 0
+            for accion, bit in ACCIONES.items():
+                if row[accion] == 1:
+                    mask |= bit
+            masks[(row.id_rol, row.id_modulo)] = mask
+
+        # Se reemplaza el diccionario completo para que los lectores nunca vean una carga a medias
+        self._masks = masks
+        self._loaded_at = time.monotonic()
+        logger.info(f"Matriz de permisos cargada: {len(masks)} combinaciones rol/módulo")
+
+    def invalidate(self) -> None:
+        self._loaded_at = None
+
+    def __len__(self) -> int:
+        return len(self._masks)
+
+    def _reload_if_expired(self, db: Session) -> None:
+        with self._lock:
+            # Otro hilo pudo haber recargado mientras se esperaba el lock
+            if self._expired():
+                self.misses += 1
+                self.reload(db)
+
+    def _reload_in_thread(self) -> None:
+        # Sesión propia contra la base principal
+        db = SessionLocal()
+        try:
+            self._reload_if_expired(db)
+        finally:
+            db.close()
 
-        if result is None:
+    def mask(self, db: Session, id_rol: int, id_modulo: int) -> Optional[int]:
+        if self._expired():
+            if in_greenlet():
+                # Dentro de run_sync (modo DB_ASYNC) esto corre en el hilo del event loop:
+                # esperar el lock ahí bloquearía el loop mientras otra petición, que lo
+                # tiene, espera su consulta en ese mismo loop. La recarga va al threadpool.
+                await_only(run_in_threadpool(self._reload_in_thread))
+            elif lee_de_replica(db):
+                # La réplica puede ir atrasada y la matriz quedaría así durante todo el TTL
+                self._reload_in_thread()
+            else:
+                self._reload_if_expired(db)
+        else:
+            self.hits += 1
+        return self._masks.get((id_rol, id_modulo))
+
+
+permission_matrix = PermissionMatrix(ttl=settings.PERMISOS_CACHE_TTL)
+
+
+def reload_permissions(db: Session) -> None:
+    """
+    Recarga la matriz de permisos de inmediato. Usar después de modificar la tabla permisos.
+    """
+    try:
+        permission_matrix.reload(db)
+    except SQLAlchemyError as e:
+        logger.error(f"Error al recargar permisos: {e}")
+        raise Exception("Error de base de datos al recargar permisos")
+
+
+def invalidate_permissions() -> None:
+    """
+    Marca la matriz como vencida; la siguiente verificación la vuelve a cargar.
+    """
+    permission_matrix.invalidate()
+
+
+def verify_permissions(db: Session, id_rol: int, id_modulo: int, accion: str):
+    try:
+        mask = permission_matrix.mask(db, id_rol, id_modulo)
+
+        if mask is None:
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
-        
-        permiso = 0
-        
-        if result.insertar == 1 and accion == 'insertar':
-            permiso = 1
-        if result.actualizar == 1 and accion == 'actualizar':
-            permiso = 1
-        if result.seleccionar == 1 and accion == 'seleccionar':
-            permiso = 1
-        if result.borrar == 1 and accion == 'borrar':
-            permiso = 1 
-        
-        
+
+        permiso = 1 if mask & ACCIONES.get(accion, 0) else 0
+
         return permiso
     except SQLAlchemyError as e:
         logger.error(f"Error al obtener permisos: {e}")
         raise Exception("Error de base de datos al obtener permisos")
-    
\ No newline at end of file
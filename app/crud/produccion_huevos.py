@@ -1,45 +1,270 @@
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import text
-from typing import Optional
+from sqlalchemy import text, bindparam
+from typing import Dict, Iterator, List, Optional, Tuple
+from datetime import date
+from functools import lru_cache
+import base64
+import binascii
+import json
 import logging
 
 from app.schemas.produccion_huevos import ProduccionHuevosCreate, ProduccionHuevosUpdate
+from app.crud import crud_stock, resumen_produccion
+from app.crud.base import TableCrud
+from core.query_cache import query_cache
+from core.schema import produccion_huevos as produccion_huevos_table
 
 logger = logging.getLogger(__name__)
 
-def create_produccion_huevos(db: Session, produccion: ProduccionHuevosCreate) -> Optional[bool]:
+tabla = TableCrud(produccion_huevos_table, updatable=("id_galpon", "cantidad", "fecha", "id_tipo_huevo"))
+
+_PRODUCCION_POR_ID = text("""
+    SELECT 
+        ph.id_produccion,
+        g.nombre AS nombre_galpon,
+        ph.cantidad,
+        ph.fecha,
+        th.tamaño
+    FROM produccion_huevos ph
+    JOIN galpones g ON ph.id_galpon = g.id_galpon
+    JOIN tipo_huevos th ON ph.id_tipo_huevo = th.id_tipo_huevo
+    WHERE ph.id_produccion = :id_produccion;
+""")
+
+# Fila actual bloqueada hasta el commit, para descontarla de los acumulados
+_LOCK_PRODUCCION = text("""
+    SELECT id_galpon, cantidad, fecha, id_tipo_huevo
+    FROM produccion_huevos
+    WHERE id_produccion = :id_produccion
+    FOR UPDATE
+""")
+
+def _tablas_modificadas(stock_unidad: Optional[str]) -> Tuple[str, ...]:
+    # Etiquetas de query_cache a invalidar: el stock solo cambia si se deriva de la producción
+    return ("produccion_huevos", "stock") if stock_unidad else ("produccion_huevos",)
+
+def create_produccion_huevos(
+    db: Session,
+    produccion: ProduccionHuevosCreate,
+    stock_unidad: Optional[str] = None
+) -> Optional[bool]:
+    """
+    Crea una producción. Con `stock_unidad` crea también su stock (la cantidad
+    convertida a esa unidad de medida) en la misma transacción.
+    """
     try:
-        sentencia = text("""
-            INSERT INTO produccion_huevos (
-                id_galpon, cantidad, fecha, id_tipo_huevo
-            ) VALUES (
-                :id_galpon, :cantidad, :fecha, :id_tipo_huevo
-            )
-        """)
-        db.execute(sentencia, produccion.model_dump())
+        id_produccion = tabla.insert(db, produccion.model_dump())
+        resumen_produccion.apply_deltas(db, [
+            (produccion.id_galpon, produccion.id_tipo_huevo, produccion.fecha, produccion.cantidad)
+        ])
+        eventos = []
+        if stock_unidad:
+            eventos = crud_stock.insert_stock_derivado(db, [(id_produccion, produccion.cantidad)], stock_unidad)
         db.commit()
+        query_cache.invalidate(*_tablas_modificadas(stock_unidad))
+        for evento in eventos:
+            crud_stock.stock_events.publish(evento)
         return True
     except SQLAlchemyError as e:
         db.rollback()
         logger.error(f"Error al crear produccion_huevos: {e}")
         raise Exception("Error de base de datos al crear la producción de huevos")
 
+@lru_cache(maxsize=16)
+def _insert_multiple(filas: int):
+    # Un solo INSERT con `filas` tuplas de VALUES; se cachea por tamaño de lote
+    valores = ", ".join(
+        f"(:id_galpon_{i}, :cantidad_{i}, :fecha_{i}, :id_tipo_huevo_{i})" for i in range(filas)
+    )
+    return text(f"""
+        INSERT INTO produccion_huevos (
+            id_galpon, cantidad, fecha, id_tipo_huevo
+        ) VALUES {valores}
+    """)
+
+@lru_cache(maxsize=16)
+def _sumar_contador(filas: int):
+    # La suma se hace en el servidor sobre la fila única del contador (ux_produccion_contador):
+    # es correcta aunque otro worker escriba la misma clave y nunca toca registros manuales
+    valores = ", ".join(
+        f"(:id_galpon_{i}, :cantidad_{i}, :fecha_{i}, :id_tipo_huevo_{i}, 'contador')" for i in range(filas)
+    )
+    return text(f"""
+        INSERT INTO produccion_huevos (
+            id_galpon, cantidad, fecha, id_tipo_huevo, origen
+        ) VALUES {valores}
+        ON DUPLICATE KEY UPDATE cantidad = cantidad + VALUES(cantidad)
+    """)
+
+@lru_cache(maxsize=8)
+def _consulta_ids(tabla: str, columna: str):
+    return text(f"SELECT {columna} FROM {tabla} WHERE {columna} IN :ids").bindparams(
+        bindparam("ids", expanding=True)
+    )
+
+def _ids_existentes(db: Session, tabla: str, columna: str, ids: set) -> set:
+    if not ids:
+        return set()
+    return set(db.execute(_consulta_ids(tabla, columna), {"ids": list(ids)}).scalars().all())
+
+_PASO_AUTOINCREMENTO = text("SELECT @@auto_increment_increment")
+
+_PRODUCCIONES_POR_IDS = text("""
+    SELECT id_produccion, id_galpon, cantidad, fecha, id_tipo_huevo
+    FROM produccion_huevos
+    WHERE id_produccion IN :ids
+""").bindparams(bindparam("ids", expanding=True))
+
+def _ids_insertados(
+    db: Session,
+    primer_id: int,
+    paso: int,
+    lote: List[Tuple[int, ProduccionHuevosCreate]]
+) -> Optional[List[int]]:
+    """
+    Ids de las filas de un INSERT de múltiples filas, en el orden del lote.
+
+    Para un INSERT con cantidad de filas conocida MySQL asigna ids consecutivos, en
+    pasos de auto_increment_increment, a partir de LAST_INSERT_ID(). Se comprueba
+    leyendo esas filas por llave primaria y comparándolas con el lote; retorna None
+    si no coinciden.
+    """
+    ids = [primer_id + i * paso for i in range(len(lote))]
+    filas = {
+        fila["id_produccion"]: (fila["id_galpon"], fila["cantidad"], fila["fecha"], fila["id_tipo_huevo"])
+        for fila in db.execute(_PRODUCCIONES_POR_IDS, {"ids": ids}).mappings()
+    }
+    for id_produccion, (_, produccion) in zip(ids, lote):
+        esperada = (produccion.id_galpon, produccion.cantidad, produccion.fecha, produccion.id_tipo_huevo)
+        if filas.get(id_produccion) != esperada:
+            return None
+    return ids
+
+def create_produccion_huevos_bulk(
+    db: Session,
+    producciones: List[ProduccionHuevosCreate],
+    chunk_size: int = 1000,
+    stock_unidad: Optional[str] = None
+) -> Tuple[List[Optional[int]], List[Tuple[int, str]]]:
+    """
+    Inserta varias producciones en una sola transacción.
+
+    Primero verifica en dos consultas que existan los galpones y tipos de huevo
+    referenciados; las filas con referencias inválidas se reportan y no se insertan.
+    El resto se inserta con INSERT de múltiples filas (una sentencia por cada
+    `chunk_size` filas) y los acumulados se actualizan en el mismo commit.
+
+    Con `stock_unidad` también se crea el stock de cada producción insertada,
+    con INSERT de múltiples filas dentro de la misma transacción.
+
+    Retorna (ids, errores): ids tiene el id creado para cada fila de entrada (None
+    si no se insertó) y errores la lista de (índice, detalle).
+    """
+    try:
+        galpones = _ids_existentes(db, "galpones", "id_galpon", {p.id_galpon for p in producciones})
+        tipos = _ids_existentes(db, "tipo_huevos", "id_tipo_huevo", {p.id_tipo_huevo for p in producciones})
+
+        ids: List[Optional[int]] = [None] * len(producciones)
+        errores: List[Tuple[int, str]] = []
+        validas: List[Tuple[int, ProduccionHuevosCreate]] = []
+        for indice, produccion in enumerate(producciones):
+            if produccion.id_galpon not in galpones:
+                errores.append((indice, f"El galpón {produccion.id_galpon} no existe"))
+            elif produccion.id_tipo_huevo not in tipos:
+                errores.append((indice, f"El tipo de huevo {produccion.id_tipo_huevo} no existe"))
+            else:
+                validas.append((indice, produccion))
+
+        paso = db.execute(_PASO_AUTOINCREMENTO).scalar() if validas else 1
+        for inicio in range(0, len(validas), chunk_size):
+            lote = validas[inicio:inicio + chunk_size]
+            params = {}
+            for i, (_, produccion) in enumerate(lote):
+                for key, value in produccion.model_dump().items():
+                    params[f"{key}_{i}"] = value
+
+            result = db.execute(_insert_multiple(len(lote)), params)
+            # lastrowid corresponde a la primera fila del lote
+            ids_lote = _ids_insertados(db, result.lastrowid, paso, lote)
+            if ids_lote is None:
+                db.rollback()
+                logger.error("Los ids asignados al lote de produccion_huevos no son los esperados; se revirtió la carga")
+                raise Exception("No se pudieron determinar los ids de las producciones de huevos creadas")
+            for (indice, _), id_produccion in zip(lote, ids_lote):
+                ids[indice] = id_produccion
+
+        resumen_produccion.apply_deltas(db, [
+            (p.id_galpon, p.id_tipo_huevo, p.fecha, p.cantidad) for _, p in validas
+        ])
+        eventos = []
+        if stock_unidad:
+            eventos = crud_stock.insert_stock_derivado(
+                db, [(ids[indice], p.cantidad) for indice, p in validas], stock_unidad, chunk_size
+            )
+        db.commit()
+        query_cache.invalidate(*_tablas_modificadas(stock_unidad))
+        for evento in eventos:
+            crud_stock.stock_events.publish(evento)
+        return ids, errores
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Error al crear producciones de huevos en lote: {e}")
+        raise Exception("Error de base de datos al crear las producciones de huevos")
+
+def upsert_produccion_incrementos(db: Session, incrementos: Dict[Tuple[int, date, int], int]) -> int:
+    """
+    Suma incrementos de producción acumulados por (id_galpon, fecha, id_tipo_huevo).
+
+    Los incrementos se suman en una fila propia de cada clave (origen = 'contador'),
+    creada en el primer incremento; los registros ingresados a mano no se modifican.
+    Todo ocurre en una transacción junto con los acumulados de produccion_huevos_resumen.
+    Los incrementos con galpón o tipo de huevo inexistente se descartan y se registran.
+
+    Retorna la cantidad de claves escritas.
+    """
+    try:
+        galpones = _ids_existentes(db, "galpones", "id_galpon", {k[0] for k in incrementos})
+        tipos = _ids_existentes(db, "tipo_huevos", "id_tipo_huevo", {k[2] for k in incrementos})
+        validos = {
+            key: cantidad for key, cantidad in incrementos.items()
+            if key[0] in galpones and key[2] in tipos and cantidad
+        }
+        descartados = len(incrementos) - len(validos)
+        if descartados:
+            logger.warning(f"Se descartaron {descartados} incrementos con galpón o tipo de huevo inexistente")
+        if not validos:
+            return 0
+
+        # Claves ordenadas: dos lotes concurrentes bloquean las filas en el mismo orden
+        filas = [
+            {"id_galpon": key[0], "fecha": key[1], "id_tipo_huevo": key[2], "cantidad": validos[key]}
+            for key in sorted(validos)
+        ]
+        for inicio in range(0, len(filas), 1000):
+            lote = filas[inicio:inicio + 1000]
+            params = {}
+            for i, fila in enumerate(lote):
+                for key, value in fila.items():
+                    params[f"{key}_{i}"] = value
+            db.execute(_sumar_contador(len(lote)), params)
+
+        resumen_produccion.apply_deltas(db, [
+            (id_galpon, id_tipo_huevo, fecha, cantidad)
+            for (id_galpon, fecha, id_tipo_huevo), cantidad in validos.items()
+        ])
+        db.commit()
+        query_cache.invalidate("produccion_huevos")
+        return len(validos)
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Error al sumar incrementos de produccion_huevos: {e}")
+        raise Exception("Error de base de datos al sumar los incrementos de producción")
+
+@query_cache.cached("produccion_huevos", "galpones", "tipo_huevos")
 def get_produccion_huevos_by_id(db: Session, produccion_id: int):
     try:
-        query = text("""
-            SELECT 
-                ph.id_produccion,
-                g.nombre AS nombre_galpon,
-                ph.cantidad,
-                ph.fecha,
-                th.tamaño
-            FROM produccion_huevos ph
-            JOIN galpones g ON ph.id_galpon = g.id_galpon
-            JOIN tipo_huevos th ON ph.id_tipo_huevo = th.id_tipo_huevo
-            WHERE ph.id_produccion = :id_produccion;
-        """)
-        result = db.execute(query, {"id_produccion": produccion_id}).mappings().first()
+        result = db.execute(_PRODUCCION_POR_ID, {"id_produccion": produccion_id}).mappings().first()
         return result
     except SQLAlchemyError as e:
         logger.error(f"Error al obtener produccion_huevos por ID: {e}")
@@ -90,26 +315,180 @@ def get_all_produccion_huevos(
         logger.error(f"Error al obtener todas las producciones de huevos: {e}")
         raise Exception("Error de base de datos al obtener las producciones de huevos")
 
-    
-def update_produccion_huevos_by_id(db: Session, produccion_id: int, produccion: ProduccionHuevosUpdate) -> Optional[bool]:
+
+def encode_cursor(fecha: date, id_produccion: int) -> str:
+    """
+    Cursor opaco con la posición (fecha, id_produccion) de la última fila entregada.
+    """
+    raw = json.dumps([fecha.isoformat(), id_produccion]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+def decode_cursor(cursor: str) -> Tuple[date, int]:
+    try:
+        padding = "=" * (-len(cursor) % 4)
+        fecha, id_produccion = json.loads(base64.urlsafe_b64decode(cursor + padding))
+        return date.fromisoformat(fecha), int(id_produccion)
+    except (binascii.Error, ValueError, TypeError) as e:
+        raise ValueError("Cursor de paginación inválido") from e
+
+def get_produccion_huevos_keyset(
+    db: Session,
+    limit: int = 10,
+    cursor: Optional[str] = None,
+    fecha_inicio: str = None,
+    fecha_fin: str = None
+):
+    """
+    Paginación por cursor ordenada por (fecha, id_produccion).
+
+    A diferencia de OFFSET, cada página arranca justo después de la última fila
+    de la anterior usando el índice, así que el costo no crece con la profundidad
+    y no se saltan ni repiten filas con la misma fecha.
+    Retorna (filas, next_cursor); next_cursor es None en la última página.
+    """
+    try:
+        base_query = """
+            SELECT 
+                produccion_huevos.id_produccion,
+                galpones.nombre AS nombre_galpon,
+                produccion_huevos.cantidad,
+                produccion_huevos.fecha,
+                tipo_huevos.tamaño
+            FROM produccion_huevos
+            LEFT JOIN tipo_huevos 
+                ON produccion_huevos.id_tipo_huevo = tipo_huevos.id_tipo_huevo
+            LEFT JOIN galpones 
+                ON produccion_huevos.id_galpon = galpones.id_galpon
+        """
+
+        # Se pide una fila extra para saber si existe una página siguiente
+        params = {"limit": limit + 1}
+        condiciones = []
+
+        if fecha_inicio and fecha_fin:
+            condiciones.append("produccion_huevos.fecha BETWEEN :fecha_inicio AND :fecha_fin")
+            params["fecha_inicio"] = fecha_inicio
+            params["fecha_fin"] = fecha_fin
+
+        if cursor:
+            fecha, id_produccion = decode_cursor(cursor)
+            condiciones.append("""(produccion_huevos.fecha > :cursor_fecha
+                OR (produccion_huevos.fecha = :cursor_fecha AND produccion_huevos.id_produccion > :cursor_id))""")
+            params["cursor_fecha"] = fecha
+            params["cursor_id"] = id_produccion
+
+        if condiciones:
+            base_query += " WHERE " + " AND ".join(condiciones)
+
+        base_query += """
+            ORDER BY produccion_huevos.fecha ASC, produccion_huevos.id_produccion ASC
+            LIMIT :limit
+        """
+
+        rows = db.execute(text(base_query), params).mappings().all()
+
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            ultima = rows[-1]
+            next_cursor = encode_cursor(ultima.fecha, ultima.id_produccion)
+
+        return rows, next_cursor
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error al obtener producciones de huevos por cursor: {e}")
+        raise Exception("Error de base de datos al obtener las producciones de huevos")
+
+def iter_produccion_huevos(
+    db: Session,
+    fecha_inicio: str = None,
+    fecha_fin: str = None,
+    batch_size: int = 1000
+) -> Iterator[List]:
+    """
+    Recorre todas las producciones (con los mismos JOINs del listado) usando un
+    cursor del lado del servidor y entrega las filas en lotes de `batch_size`.
+    La memoria usada no depende del total de filas exportadas.
+    """
+    try:
+        base_query = """
+            SELECT 
+                galpones.nombre AS nombre_galpon,
+                produccion_huevos.cantidad,
+                produccion_huevos.fecha,
+                tipo_huevos.tamaño
+            FROM produccion_huevos
+            LEFT JOIN tipo_huevos 
+                ON produccion_huevos.id_tipo_huevo = tipo_huevos.id_tipo_huevo
+            LEFT JOIN galpones 
+                ON produccion_huevos.id_galpon = galpones.id_galpon
+        """
+        params = {}
+
+        if fecha_inicio and fecha_fin:
+            base_query += " WHERE produccion_huevos.fecha BETWEEN :fecha_inicio AND :fecha_fin"
+            params["fecha_inicio"] = fecha_inicio
+            params["fecha_fin"] = fecha_fin
+
+        base_query += " ORDER BY produccion_huevos.fecha ASC, produccion_huevos.id_produccion ASC"
+
+        # yield_per activa stream_results (SSCursor en PyMySQL): las filas se leen del socket por lotes
+        result = db.execute(
+            text(base_query),
+            params,
+            execution_options={"yield_per": batch_size}
+        )
+        for partition in result.mappings().partitions(batch_size):
+            yield partition
+
+    except SQLAlchemyError as e:
+        logger.error(f"Error al exportar producciones de huevos: {e}")
+        raise Exception("Error de base de datos al exportar las producciones de huevos")
+
+def _lock_produccion(db: Session, produccion_id: int):
+    return db.execute(_LOCK_PRODUCCION, {"id_produccion": produccion_id}).mappings().first()
+
+def update_produccion_huevos_by_id(
+    db: Session,
+    produccion_id: int,
+    produccion: ProduccionHuevosUpdate,
+    stock_unidad: Optional[str] = None
+) -> Optional[bool]:
+    """
+    Actualiza una producción. Con `stock_unidad` ajusta también su stock en la misma
+    transacción (o lo crea en esa unidad si todavía no existe).
+    """
     try:
-        produccion_data = produccion.model_dump(exclude_unset=True)
+        # Un campo enviado como null no cambia el valor actual (las columnas son NOT NULL)
+        produccion_data = {
+            key: value for key, value in produccion.model_dump(exclude_unset=True).items()
+            if value is not None
+        }
         if not produccion_data:
             return False
 
-        set_clauses = ", ".join([f"{key} = :{key}" for key in produccion_data.keys()])
-        sentencia = text(f"""
-            UPDATE produccion_huevos
-            SET {set_clauses}
-            WHERE id_produccion = :id_produccion
-        """)
-
-        produccion_data["id_produccion"] = produccion_id
+        anterior = _lock_produccion(db, produccion_id)
+        if anterior is None:
+            db.rollback()
+            return False
 
-        result = db.execute(sentencia, produccion_data)
+        nueva = {**anterior, **produccion_data}
+        filas = tabla.update(db, produccion_id, produccion_data)
+        resumen_produccion.apply_deltas(db, [
+            (anterior.id_galpon, anterior.id_tipo_huevo, anterior.fecha, -anterior.cantidad),
+            (nueva["id_galpon"], nueva["id_tipo_huevo"], nueva["fecha"], nueva["cantidad"]),
+        ])
+        eventos = []
+        if stock_unidad:
+            eventos = crud_stock.sync_stock_derivado(
+                db, produccion_id, stock_unidad, anterior.cantidad, nueva["cantidad"]
+            )
         db.commit()
+        query_cache.invalidate(*_tablas_modificadas(stock_unidad))
+        for evento in eventos:
+            crud_stock.stock_events.publish(evento)
 
-        return result.rowcount > 0
+        return filas > 0
 
     except SQLAlchemyError as e:
         db.rollback()
@@ -121,16 +500,18 @@ def delete_produccion_huevos_by_id(db: Session, produccion_id: int) -> Optional[
     Elimina una producción de huevos por ID
     """
     try:
-        sentencia = text("""
-            DELETE FROM produccion_huevos 
-            WHERE id_produccion = :id_produccion
-        """)
-        
-        result = db.execute(sentencia, {"id_produccion": produccion_id})
+        anterior = _lock_produccion(db, produccion_id)
+
+        filas = tabla.delete(db, produccion_id)
+        if anterior is not None:
+            resumen_produccion.apply_deltas(db, [
+                (anterior.id_galpon, anterior.id_tipo_huevo, anterior.fecha, -anterior.cantidad)
+            ])
         db.commit()
+        query_cache.invalidate("produccion_huevos")
         
         # Verificar si se eliminó algún registro
-        if result.rowcount > 0:
+        if filas > 0:
             logger.info(f"Producción de huevos {produccion_id} eliminada correctamente")
             return True
         else:
@@ -0,0 +1,170 @@
+from sqlalchemy.orm import Session
+from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import text
+from typing import Dict, Iterable, Tuple
+from datetime import date, timedelta
+import logging
+
+from core.schema import produccion_huevos_resumen
+
+logger = logging.getLogger(__name__)
+
+# La tabla produccion_huevos_resumen (ver core/schema.py) guarda el total de un galpón
+# y tipo de huevo dentro de un periodo (día, semana que inicia el lunes o mes).
+# Se mantiene en la misma transacción que las escrituras sobre produccion_huevos.
+
+PERIODOS = ('dia', 'semana', 'mes')
+
+# Columna de agrupación y nombre visible para cada tipo de resumen
+AGRUPACIONES = {
+    'galpon': {
+        "id": "r.id_galpon",
+        "nombre": "g.nombre",
+        "join": "LEFT JOIN galpones g ON r.id_galpon = g.id_galpon",
+    },
+    'finca': {
+        "id": "g.id_finca",
+        "nombre": "f.nombre",
+        "join": """JOIN galpones g ON r.id_galpon = g.id_galpon
+                   LEFT JOIN fincas f ON g.id_finca = f.id_finca""",
+    },
+    'tipo': {
+        "id": "r.id_tipo_huevo",
+        "nombre": "th.tamaño",
+        "join": "LEFT JOIN tipo_huevos th ON r.id_tipo_huevo = th.id_tipo_huevo",
+    },
+}
+
+
+def inicio_periodo(periodo: str, fecha: date) -> date:
+    if periodo == 'semana':
+        return fecha - timedelta(days=fecha.weekday())
+    if periodo == 'mes':
+        return fecha.replace(day=1)
+    return fecha
+
+
+def apply_deltas(db: Session, deltas: Iterable[Tuple[int, int, date, int]]) -> None:
+    """
+    Suma a los acumulados una serie de cambios (id_galpon, id_tipo_huevo, fecha, cantidad).
+    La cantidad puede ser negativa (actualizaciones y eliminaciones).
+
+    No hace commit: debe llamarse dentro de la transacción de la escritura original.
+    """
+    acumulado: Dict[Tuple[str, date, int, int], int] = {}
+    for id_galpon, id_tipo_huevo, fecha, cantidad in deltas:
+        if not cantidad:
+            continue
+        for periodo in PERIODOS:
+            key = (periodo, inicio_periodo(periodo, fecha), id_galpon, id_tipo_huevo)
+            acumulado[key] = acumulado.get(key, 0) + cantidad
+
+    params = [
+        {
+            "periodo": periodo,
+            "inicio": inicio,
+            "id_galpon": id_galpon,
+            "id_tipo_huevo": id_tipo_huevo,
+            "cantidad": cantidad,
+        }
+        for (periodo, inicio, id_galpon, id_tipo_huevo), cantidad in acumulado.items()
+        if cantidad
+    ]
+    if not params:
+        return
+
+    sentencia = text("""
+        INSERT INTO produccion_huevos_resumen (
+            periodo, inicio, id_galpon, id_tipo_huevo, cantidad
+        ) VALUES (
+            :periodo, :inicio, :id_galpon, :id_tipo_huevo, :cantidad
+        )
+        ON DUPLICATE KEY UPDATE cantidad = cantidad + VALUES(cantidad)
+    """)
+    db.execute(sentencia, params)
+
+
+def get_resumen(
+    db: Session,
+    periodo: str = 'dia',
+    agrupar: str = 'galpon',
+    fecha_inicio: str = None,
+    fecha_fin: str = None
+):
+    """
+    Totales de producción por periodo y por galpón, finca o tipo de huevo.
+    Solo lee la tabla de acumulados, nunca produccion_huevos.
+    """
+    try:
+        grupo = AGRUPACIONES[agrupar]
+        query = f"""
+            SELECT
+                r.inicio,
+                {grupo["id"]} AS id_grupo,
+                {grupo["nombre"]} AS nombre_grupo,
+                SUM(r.cantidad) AS cantidad
+            FROM produccion_huevos_resumen r
+            {grupo["join"]}
+            WHERE r.periodo = :periodo
+        """
+        params = {"periodo": periodo}
+
+        if fecha_inicio and fecha_fin:
+            query += " AND r.inicio BETWEEN :fecha_inicio AND :fecha_fin"
+            params["fecha_inicio"] = inicio_periodo(periodo, date.fromisoformat(str(fecha_inicio)))
+            params["fecha_fin"] = fecha_fin
+
+        query += f"""
+            GROUP BY r.inicio, {grupo["id"]}, {grupo["nombre"]}
+            ORDER BY r.inicio ASC, id_grupo ASC
+        """
+
+        result = db.execute(text(query), params).mappings().all()
+        return result
+    except SQLAlchemyError as e:
+        logger.error(f"Error al obtener el resumen de producción: {e}")
+        raise Exception("Error de base de datos al obtener el resumen de producción")
+
+
+def backfill(db: Session) -> None:
+    """
+    Reconstruye todos los acumulados a partir de produccion_huevos.
+    Conviene ejecutarlo sin escrituras concurrentes (por ejemplo, durante un despliegue).
+    """
+    try:
+        produccion_huevos_resumen.create(db.connection(), checkfirst=True)
+        db.execute(text("DELETE FROM produccion_huevos_resumen"))
+
+        inicios = {
+            'dia': "fecha",
+            'semana': "DATE_SUB(fecha, INTERVAL WEEKDAY(fecha) DAY)",
+            'mes': "DATE_SUB(fecha, INTERVAL DAYOFMONTH(fecha) - 1 DAY)",
+        }
+        for periodo, inicio in inicios.items():
+            db.execute(text(f"""
+                INSERT INTO produccion_huevos_resumen (
+                    periodo, inicio, id_galpon, id_tipo_huevo, cantidad
+                )
+                SELECT :periodo, {inicio}, id_galpon, id_tipo_huevo, SUM(cantidad)
+                FROM produccion_huevos
+                GROUP BY {inicio}, id_galpon, id_tipo_huevo
+            """), {"periodo": periodo})
+
+        db.commit()
+        logger.info("Acumulados de produccion_huevos reconstruidos")
+    except SQLAlchemyError as e:
+        db.rollback()
+        logger.error(f"Error al reconstruir el resumen de producción: {e}")
+        raise Exception("Error de base de datos al reconstruir el resumen de producción")
+
+
+if __name__ == "__main__":
+    # Uso: python -m app.crud.resumen_produccion
+    from core.database import SessionLocal
+
+    logging.basicConfig(level=logging.INFO)
+    session = SessionLocal()
+    try:
+        backfill(session)
+    finally:
+        session.close()
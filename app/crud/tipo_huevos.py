@@ -1,21 +1,29 @@
 from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from sqlalchemy import text
 from typing import Optional
+from app.crud.base import TableCrud
 from app.schemas.tipo_huevos import TipoHuevosCreate, TipoHuevosUpdate
+from core.config import settings
+from core.query_cache import query_cache
+from core.response_cache import ResponseCache
+from core.schema import tipo_huevos
+
+tabla = TableCrud(tipo_huevos, updatable=("Color", "Tamaño"))
+
+# Respuestas de GET /tipo-huevos ya serializadas; se invalidan al crear o actualizar
+respuestas = ResponseCache(
+    "tipo_huevos_respuestas",
+    maxsize=settings.CATALOGO_CACHE_SIZE,
+    ttl=settings.CATALOGO_CACHE_TTL
+)
 
 
 def create_tipo_huevo(db: Session, tipo_huevo: TipoHuevosCreate) -> Optional[bool]:
     try:
-        sentencia = text("""
-            INSERT INTO tipo_huevos (
-                Color, Tamaño
-            ) VALUES (
-                :Color, :Tamaño
-            )
-        """)
-        db.execute(sentencia, tipo_huevo.model_dump())
+        tabla.insert(db, tipo_huevo.model_dump())
         db.commit()
+        respuestas.invalidate()
+        query_cache.invalidate("tipo_huevos")
         return True
     except SQLAlchemyError as e:
         db.rollback()
@@ -23,24 +31,13 @@ def create_tipo_huevo(db: Session, tipo_huevo: TipoHuevosCreate) -> Optional[boo
 
 def get_tipo_huevo_by_id(db: Session, id_tipo_huevo: int):
     try:
-        query = text("""
-            SELECT id_tipo_huevo, Color, Tamaño
-            FROM tipo_huevos
-            WHERE id_tipo_huevo = :id_tipo_huevo
-        """)
-        result = db.execute(query, {"id_tipo_huevo": id_tipo_huevo}).mappings().first()
-        return result
+        return tabla.get(db, id_tipo_huevo)
     except SQLAlchemyError as e:
         raise Exception(f"Error de base de datos al obtener tipo_huevo por ID: {e}")
 
 def get_all_tipo_huevos(db: Session):
     try:
-        query = text("""
-            SELECT id_tipo_huevo, Color, Tamaño
-            FROM tipo_huevos
-        """)
-        result = db.execute(query).mappings().all()
-        return result
+        return tabla.all(db)
     except SQLAlchemyError as e:
         raise Exception(f"Error de base de datos al obtener todos los tipos de huevo: {e}")
 
@@ -49,17 +46,12 @@ def update_tipo_huevo_by_id(db: Session, id_tipo_huevo: int, tipo_huevo: TipoHue
         tipo_data = tipo_huevo.model_dump(exclude_unset=True)
         if not tipo_data:
             return False
-        
-        set_clauses = ", ".join([f"{key} = :{key}" for key in tipo_data.keys()])
-        sentencia = text(f"""
-            UPDATE tipo_huevos
-            SET {set_clauses}
-            WHERE id_tipo_huevo = :id_tipo_huevo
-        """)
-        tipo_data["id_tipo_huevo"] = id_tipo_huevo
-        result = db.execute(sentencia, tipo_data)
+
+        filas = tabla.update(db, id_tipo_huevo, tipo_data)
         db.commit()
-        return result.rowcount > 0
+        respuestas.invalidate()
+        query_cache.invalidate("tipo_huevos")
+        return filas > 0
     except SQLAlchemyError as e:
         db.rollback()
         raise Exception(f"Error de base de datos al actualizar tipo_huevo {id_tipo_huevo}: {e}")
@@ -4,27 +4,56 @@ from sqlalchemy import text
 from typing import Optional
 import logging
 
+from app.crud.base import TableCrud
 from app.schemas.users import UserCreate, UserUpdate
 from core.security import get_hashed_password
+from core.cache import TTLCache
+from core.config import settings
+from core.database import lee_de_replica
+from core.schema import usuarios
 
 logger = logging.getLogger(__name__)
 
-def create_user(db: Session, user: UserCreate) -> Optional[bool]:
+# id_rol y pass_hash no se cambian con las actualizaciones generales
+tabla = TableCrud(usuarios, updatable=("nombre", "email", "telefono", "documento", "estado"))
+
+# Consultas con JOIN a roles: se construyen una sola vez al importar el módulo
+_USUARIO_LOGIN_POR_EMAIL = text("""
+    SELECT id_usuario, nombre, documento, usuarios.id_rol, email, telefono, usuarios.estado, nombre_rol, pass_hash
+    FROM usuarios INNER JOIN roles ON usuarios.id_rol=roles.id_rol
+    WHERE email = :correo
+""")
+_USUARIO_POR_EMAIL = text("""
+    SELECT id_usuario, nombre, documento, usuarios.id_rol, email, telefono, usuarios.estado, nombre_rol
+    FROM usuarios INNER JOIN roles ON usuarios.id_rol=roles.id_rol
+    WHERE email = :correo
+""")
+_USUARIOS_EXCEPTO_ADMINS = text("""
+    SELECT id_usuario, nombre, documento, usuarios.id_rol, email, telefono, usuarios.estado, nombre_rol
+    FROM usuarios INNER JOIN roles ON usuarios.id_rol=roles.id_rol
+    WHERE usuarios.id_rol NOT IN (1,2)
+""")
+_USUARIO_POR_ID = text("""
+    SELECT id_usuario, nombre, documento, usuarios.id_rol, email, telefono, usuarios.estado, nombre_rol
+    FROM usuarios INNER JOIN roles ON usuarios.id_rol=roles.id_rol
+    WHERE id_usuario = :id_user
+""")
+
+# Usuarios ya resueltos por get_current_user (incluye estado e id_rol), indexados por id_usuario
+principal_cache = TTLCache(
+    "principales",
+    maxsize=settings.PRINCIPAL_CACHE_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL
+)
+
+def create_user(db: Session, user: UserCreate, pass_hash: Optional[str] = None) -> Optional[bool]:
+    """
+    Crea un usuario. `pass_hash` es el hash ya calculado fuera del event loop
+    (password_verifier.hash); si no se pasa, se calcula aquí con bcrypt.
+    """
     try:
-        pass_encript = get_hashed_password(user.pass_hash)
-        user.pass_hash = pass_encript
-        sentencia = text("""
-            INSERT INTO usuarios(
-                nombre, id_rol, email,
-                telefono, documento,   
-                pass_hash, estado
-            ) VALUES (
-                :nombre, :id_rol, :email,
-                :telefono, :documento,
-                :pass_hash, :estado
-            )
-        """)
-        db.execute(sentencia, user.model_dump())
+        user.pass_hash = pass_hash or get_hashed_password(user.pass_hash)
+        tabla.insert(db, user.model_dump())
         db.commit()
         return True
     except SQLAlchemyError as e:
@@ -34,12 +63,7 @@ def create_user(db: Session, user: UserCreate) -> Optional[bool]:
 
 def get_user_by_email_for_login(db: Session, email: str):
     try:
-        query = text("""
-                     SELECT id_usuario, nombre, documento, usuarios.id_rol, email, telefono, usuarios.estado, nombre_rol, pass_hash
-                     FROM usuarios INNER JOIN roles ON usuarios.id_rol=roles.id_rol
-                     WHERE email = :correo
-                     """)
-        result = db.execute(query, {"correo": email}).mappings().first()
+        result = db.execute(_USUARIO_LOGIN_POR_EMAIL, {"correo": email}).mappings().first()
         return result
     except SQLAlchemyError as e:
         logger.error(f"Error al obtener usuario por email: {e}")
@@ -48,12 +72,7 @@ def get_user_by_email_for_login(db: Session, email: str):
 
 def get_user_by_email(db: Session, email: str):
     try:
-        query = text("""
-                     SELECT id_usuario, nombre, documento, usuarios.id_rol, email, telefono, usuarios.estado, nombre_rol
-                     FROM usuarios INNER JOIN roles ON usuarios.id_rol=roles.id_rol
-                     WHERE email = :correo
-                     """)
-        result = db.execute(query, {"correo": email}).mappings().first()
+        result = db.execute(_USUARIO_POR_EMAIL, {"correo": email}).mappings().first()
         return result
     except SQLAlchemyError as e:
         logger.error(f"Error al obtener usuario por email: {e}")
@@ -61,12 +80,7 @@ def get_user_by_email(db: Session, email: str):
     
 def get_all_user_except_admins(db: Session):
     try:
-        query = text("""
-                    SELECT id_usuario, nombre, documento, usuarios.id_rol, email, telefono, usuarios.estado, nombre_rol
-                     FROM usuarios INNER JOIN roles ON usuarios.id_rol=roles.id_rol
-                     WHERE usuarios.id_rol NOT IN (1,2)
-                     """)
-        result = db.execute(query).mappings().all()
+        result = db.execute(_USUARIOS_EXCEPTO_ADMINS).mappings().all()
         return result
     except SQLAlchemyError as e:
         logger.error(f"Error al obtener los usuarios: {e}")
@@ -77,12 +91,9 @@ def update_user(db: Session, user_id: int, user_update: UserUpdate) -> bool:
         fields = user_update.model_dump(exclude_unset=True)
         if not fields:
             return False
-        set_clause = ", ".join([f"{key} = :{key}" for key in fields])
-        fields["user_id"] = user_id
-
-        query = text(f"UPDATE usuarios SET {set_clause} WHERE id_usuario = :user_id")
-        db.execute(query, fields)
+        tabla.update(db, user_id, fields)
         db.commit()
+        principal_cache.delete(user_id)
         return True
     except SQLAlchemyError as e:
         db.rollback()
@@ -96,21 +107,12 @@ def update_user_by_id(db: Session, user_id: int, user: UserUpdate) -> Optional[b
         if not user_data:
             return False  # nada que actualizar
 
-        # Construir dinámicamente la sentencia UPDATE
-        set_clauses = ", ".join([f"{key} = :{key}" for key in user_data.keys()])
-        sentencia = text(f"""
-            UPDATE usuarios 
-            SET {set_clauses}
-            WHERE id_usuario = :id_usuario
-        """)
-
-        # Agregar el id_usuario
-        user_data["id_usuario"] = user_id
-
-        result = db.execute(sentencia, user_data)
+        # UPDATE con solo esas columnas (sentencia cacheada por conjunto de columnas)
+        filas = tabla.update(db, user_id, user_data)
         db.commit()
+        principal_cache.delete(user_id)
 
-        return result.rowcount > 0
+        return filas > 0
     
     except SQLAlchemyError as e:
         db.rollback()
@@ -119,13 +121,22 @@ def update_user_by_id(db: Session, user_id: int, user: UserUpdate) -> Optional[b
 
 def get_user_by_id(db: Session, id:int):
     try:
-        query = text("""
-                     SELECT id_usuario, nombre, documento, usuarios.id_rol, email, telefono, usuarios.estado, nombre_rol
-                     FROM usuarios INNER JOIN roles ON usuarios.id_rol=roles.id_rol
-                     WHERE id_usuario = :id_user
-                     """)
-        result = db.execute(query, {"id_user": id}).mappings().first()
+        result = db.execute(_USUARIO_POR_ID, {"id_user": id}).mappings().first()
         return result
     except SQLAlchemyError as e:
         logger.error(f"Error al obtener usuario por ID: {e}")
         raise Exception("Error de base de datos al obtener el usuario")
+
+
+def get_principal(db: Session, id: int):
+    """
+    Igual que get_user_by_id, pero reutiliza el resultado durante PRINCIPAL_CACHE_TTL
+    segundos. Las actualizaciones del usuario invalidan su entrada de inmediato.
+    Lo leído de la réplica no se guarda: puede ir atrasado respecto de esa invalidación.
+    """
+    user = principal_cache.get(id)
+    if user is None:
+        user = get_user_by_id(db, id)
+        if user is not None and not lee_de_replica(db):
+            principal_cache.set(id, user)
+    return user
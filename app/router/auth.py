@@ -1,10 +1,9 @@
 from typing import Annotated
 from fastapi import APIRouter, Depends,HTTPException
-from sqlalchemy.orm import Session
-from app.router.dependencies import authenticate_user
+from app.router.dependencies import authenticate_user_async
 from app.schemas.auth import ResponseLoggin
-from core.security import create_access_token
-from core.database import get_db
+from core.security import create_access_token, PasswordQueueFull
+from core.database import DbSession, get_session
 from fastapi.security import OAuth2PasswordRequestForm
 
 
@@ -13,9 +12,16 @@ router = APIRouter()
 @router.post("/token", response_model=ResponseLoggin)
 async def login_for_access_token(
     form_data: Annotated[OAuth2PasswordRequestForm, Depends()],
-    db: Session = Depends(get_db)
+    db: DbSession = Depends(get_session)
 ):
-    user = authenticate_user(form_data.username, form_data.password, db)
+    try:
+        user = await authenticate_user_async(form_data.username, form_data.password, db)
+    except PasswordQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Demasiados inicios de sesión simultáneos, intente de nuevo",
+            headers={"Retry-After": "1"},
+        )
     if not user:
         raise HTTPException(
             status_code=401,
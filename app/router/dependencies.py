@@ -1,21 +1,21 @@
-from app.crud.users import get_user_by_email_for_login, get_user_by_id
+from app.crud.users import get_user_by_email_for_login, get_principal
 from fastapi import Depends, HTTPException
 from sqlalchemy.orm import Session
-from core.security import verify_password, verify_token
-from core.database import get_db
+from core.security import verify_password, verify_token, password_verifier
+from core.database import DbSession, get_session, run_db
 from fastapi.security import OAuth2PasswordBearer
 
 
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="/access/token")
 
-def get_current_user(
+async def get_current_user(
         token: str = Depends(oauth2_scheme),
-        db: Session = Depends(get_db)
+        db: DbSession = Depends(get_session)
 ):
     user = verify_token(token)
     if user is None:
         raise HTTPException(status_code=401, detail="Token Invalido")
-    user_db = get_user_by_id(db, user)
+    user_db = await run_db(db, get_principal, user)
     if user_db is None:
         raise HTTPException(status_code=404, detail="Usuario no encontrado")
     if not user_db.estado:
@@ -29,4 +29,15 @@ def authenticate_user(username: str, password: str, db: Session):
         return False
     if not verify_password(password, user.pass_hash):
         return False
-    return user
\ No newline at end of file
+    return user
+
+
+async def authenticate_user_async(username: str, password: str, db: DbSession):
+    # La consulta no bloquea el event loop (threadpool o sesión asíncrona)
+    # y bcrypt se ejecuta en el pool de verificación
+    user = await run_db(db, get_user_by_email_for_login, username)
+    if not user:
+        return False
+    if not await password_verifier.verify(password, user.pass_hash):
+        return False
+    return user
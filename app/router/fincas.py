@@ -1,11 +1,11 @@
 from app.crud.permisos import verify_permissions
-from typing import List
+from typing import List, Optional
 from app.router.dependencies import get_current_user
 from app.schemas.users import UserOut
-from app.schemas.fincas import FincaCreate, FincaUpdate, FincaOut, FincaEstado
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from core.database import get_db
+from app.schemas.fincas import FincaCreate, FincaUpdate, FincaOut, FincaEstado, FincaCercana, FincaCluster
+from fastapi import APIRouter, Depends, HTTPException, Query, status
+from core.database import DbSession, get_session, run_db, run_db_shared
+from core.serialization import json_list
 from app.crud import fincas as crud_fincas
 from sqlalchemy.exc import SQLAlchemyError
 
@@ -13,36 +13,36 @@ router = APIRouter()
 modulo = 3  # Módulo 3 = fincas (confirmado desde tu DB)
 
 @router.post("/crear", status_code=status.HTTP_201_CREATED)
-def create_finca(
+async def create_finca(
     finca: FincaCreate,
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         # Verificar permisos - solo rol 1 (superadmin) puede crear fincas
         id_rol = user_token.id_rol
-        if not verify_permissions(db, id_rol, modulo, 'insertar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'insertar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
         
-        crud_fincas.create_finca(db, finca)
+        await run_db(db, crud_fincas.create_finca, finca)
         return {"message": "Finca creada correctamente"}
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/by-id/{finca_id}", response_model=FincaOut)
-def get_finca(
+async def get_finca(
     finca_id: int,
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
         
         # Verificar permisos para seleccionar
-        if not verify_permissions(db, id_rol, modulo, 'seleccionar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        finca = crud_fincas.get_finca_by_id(db, finca_id)
+        finca = await run_db(db, crud_fincas.get_finca_by_id, finca_id)
         if not finca:
             raise HTTPException(status_code=404, detail="Finca no encontrada")
         return finca
@@ -50,54 +50,129 @@ def get_finca(
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/all-fincas", response_model=List[FincaOut])
-def get_fincas(
-    db: Session = Depends(get_db),
+async def get_fincas(
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
 
-        if not verify_permissions(db, id_rol, modulo, 'seleccionar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        fincas = crud_fincas.get_all_finca(db)
-        return fincas
+        fincas = await run_db_shared(db, crud_fincas.get_all_finca)
+        return json_list(FincaOut, fincas)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/by-usuario/{usuario_id}", response_model=List[FincaOut])
-def get_fincas_by_usuario(
+async def get_fincas_by_usuario(
     usuario_id: int,
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
         
         # Verificar permisos para seleccionar
-        if not verify_permissions(db, id_rol, modulo, 'seleccionar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        fincas = crud_fincas.get_fincas_by_usuario(db, usuario_id)
-        return fincas
+        fincas = await run_db(db, crud_fincas.get_fincas_by_usuario, usuario_id)
+        return json_list(FincaOut, fincas)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/cercanas", response_model=List[FincaCercana])
+async def get_fincas_cercanas(
+    latitud: float = Query(..., ge=-90, le=90),
+    longitud: float = Query(..., ge=-180, le=180),
+    radio_km: float = Query(..., gt=0, le=500, description="Distancia máxima al punto, en kilómetros"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Cantidad máxima de fincas (las más cercanas)"),
+    db: DbSession = Depends(get_session),
+    user_token: UserOut = Depends(get_current_user)
+):
+    """
+    Fincas a radio_km o menos del punto, ordenadas por distancia (incluye distancia_km).
+    """
+    try:
+        id_rol = user_token.id_rol
+
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
+            raise HTTPException(status_code=401, detail="Usuario no autorizado")
+
+        fincas = await run_db(db, crud_fincas.get_fincas_cercanas, latitud, longitud, radio_km, limit)
+        return json_list(FincaCercana, fincas)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/en-area", response_model=List[FincaOut])
+async def get_fincas_en_area(
+    min_lat: float = Query(..., ge=-90, le=90),
+    min_lon: float = Query(..., ge=-180, le=180),
+    max_lat: float = Query(..., ge=-90, le=90),
+    max_lon: float = Query(..., ge=-180, le=180),
+    db: DbSession = Depends(get_session),
+    user_token: UserOut = Depends(get_current_user)
+):
+    """
+    Fincas dentro del rectángulo. Si min_lon > max_lon el área cruza el meridiano 180.
+    """
+    try:
+        id_rol = user_token.id_rol
+
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
+            raise HTTPException(status_code=401, detail="Usuario no autorizado")
+        if min_lat > max_lat:
+            raise HTTPException(status_code=400, detail="min_lat debe ser menor o igual que max_lat")
+
+        fincas = await run_db(db, crud_fincas.get_fincas_en_area, min_lat, min_lon, max_lat, max_lon)
+        return json_list(FincaOut, fincas)
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.get("/clusters", response_model=List[FincaCluster])
+async def get_fincas_clusters(
+    zoom: int = Query(..., ge=0, le=22, description="Nivel de zoom del mapa (teselas Web Mercator)"),
+    min_lat: float = Query(-90, ge=-90, le=90),
+    min_lon: float = Query(-180, ge=-180, le=180),
+    max_lat: float = Query(90, ge=-90, le=90),
+    max_lon: float = Query(180, ge=-180, le=180),
+    db: DbSession = Depends(get_session),
+    user_token: UserOut = Depends(get_current_user)
+):
+    """
+    Fincas agrupadas para el mapa: por cada cluster visible en el viewport, su
+    centroide, cantidad de fincas y bbox (id_finca cuando es una sola finca).
+    """
+    try:
+        id_rol = user_token.id_rol
+
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
+            raise HTTPException(status_code=401, detail="Usuario no autorizado")
+        if min_lat > max_lat:
+            raise HTTPException(status_code=400, detail="min_lat debe ser menor o igual que max_lat")
+
+        clusters = await run_db(db, crud_fincas.get_fincas_clusters, zoom, min_lat, min_lon, max_lat, max_lon)
+        return json_list(FincaCluster, clusters)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/by-id/{finca_id}")
-def update_finca(
+async def update_finca(
     finca_id: int,
     finca: FincaUpdate,
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
         
         # Verificar permisos para actualizar
-        if not verify_permissions(db, id_rol, modulo, 'actualizar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'actualizar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        success = crud_fincas.update_finca_by_id(db, finca_id, finca)
+        success = await run_db(db, crud_fincas.update_finca_by_id, finca_id, finca)
         if not success:
             raise HTTPException(status_code=400, detail="No se pudo actualizar la finca")
         return {"message": "Finca actualizada correctamente"}
@@ -107,18 +182,18 @@ def update_finca(
 
 
 # @router.delete("/by-id/{finca_id}")
-# def delete_finca(
+# async def delete_finca(
 #     finca_id: int,
-#     db: Session = Depends(get_db),
+#     db: DbSession = Depends(get_session),
 #     user_token: UserOut = Depends(get_current_user)
 # ):
 #     try:
 #         id_rol = user_token.id_rol
         
-#         if not verify_permissions(db, id_rol, modulo, 'borrar'):
+#         if not await run_db(db, verify_permissions, id_rol, modulo, 'borrar'):
 #             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-#         success = crud_fincas.delete_finca(db, finca_id)
+#         success = await run_db(db, crud_fincas.delete_finca, finca_id)
 #         if not success:
 #             raise HTTPException(status_code=400, detail="No se pudo eliminar la finca")
 #         return {"message": "Finca eliminada correctamente"}
@@ -0,0 +1,129 @@
+from fastapi import APIRouter, Header, HTTPException
+from fastapi.responses import PlainTextResponse
+from typing import Optional
+
+from app.crud.crud_stock import stock_events
+from app.crud.permisos import permission_matrix
+from app.router.produccion_huevos import ingesta_produccion
+from core.cache import caches
+from core.config import settings
+from core.database import REPLICA_ACTIVA, engine, replica_engine, async_engine, async_replica_engine
+from core.metrics import register_collector, render
+from core.query_cache import query_cache
+from core.singleflight import grupos
+from core.security import password_verifier
+
+router = APIRouter()
+
+
+def _pool_samples():
+    # En modo asíncrono las peticiones usan los pools de los motores asíncronos
+    if async_engine is not None:
+        engines = {"principal": async_engine.sync_engine, "replica": async_replica_engine.sync_engine}
+    else:
+        engines = {"principal": engine, "replica": replica_engine}
+    if not REPLICA_ACTIVA:
+        engines.pop("replica")
+    pools = [({"engine": name}, eng.pool) for name, eng in engines.items()]
+
+    yield ("db_pool_size", "gauge", "Conexiones permanentes configuradas en el pool",
+           [(labels, pool.size()) for labels, pool in pools])
+    yield ("db_pool_checked_out", "gauge", "Conexiones prestadas actualmente",
+           [(labels, pool.checkedout()) for labels, pool in pools])
+    yield ("db_pool_checked_in", "gauge", "Conexiones libres dentro del pool",
+           [(labels, pool.checkedin()) for labels, pool in pools])
+    # overflow() es negativo mientras el pool no ha abierto todas sus conexiones permanentes
+    yield ("db_pool_overflow", "gauge", "Conexiones abiertas por encima de pool_size",
+           [(labels, max(pool.overflow(), 0)) for labels, pool in pools])
+    yield ("db_pool_max_overflow", "gauge", "Límite de conexiones adicionales (max_overflow)",
+           [({}, settings.DB_MAX_OVERFLOW)])
+
+
+def _cache_samples():
+    estadisticas = [(name, cache.hits, cache.misses, len(cache)) for name, cache in caches.items()]
+    estadisticas.append((
+        "permisos", permission_matrix.hits, permission_matrix.misses, len(permission_matrix)
+    ))
+    yield ("cache_hits_total", "counter", "Lecturas resueltas desde caché",
+           [({"cache": name}, hits) for name, hits, _, _ in estadisticas])
+    yield ("cache_misses_total", "counter", "Lecturas que no estaban en caché",
+           [({"cache": name}, misses) for name, _, misses, _ in estadisticas])
+    yield ("cache_entries", "gauge", "Entradas guardadas en caché",
+           [({"cache": name}, size) for name, _, _, size in estadisticas])
+    yield ("query_cache_invalidations_total", "counter", "Escrituras que invalidaron etiquetas de la caché de consultas",
+           [({}, query_cache.invalidations)])
+
+
+def _password_samples():
+    stats = password_verifier.stats()
+    yield ("login_password_queue_depth", "gauge", "Verificaciones de contraseña pendientes",
+           [({}, stats["pending"])])
+    yield ("login_password_verifications_total", "counter", "Verificaciones de contraseña completadas",
+           [({}, stats["completed"])])
+    yield ("login_password_rejected_total", "counter", "Logins rechazados por cola llena",
+           [({}, stats["rejected"])])
+    yield ("login_password_seconds_total", "counter", "Tiempo total (espera + bcrypt) de las verificaciones",
+           [({}, password_verifier.total_seconds)])
+    yield ("login_password_max_seconds", "gauge", "Mayor latencia observada de una verificación",
+           [({}, stats["max_seconds"])])
+
+
+def _ingesta_samples():
+    stats = ingesta_produccion.stats()
+    yield ("ingesta_produccion_pendientes", "gauge", "Claves acumuladas en memoria sin escribir",
+           [({}, stats["pending_keys"])])
+    yield ("ingesta_produccion_eventos_total", "counter", "Incrementos recibidos",
+           [({}, stats["events"])])
+    yield ("ingesta_produccion_lotes_total", "counter", "Lotes escritos en la base de datos",
+           [({}, stats["flushes"])])
+    yield ("ingesta_produccion_filas_total", "counter", "Claves escritas en los lotes",
+           [({}, stats["rows"])])
+    yield ("ingesta_produccion_errores_total", "counter", "Lotes que fallaron y se reintentaron",
+           [({}, stats["errors"])])
+    yield ("ingesta_produccion_rechazados_total", "counter", "Incrementos rechazados por buffer lleno",
+           [({}, stats["rejected"])])
+    yield ("ingesta_produccion_flush_seconds_total", "counter", "Tiempo total escribiendo lotes",
+           [({}, stats["flush_seconds"])])
+
+
+def _stream_samples():
+    yield ("stock_stream_subscribers", "gauge", "Clientes conectados a /stock/stream en este worker",
+           [({}, len(stock_events))])
+    yield ("stock_stream_events_total", "counter", "Cambios de stock publicados",
+           [({}, stock_events.published)])
+    yield ("stock_stream_dropped_total", "counter", "Suscriptores desconectados por atraso",
+           [({}, stock_events.dropped)])
+
+
+def _singleflight_samples():
+    stats = [
+        ({"grupo": grupo.name, "funcion": label}, valores)
+        for grupo in grupos.values()
+        for label, valores in grupo.stats().items()
+    ]
+    yield ("singleflight_calls_total", "counter", "Lecturas pedidas a través de single-flight",
+           [(labels, valores["calls"]) for labels, valores in stats])
+    yield ("singleflight_executions_total", "counter", "Lecturas que ejecutaron la consulta",
+           [(labels, valores["executions"]) for labels, valores in stats])
+    yield ("singleflight_shared_total", "counter", "Lecturas resueltas con una ejecución en curso",
+           [(labels, valores["shared"]) for labels, valores in stats])
+    yield ("singleflight_coalescing_ratio", "gauge", "Fracción de lecturas que compartieron una ejecución",
+           [(labels, valores["ratio"]) for labels, valores in stats])
+    yield ("singleflight_in_flight", "gauge", "Ejecuciones en curso",
+           [({"grupo": grupo.name}, len(grupo)) for grupo in grupos.values()])
+
+
+register_collector(_pool_samples)
+register_collector(_cache_samples)
+register_collector(_password_samples)
+register_collector(_ingesta_samples)
+register_collector(_stream_samples)
+register_collector(_singleflight_samples)
+
+
+@router.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+def get_metrics(authorization: Optional[str] = Header(None)):
+    # Si METRICS_TOKEN está definido, el scraper debe enviarlo como Bearer
+    if settings.METRICS_TOKEN and authorization != f"Bearer {settings.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="No autorizado")
+    return PlainTextResponse(render(), media_type="text/plain; version=0.0.4; charset=utf-8")
@@ -1,98 +1,555 @@
-from typing import List, Optional
-from fastapi import APIRouter, Depends, HTTPException, status, Query 
-from sqlalchemy.orm import Session
+from typing import Any, List, Literal, Optional, Tuple, Union
+from fastapi import APIRouter, Body, Depends, HTTPException, Request, WebSocket, WebSocketDisconnect, status, Query 
+from fastapi.responses import StreamingResponse
+from starlette.websockets import WebSocketState
 from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy.orm import Session, sessionmaker
+from pydantic import TypeAdapter, ValidationError
+import asyncio
+import csv
+import io
+import json
+import logging
+import zlib
 
 from app.crud.permisos import verify_permissions
+from app.crud.users import get_principal
 from app.router.dependencies import get_current_user
+from app.router.stock import modulo as modulo_stock
 from app.schemas.users import UserOut
-from app.schemas.produccion_huevos import ProduccionHuevosCreate, ProduccionHuevosUpdate, ProduccionHuevosOut
-from core.database import get_db
+from app.schemas.produccion_huevos import (
+    ProduccionHuevosCreate, ProduccionHuevosUpdate, ProduccionHuevosOut, ProduccionHuevosPage,
+    ProduccionResumenOut, ProduccionHuevosLoteOut, ProduccionHuevosIncremento
+)
+from core.coalescer import CoalescerFull, WriteCoalescer
+from core.config import settings
+from core.security import verify_token
+from core.database import DbSession, ReplicaSessionLocal, SessionLocal, get_session, run_db, run_db_shared, usar_replica
+from core.serialization import json_list
 from app.crud import produccion_huevos as crud_produccion
+from app.crud import resumen_produccion as crud_resumen
+
+logger = logging.getLogger(__name__)
 
 router = APIRouter()
 modulo = 24  # Módulo 4 = produccion_huevos (ajusta si tienes otro ID)
 
+LOTE_MAXIMO = 5000
+# Unidad de medida para crear/ajustar el stock junto con la producción
+UnidadStock = Optional[Literal['unidad', 'panal', 'docena', 'medio_panal']]
+STOCK_UNIDAD_DESCRIPCION = "Crear o ajustar también el stock de la producción en esta unidad de medida"
+produccion_adapter = TypeAdapter(ProduccionHuevosCreate)
+
+
+async def _verificar_permiso_stock(db: DbSession, id_rol: int, stock_unidad: Optional[str], accion: str) -> None:
+    # Escribir el stock desde producción requiere también el permiso del módulo de stock
+    if stock_unidad and not await run_db(db, verify_permissions, id_rol, modulo_stock, accion):
+        raise HTTPException(status_code=401, detail="Usuario no autorizado para modificar el stock")
+
+
+def _detalle_validacion(e: ValidationError) -> str:
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in err['loc'])}: {err['msg']}" for err in e.errors()
+    )
+
+
+def _escribir_incrementos(lote):
+    # Se ejecuta en el threadpool con una sesión propia (no hay petición asociada)
+    db = SessionLocal()
+    try:
+        crud_produccion.upsert_produccion_incrementos(db, lote)
+    finally:
+        db.close()
+
+
+# Incrementos de los contadores automáticos, acumulados por (id_galpon, fecha, id_tipo_huevo).
+# main.py llama a `ingesta_produccion.close()` al apagar para escribir lo pendiente.
+ingesta_produccion = WriteCoalescer(
+    "produccion_huevos",
+    _escribir_incrementos,
+    interval_ms=settings.INGESTA_FLUSH_MS,
+    max_events=settings.INGESTA_FLUSH_EVENTOS,
+    max_keys=settings.INGESTA_MAX_CLAVES
+)
+
 @router.post("/crear", status_code=status.HTTP_201_CREATED)
-def create_produccion_huevos(
+async def create_produccion_huevos(
     produccion: ProduccionHuevosCreate,
-    db: Session = Depends(get_db),
+    stock_unidad: UnidadStock = Query(None, description=STOCK_UNIDAD_DESCRIPCION),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
-        if not verify_permissions(db, id_rol, modulo, 'insertar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'insertar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
+        await _verificar_permiso_stock(db, id_rol, stock_unidad, 'insertar')
         
-        crud_produccion.create_produccion_huevos(db, produccion)
+        await run_db(db, crud_produccion.create_produccion_huevos, produccion, stock_unidad)
         return {"message": "Producción de huevos creada correctamente"}
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.post("/crear-lote", status_code=status.HTTP_201_CREATED, response_model=ProduccionHuevosLoteOut)
+async def create_produccion_huevos_lote(
+    producciones: List[Any] = Body(..., description="Lista de producciones (mismo formato que /crear)"),
+    stock_unidad: UnidadStock = Query(None, description=STOCK_UNIDAD_DESCRIPCION),
+    db: DbSession = Depends(get_session),
+    user_token: UserOut = Depends(get_current_user)
+):
+    """
+    Crea varias producciones de huevos en una sola transacción.
+    Las filas inválidas se reportan en `errores` (por índice) y no impiden insertar las demás.
+    """
+    try:
+        id_rol = user_token.id_rol
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'insertar'):
+            raise HTTPException(status_code=401, detail="Usuario no autorizado")
+        await _verificar_permiso_stock(db, id_rol, stock_unidad, 'insertar')
+
+        if len(producciones) > LOTE_MAXIMO:
+            raise HTTPException(status_code=413, detail=f"El lote supera el máximo de {LOTE_MAXIMO} registros")
+
+        validas = []
+        posiciones = []
+        errores = []
+        for indice, item in enumerate(producciones):
+            try:
+                validas.append(produccion_adapter.validate_python(item))
+                posiciones.append(indice)
+            except ValidationError as e:
+                errores.append({"indice": indice, "detalle": _detalle_validacion(e)})
+
+        ids_creados, errores_db = await run_db(
+            db,
+            crud_produccion.create_produccion_huevos_bulk,
+            validas,
+            stock_unidad=stock_unidad
+        )
+
+        ids = [None] * len(producciones)
+        for posicion, id_creado in zip(posiciones, ids_creados):
+            ids[posicion] = id_creado
+        for indice_valida, detalle in errores_db:
+            errores.append({"indice": posiciones[indice_valida], "detalle": detalle})
+        errores.sort(key=lambda err: err["indice"])
+
+        return {
+            "ids": ids,
+            "creados": sum(1 for id_creado in ids if id_creado is not None),
+            "errores": errores
+        }
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/incremento", status_code=status.HTTP_202_ACCEPTED)
+async def incrementar_produccion_huevos(
+    incremento: ProduccionHuevosIncremento,
+    db: DbSession = Depends(get_session),
+    user_token: UserOut = Depends(get_current_user)
+):
+    """
+    Registra un incremento de producción (contadores automáticos).
+
+    El incremento se suma en memoria con los demás de la misma clave
+    (galpón, fecha, tipo de huevo) y se escribe en lote en menos de
+    INGESTA_FLUSH_MS; la respuesta 202 indica que fue aceptado, no escrito.
+    """
+    id_rol = user_token.id_rol
+    if not await run_db(db, verify_permissions, id_rol, modulo, 'insertar'):
+        raise HTTPException(status_code=401, detail="Usuario no autorizado")
+
+    try:
+        await ingesta_produccion.add(
+            (incremento.id_galpon, incremento.fecha, incremento.id_tipo_huevo),
+            incremento.cantidad
+        )
+    except CoalescerFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Hay demasiados incrementos pendientes, intente de nuevo",
+            headers={"Retry-After": "1"}
+        )
+    return {"message": "Incremento recibido"}
+
+# El websocket dura lo que la conexión del contador: sus lecturas no deben dejar una
+# transacción (ni su snapshot) abierta, porque la sesión se reutiliza en cada mensaje
+def _principal_ws(db: Session, user_id: int):
+    try:
+        return get_principal(db, user_id)
+    finally:
+        db.rollback()
+
+
+def _permiso_insertar_ws(db: Session, id_rol: int, stock_unidad: Optional[str]) -> bool:
+    # La matriz de permisos está en memoria; solo consulta la base cuando vence
+    try:
+        if stock_unidad and not verify_permissions(db, id_rol, modulo_stock, 'insertar'):
+            return False
+        return bool(verify_permissions(db, id_rol, modulo, 'insertar'))
+    except HTTPException:
+        return False
+    finally:
+        db.rollback()
+
+
+def _token_de_cabeceras(websocket: WebSocket) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Token enviado al conectar, sin pasar por la URL (que queda en los logs):
+    subprotocolos "bearer, <jwt>" (lo que permite el WebSocket del navegador) o
+    cabecera Authorization. Retorna (token, subprotocolo a aceptar).
+    """
+    protocolos = websocket.scope.get("subprotocols") or []
+    if len(protocolos) >= 2 and protocolos[0].lower() == "bearer":
+        return protocolos[1], protocolos[0]
+    scheme, _, token = websocket.headers.get("authorization", "").partition(" ")
+    if scheme.lower() == "bearer" and token:
+        return token, None
+    return None, None
+
+
+async def _token_primer_mensaje(websocket: WebSocket) -> Optional[str]:
+    # {"token": "<jwt>"} como primer mensaje, dentro de WS_AUTH_SEGUNDOS
+    try:
+        mensaje = await asyncio.wait_for(websocket.receive(), settings.WS_AUTH_SEGUNDOS)
+    except asyncio.TimeoutError:
+        return None
+    if mensaje["type"] == "websocket.disconnect":
+        raise WebSocketDisconnect(mensaje.get("code", status.WS_1000_NORMAL_CLOSURE))
+    try:
+        datos = json.loads(mensaje.get("text") or "")
+    except ValueError:
+        return None
+    token = datos.get("token") if isinstance(datos, dict) else None
+    return token if isinstance(token, str) else None
+
+
+@router.websocket("/ws")
+async def ws_produccion_huevos(
+    websocket: WebSocket,
+    stock_unidad: UnidadStock = Query(None, description=STOCK_UNIDAD_DESCRIPCION),
+    db: DbSession = Depends(get_session)
+):
+    """
+    Canal para contadores que envían producciones de forma continua.
+
+    El token JWT se valida una sola vez al conectar. Se envía en los subprotocolos
+    ("bearer", "<jwt>"), en la cabecera Authorization o, si no viene en ninguno, como
+    primer mensaje {"token": "<jwt>"}, que se responde con {"autenticado": true}.
+
+    Cada mensaje es un JSON de texto con una producción (mismo formato que /crear
+    más un `seq` opcional del cliente) o una lista de ellas; los mensajes binarios
+    se responden con un error. El permiso de inserción se verifica en cada mensaje.
+
+    Los eventos se escriben en lote (WS_LOTE_EVENTOS eventos o WS_LOTE_MS ms) y
+    se confirman con {"ack": último seq, "recibidos", "creados", "errores"}. Los
+    eventos sin confirmar al cerrarse la conexión no se escriben y deben reenviarse.
+    Con `stock_unidad` cada producción crea también su stock.
+    """
+    token, subprotocolo = _token_de_cabeceras(websocket)
+    try:
+        if token is None:
+            await websocket.accept()
+            token = await _token_primer_mensaje(websocket)
+        user_id = verify_token(token) if token else None
+        user = await run_db(db, _principal_ws, user_id) if user_id is not None else None
+        if user is None or not user.estado:
+            await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+            return
+        if websocket.client_state == WebSocketState.CONNECTING:
+            await websocket.accept(subprotocol=subprotocolo)
+        else:
+            await websocket.send_json({"autenticado": True})
+    except WebSocketDisconnect:
+        return
+
+    loop = asyncio.get_running_loop()
+    pendientes: List[Tuple[Any, ProduccionHuevosCreate]] = []
+    errores: List[dict] = []
+    recibidos = 0
+    contador = 0
+    ultimo_seq = None
+    limite = None  # momento en que vence el lote en curso
+    try:
+        while True:
+            timeout = None if limite is None else max(limite - loop.time(), 0)
+            try:
+                mensaje = await asyncio.wait_for(websocket.receive(), timeout)
+            except asyncio.TimeoutError:
+                mensaje = None
+
+            if mensaje is not None:
+                if mensaje["type"] == "websocket.disconnect":
+                    raise WebSocketDisconnect(mensaje.get("code", status.WS_1000_NORMAL_CLOSURE))
+                texto = mensaje.get("text")
+                if texto is None:
+                    await websocket.send_json({"error": "Solo se aceptan mensajes de texto con JSON"})
+                    continue
+                try:
+                    datos = json.loads(texto)
+                except ValueError:
+                    await websocket.send_json({"error": "JSON inválido"})
+                    continue
+                if not await run_db(db, _permiso_insertar_ws, user.id_rol, stock_unidad):
+                    await websocket.send_json({"error": "Usuario no autorizado"})
+                    await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+                    return
+
+                for evento in datos if isinstance(datos, list) else [datos]:
+                    contador += 1
+                    seq = evento.get("seq", contador) if isinstance(evento, dict) else contador
+                    try:
+                        pendientes.append((seq, produccion_adapter.validate_python(evento)))
+                    except ValidationError as e:
+                        errores.append({"seq": seq, "detalle": _detalle_validacion(e)})
+                    recibidos += 1
+                    ultimo_seq = seq
+                if limite is None and recibidos:
+                    limite = loop.time() + settings.WS_LOTE_MS / 1000
+
+            if recibidos and (len(pendientes) >= settings.WS_LOTE_EVENTOS or loop.time() >= limite):
+                creados = 0
+                if pendientes:
+                    ids, errores_db = await run_db(
+                        db, crud_produccion.create_produccion_huevos_bulk,
+                        [produccion for _, produccion in pendientes], stock_unidad=stock_unidad
+                    )
+                    creados = sum(1 for id_creado in ids if id_creado is not None)
+                    errores.extend({"seq": pendientes[indice][0], "detalle": detalle} for indice, detalle in errores_db)
+                await websocket.send_json({
+                    "ack": ultimo_seq,
+                    "recibidos": recibidos,
+                    "creados": creados,
+                    "errores": errores
+                })
+                pendientes, errores, recibidos, limite = [], [], 0, None
+    except WebSocketDisconnect:
+        if recibidos:
+            logger.info(f"Conexión de contador cerrada con {recibidos} eventos sin confirmar")
+    except Exception as e:
+        # Error de base de datos al escribir el lote: el cliente reenvía lo no confirmado
+        logger.error(f"Error en el canal de producción: {e}")
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
+
+
 @router.get("/by-id/{produccion_id}", response_model=ProduccionHuevosOut)
-def get_produccion_huevos(
+async def get_produccion_huevos(
     produccion_id: int,
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
-        if not verify_permissions(db, id_rol, modulo, 'seleccionar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        produccion = crud_produccion.get_produccion_huevos_by_id(db, produccion_id)
+        produccion = await run_db(db, crud_produccion.get_produccion_huevos_by_id, produccion_id)
         if not produccion:
             raise HTTPException(status_code=404, detail="Producción de huevos no encontrada")
         return produccion
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
     
-@router.get("/all", response_model=List[ProduccionHuevosOut])
-def get_all_produccion_huevos(
-    db: Session = Depends(get_db),
+@router.get("/all", response_model=Union[List[ProduccionHuevosOut], ProduccionHuevosPage])
+async def get_all_produccion_huevos(
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user),
     limit: int = Query(10, ge=1, description="Cantidad máxima de registros por página"),
     offset: int = Query(0, ge=0, description="Número de registros a saltar para paginación"),
     fecha_inicio: Optional[str] = Query(None, description="Fecha inicial en formato YYYY-MM-DD"),
-    fecha_fin: Optional[str] = Query(None, description="Fecha final en formato YYYY-MM-DD")
+    fecha_fin: Optional[str] = Query(None, description="Fecha final en formato YYYY-MM-DD"),
+    paginacion: Literal['offset', 'cursor'] = Query('offset', description="Modo de paginación"),
+    cursor: Optional[str] = Query(None, description="Valor next_cursor de la página anterior (modo cursor)")
 ):
     """
     Obtiene todas las producciones de huevos con JOINs a galpones y tipo_huevos,
     con paginación y filtrado por rango de fechas.
+
+    En modo 'offset' retorna la lista de registros (comportamiento original).
+    En modo 'cursor' retorna {items, next_cursor}; para la siguiente página se
+    envía next_cursor en el parámetro cursor.
     """
     try:
         # Verificar permisos del usuario
         id_rol = user_token.id_rol
-        if not verify_permissions(db, id_rol, modulo, 'seleccionar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        producciones = crud_produccion.get_all_produccion_huevos(
+        if paginacion == 'cursor' or cursor:
+            try:
+                items, next_cursor = await run_db_shared(
+                    db,
+                    crud_produccion.get_produccion_huevos_keyset,
+                    limit=limit,
+                    cursor=cursor,
+                    fecha_inicio=fecha_inicio,
+                    fecha_fin=fecha_fin
+                )
+            except ValueError as e:
+                raise HTTPException(status_code=400, detail=str(e))
+            return ProduccionHuevosPage(items=items, next_cursor=next_cursor)
+
+        producciones = await run_db_shared(
             db,
+            crud_produccion.get_all_produccion_huevos,
             limit=limit,
             offset=offset,
             fecha_inicio=fecha_inicio,
             fecha_fin=fecha_fin
         )
 
-        return producciones
+        return json_list(ProduccionHuevosOut, producciones)
+
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/resumen", response_model=List[ProduccionResumenOut])
+async def get_resumen_produccion(
+    db: DbSession = Depends(get_session),
+    user_token: UserOut = Depends(get_current_user),
+    periodo: Literal['dia', 'semana', 'mes'] = Query('dia', description="Tamaño del periodo"),
+    agrupar: Literal['galpon', 'finca', 'tipo'] = Query('galpon', description="Agrupar por galpón, finca o tipo de huevo"),
+    fecha_inicio: Optional[str] = Query(None, description="Fecha inicial en formato YYYY-MM-DD"),
+    fecha_fin: Optional[str] = Query(None, description="Fecha final en formato YYYY-MM-DD")
+):
+    """
+    Totales de producción por día, semana o mes, leídos de la tabla de acumulados.
+    """
+    try:
+        id_rol = user_token.id_rol
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
+            raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
+        try:
+            resumen = await run_db(
+                db,
+                crud_resumen.get_resumen,
+                periodo=periodo,
+                agrupar=agrupar,
+                fecha_inicio=fecha_inicio,
+                fecha_fin=fecha_fin
+            )
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Formato de fecha inválido, use YYYY-MM-DD")
+        return resumen
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def _exportar_produccion(
+    session_factory: sessionmaker,
+    formato: str,
+    comprimir: bool,
+    fecha_inicio: Optional[str],
+    fecha_fin: Optional[str]
+):
+    # Usa su propia sesión síncrona: la de la petición se cierra antes de que termine de
+    # enviarse la respuesta. StreamingResponse itera este generador en el threadpool.
+    db = session_factory()
+    compressor = zlib.compressobj(wbits=31) if comprimir else None  # wbits=31 -> formato gzip
+
+    def emitir(texto: str) -> bytes:
+        data = texto.encode("utf-8")
+        return compressor.compress(data) if compressor else data
+
+    lotes = crud_produccion.iter_produccion_huevos(db, fecha_inicio=fecha_inicio, fecha_fin=fecha_fin)
+    completo = False
+
+    try:
+        if formato == 'csv':
+            yield emitir("nombre_galpon,cantidad,fecha,tamaño\r\n")
+
+        for lote in lotes:
+            buffer = io.StringIO()
+            if formato == 'csv':
+                writer = csv.writer(buffer)
+                writer.writerows(
+                    (row["nombre_galpon"], row["cantidad"], row["fecha"].isoformat(), row["tamaño"])
+                    for row in lote
+                )
+            else:
+                for row in lote:
+                    buffer.write(json.dumps({
+                        "nombre_galpon": row["nombre_galpon"],
+                        "cantidad": row["cantidad"],
+                        "fecha": row["fecha"].isoformat(),
+                        "tamaño": row["tamaño"],
+                    }, ensure_ascii=False))
+                    buffer.write("\n")
+
+            data = emitir(buffer.getvalue())
+            if data:
+                yield data
+
+        if compressor:
+            yield compressor.flush()
+        completo = True
+    finally:
+        if not completo and db.in_transaction():
+            # El cliente se desconectó (o hubo un error) con filas sin leer en el cursor del
+            # servidor: cerrarlo haría que el driver las leyera todas antes de liberar la
+            # conexión. Se descarta la conexión y MySQL aborta la consulta al cerrarse el socket.
+            db.connection().invalidate()
+        lotes.close()
+        db.close()
+
+
+@router.get("/export")
+async def export_produccion_huevos(
+    request: Request,
+    db: DbSession = Depends(get_session),
+    user_token: UserOut = Depends(get_current_user),
+    formato: Literal['csv', 'ndjson'] = Query('csv', description="Formato de salida"),
+    gzip: bool = Query(False, description="Comprimir la respuesta con gzip"),
+    fecha_inicio: Optional[str] = Query(None, description="Fecha inicial en formato YYYY-MM-DD"),
+    fecha_fin: Optional[str] = Query(None, description="Fecha final en formato YYYY-MM-DD")
+):
+    """
+    Exporta las producciones de huevos (galpón, cantidad, fecha, tamaño) en CSV o NDJSON.
+    Las filas se leen con un cursor del servidor y se envían a medida que llegan.
+    """
+    id_rol = user_token.id_rol
+    if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
+        raise HTTPException(status_code=401, detail="Usuario no autorizado")
+
+    media_type = "text/csv; charset=utf-8" if formato == 'csv' else "application/x-ndjson"
+    headers = {"Content-Disposition": f'attachment; filename="produccion_huevos.{formato}"'}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+
+    return StreamingResponse(
+        # La exportación es la lectura más pesada: va a la réplica si la petición lo permite
+        _exportar_produccion(
+            ReplicaSessionLocal if usar_replica(request) else SessionLocal,
+            formato, gzip, fecha_inicio, fecha_fin
+        ),
+        media_type=media_type,
+        headers=headers
+    )
+
+
 @router.put("/by-id/{produccion_id}")
-def update_produccion_huevos(
+async def update_produccion_huevos(
     produccion_id: int,
     produccion: ProduccionHuevosUpdate,
-    db: Session = Depends(get_db),
+    stock_unidad: UnidadStock = Query(None, description=STOCK_UNIDAD_DESCRIPCION),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
-        if not verify_permissions(db, id_rol, modulo, 'actualizar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'actualizar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
+        await _verificar_permiso_stock(db, id_rol, stock_unidad, 'actualizar')
 
-        success = crud_produccion.update_produccion_huevos_by_id(db, produccion_id, produccion)
+        success = await run_db(
+            db,
+            crud_produccion.update_produccion_huevos_by_id,
+            produccion_id,
+            produccion,
+            stock_unidad
+        )
         if not success:
             raise HTTPException(status_code=400, detail="No se pudo actualizar la producción de huevos")
         return {"message": "Producción de huevos actualizada correctamente"}
@@ -101,9 +558,9 @@ def update_produccion_huevos(
 
 
 @router.delete("/by-id/{produccion_id}")
-def delete_produccion_huevos(
+async def delete_produccion_huevos(
     produccion_id: int,
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     """
@@ -111,11 +568,11 @@ def delete_produccion_huevos(
     """
     try:
         id_rol = user_token.id_rol
-        if not verify_permissions(db, id_rol, modulo, 'borrar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'borrar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
         # Eliminar la producción
-        success = crud_produccion.delete_produccion_huevos_by_id(db, produccion_id)
+        success = await run_db(db, crud_produccion.delete_produccion_huevos_by_id, produccion_id)
         if not success:
             raise HTTPException(status_code=400, detail="No se pudo eliminar la producción de huevos")
         
@@ -1,13 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, Header, HTTPException, Response, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.exc import SQLAlchemyError
-from typing import List
+from typing import List, Optional
+import asyncio
+import json
 
 from app.crud.permisos import verify_permissions
 from app.router.dependencies import get_current_user
 from app.schemas.users import UserOut
-from app.schemas.stock import StockCreate, StockUpdate, StockOut
-from core.database import get_db
+from app.schemas.stock import StockCreate, StockUpdate, StockOut, StockDelta, StockDeltaOut
+from core.config import settings
+from core.database import DbSession, get_session, run_db, run_db_shared
+from core.serialization import json_list
 from app.crud import crud_stock
 
 
@@ -15,70 +19,179 @@ from app.crud import crud_stock
 router = APIRouter()
 modulo = 5  # Ajusta el módulo correspondiente para stock
 
+
+def _etag(version: int) -> str:
+    return f'"{version}"'
+
+
+def _version_if_match(if_match: Optional[str]) -> Optional[int]:
+    """
+    Versión pedida en If-Match ("3"); None si no se envió o es "*".
+
+    If-Match usa comparación fuerte (RFC 9110, sección 13.1.1): un ETag débil
+    (W/"3") nunca coincide y se responde 412.
+    """
+    if if_match is None or if_match.strip() == "*":
+        return None
+    valor = if_match.strip()
+    if valor.startswith("W/"):
+        raise HTTPException(status_code=412, detail="If-Match con ETag débil no coincide")
+    try:
+        return int(valor.strip('"'))
+    except ValueError:
+        raise HTTPException(status_code=412, detail="If-Match inválido")
+
 @router.post("/crear", status_code=status.HTTP_201_CREATED)
-def create_stock(
+async def create_stock(
     stock: StockCreate,
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
-        if not verify_permissions(db, id_rol, modulo, 'insertar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'insertar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
         
-        crud_stock.create_stock(db, stock)
+        await run_db(db, crud_stock.create_stock, stock)
         return {"message": "Stock creado correctamente"}
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/by-id/{id_producto}", response_model=StockOut)
-def get_stock(
+async def get_stock(
     id_producto: int,
-    db: Session = Depends(get_db),
+    response: Response,
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
-        if not verify_permissions(db, id_rol, modulo, 'seleccionar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
         
-        stock = crud_stock.get_stock_by_id(db, id_producto)
+        stock = await run_db(db, crud_stock.get_stock_by_id, id_producto)
         if not stock:
             raise HTTPException(status_code=404, detail="Stock no encontrado")
+        # La versión de la fila sirve como ETag para enviarla en If-Match al actualizar
+        response.headers["ETag"] = _etag(stock["version"])
         return stock
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/all", response_model=List[StockOut])
-def get_all_stock(
-    db: Session = Depends(get_db),
+async def get_all_stock(
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
-        if not verify_permissions(db, id_rol, modulo, 'seleccionar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        stocks = crud_stock.get_all_stock(db)
-        return stocks
+        stocks = await run_db_shared(db, crud_stock.get_all_stock)
+        return json_list(StockOut, stocks)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
+@router.get("/stream")
+async def stream_stock(
+    db: DbSession = Depends(get_session),
+    user_token: UserOut = Depends(get_current_user)
+):
+    """
+    Server-Sent Events con el stock disponible.
+
+    Al conectarse se envía un evento `snapshot` con todas las filas (desde memoria
+    si el worker ya tiene suscriptores) y luego un evento `stock` por cada cambio,
+    con `id_producto` y los campos modificados. Cada SSE_HEARTBEAT_SECONDS se
+    envía un comentario para mantener abierta la conexión.
+    """
+    id_rol = user_token.id_rol
+    if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
+        raise HTTPException(status_code=401, detail="Usuario no autorizado")
+
+    # Se suscribe antes de leer el snapshot para no perder cambios intermedios
+    queue = crud_stock.stock_events.subscribe()
+    try:
+        snapshot = await crud_stock.stock_events.snapshot()
+    except Exception:
+        crud_stock.stock_events.unsubscribe(queue)
+        raise HTTPException(status_code=500, detail="Error al obtener el stock")
+
+    async def eventos():
+        try:
+            yield f"event: snapshot\ndata: {json.dumps(snapshot, default=str)}\n\n"
+            while True:
+                try:
+                    mensaje = await asyncio.wait_for(queue.get(), settings.SSE_HEARTBEAT_SECONDS)
+                except asyncio.TimeoutError:
+                    yield ": ping\n\n"
+                    continue
+                if mensaje is None:
+                    # El cliente se atrasó demasiado: al reconectar recibe un snapshot nuevo
+                    return
+                seq, event = mensaje
+                yield f"id: {seq}\nevent: stock\ndata: {json.dumps(event, default=str)}\n\n"
+        finally:
+            crud_stock.stock_events.unsubscribe(queue)
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @router.put("/by-id/{id_producto}")
-def update_stock(
+async def update_stock(
     id_producto: int,
     stock: StockUpdate,
-    db: Session = Depends(get_db),
+    response: Response,
+    if_match: Optional[str] = Header(None),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
+    """
+    Actualiza el stock. Con la cabecera If-Match (ETag de GET /stock/by-id) solo se
+    actualiza si nadie lo modificó desde esa lectura; si cambió responde 412.
+    """
     try:
         id_rol = user_token.id_rol
-        if not verify_permissions(db, id_rol, modulo, 'actualizar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'actualizar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
-        
-        success = crud_stock.update_stock_by_id(db, id_producto, stock)
-        if not success:
+
+        version = _version_if_match(if_match)
+        nueva_version = await run_db(db, crud_stock.update_stock_by_id, id_producto, stock, version)
+        if nueva_version is None:
+            if version is not None and await run_db(db, crud_stock.get_stock_by_id, id_producto):
+                raise HTTPException(status_code=412, detail="El stock fue modificado por otra operación")
             raise HTTPException(status_code=400, detail="No se pudo actualizar el stock")
+        response.headers["ETag"] = _etag(nueva_version)
         return {"message": "Stock actualizado correctamente"}
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/by-id/{id_producto}/ajuste", response_model=StockDeltaOut)
+async def ajustar_stock(
+    id_producto: int,
+    ajuste: StockDelta,
+    db: DbSession = Depends(get_session),
+    user_token: UserOut = Depends(get_current_user)
+):
+    """
+    Suma o resta unidades de forma atómica (por ejemplo, una venta resta).
+    Responde 409 si el stock quedaría negativo; no requiere leer antes el stock.
+    """
+    try:
+        id_rol = user_token.id_rol
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'actualizar'):
+            raise HTTPException(status_code=401, detail="Usuario no autorizado")
+
+        try:
+            cantidad = await run_db(db, crud_stock.increment_stock, id_producto, ajuste.delta)
+        except ValueError as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        if cantidad is None:
+            raise HTTPException(status_code=404, detail="Stock no encontrado")
+        return {"id_producto": id_producto, "cantidad_disponible": cantidad}
+    except SQLAlchemyError as e:
+        raise HTTPException(status_code=500, detail=str(e))
@@ -1,5 +1,4 @@
-from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Depends, HTTPException, Request, status
 from sqlalchemy.exc import SQLAlchemyError
 from typing import List
 
@@ -7,7 +6,9 @@ from app.crud.permisos import verify_permissions
 from app.router.dependencies import get_current_user
 from app.schemas.users import UserOut
 from app.schemas.tipo_huevos import TipoHuevosCreate, TipoHuevosUpdate, TipoHuevosOut
-from core.database import get_db
+from core.database import DbSession, get_session, lee_de_replica, run_db
+from core.response_cache import cached_response
+from core.serialization import dump_list
 from app.crud import tipo_huevos as crud_tipo_huevos
 
 
@@ -16,67 +17,81 @@ router = APIRouter()
 modulo = 6  # Ajusta según tu esquema de módulos
 
 @router.post("/crear", status_code=status.HTTP_201_CREATED)
-def create_tipo_huevo(
+async def create_tipo_huevo(
     tipo_huevo: TipoHuevosCreate,
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
-        if not verify_permissions(db, id_rol, modulo, 'insertar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'insertar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        crud_tipo_huevos.create_tipo_huevo(db, tipo_huevo)
+        await run_db(db, crud_tipo_huevos.create_tipo_huevo, tipo_huevo)
         return {"message": "Tipo de huevo creado correctamente"}
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/by-id/{id_tipo_huevo}", response_model=TipoHuevosOut)
-def get_tipo_huevo(
+async def get_tipo_huevo(
     id_tipo_huevo: int,
-    db: Session = Depends(get_db),
+    request: Request,
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
-        if not verify_permissions(db, id_rol, modulo, 'seleccionar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        tipo_huevo = crud_tipo_huevos.get_tipo_huevo_by_id(db, id_tipo_huevo)
-        if not tipo_huevo:
-            raise HTTPException(status_code=404, detail="Tipo de huevo no encontrado")
-        return tipo_huevo
+        llave = ("by-id", id_tipo_huevo)
+        entrada = crud_tipo_huevos.respuestas.get(llave)
+        if entrada is None:
+            generacion = crud_tipo_huevos.respuestas.generation()
+            tipo_huevo = await run_db(db, crud_tipo_huevos.get_tipo_huevo_by_id, id_tipo_huevo)
+            if not tipo_huevo:
+                raise HTTPException(status_code=404, detail="Tipo de huevo no encontrado")
+            body = TipoHuevosOut.model_validate(dict(tipo_huevo)).model_dump_json().encode()
+            entrada = crud_tipo_huevos.respuestas.put(llave, body, generacion, guardar=not lee_de_replica(db))
+        return cached_response(request, entrada)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/all", response_model=List[TipoHuevosOut])
-def get_all_tipo_huevos(
-    db: Session = Depends(get_db),
+async def get_all_tipo_huevos(
+    request: Request,
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
-        if not verify_permissions(db, id_rol, modulo, 'seleccionar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        tipos = crud_tipo_huevos.get_all_tipo_huevos(db)
-        return tipos
+        entrada = crud_tipo_huevos.respuestas.get("all")
+        if entrada is None:
+            generacion = crud_tipo_huevos.respuestas.generation()
+            tipos = await run_db(db, crud_tipo_huevos.get_all_tipo_huevos)
+            entrada = crud_tipo_huevos.respuestas.put(
+                "all", dump_list(TipoHuevosOut, tipos), generacion, guardar=not lee_de_replica(db)
+            )
+        return cached_response(request, entrada)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/by-id/{id_tipo_huevo}")
-def update_tipo_huevo(
+async def update_tipo_huevo(
     id_tipo_huevo: int,
     tipo_huevo: TipoHuevosUpdate,
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
-        if not verify_permissions(db, id_rol, modulo, 'actualizar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'actualizar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        success = crud_tipo_huevos.update_tipo_huevo_by_id(db, id_tipo_huevo, tipo_huevo)
+        success = await run_db(db, crud_tipo_huevos.update_tipo_huevo_by_id, id_tipo_huevo, tipo_huevo)
         if not success:
             raise HTTPException(status_code=400, detail="No se pudo actualizar el tipo de huevo")
         return {"message": "Tipo de huevo actualizado correctamente"}
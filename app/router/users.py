@@ -1,21 +1,22 @@
 from typing import List
 from app.schemas.users import UserOut
 from fastapi import APIRouter, Depends, HTTPException, status
-from sqlalchemy.orm import Session
 from sqlalchemy.exc import SQLAlchemyError
-from core.database import get_db
+from core.database import DbSession, get_session, run_db, run_db_shared
+from core.serialization import json_list
 from app.schemas.users import UserCreate, UserUpdate
 from app.crud import users as crud_users
 from app.router.dependencies import get_current_user
 from app.crud.permisos import verify_permissions
+from core.security import PasswordQueueFull, password_verifier
 
 router = APIRouter()
 modulo = 1
 
 @router.post("/crear", status_code=status.HTTP_201_CREATED)
-def create_user(
+async def create_user(
     user: UserCreate, 
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
@@ -25,27 +26,35 @@ def create_user(
         else:
             modulo = 1
 
-        if not verify_permissions(db, id_rol, modulo, 'insertar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'insertar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        crud_users.create_user(db, user)
+        # bcrypt en el pool de contraseñas: en modo DB_ASYNC run_db corre en el hilo del event loop
+        pass_hash = await password_verifier.hash(user.pass_hash)
+        await run_db(db, crud_users.create_user, user, pass_hash)
         return {"message": "Usuario creado correctamente"}
+    except PasswordQueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Demasiadas operaciones de contraseña simultáneas, intente de nuevo",
+            headers={"Retry-After": "1"},
+        )
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.get("/by-email", response_model = UserOut)
-def get_user(
+async def get_user(
     email: str, 
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
         if not email == user_token.email:
-            if not verify_permissions(db, id_rol, modulo, 'seleccionar'):
+            if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
                 raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        user = crud_users.get_user_by_email(db, email)
+        user = await run_db(db, crud_users.get_user_by_email, email)
         if not user:
             raise HTTPException(status_code=404, detail="Usuario no encontrado")
         return user 
@@ -54,37 +63,37 @@ def get_user(
 
 
 @router.get("/all-except-admins", response_model = List[UserOut])
-def get_users(
-    db: Session = Depends(get_db),
+async def get_users(
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
         
-        if not verify_permissions(db, id_rol, modulo, 'seleccionar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'seleccionar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        users = crud_users.get_all_user_except_admins(db)
+        users = await run_db_shared(db, crud_users.get_all_user_except_admins)
         # if not users:
         #     raise HTTPException(status_code=404, detail="Usuario no encontrado")
-        return users
+        return json_list(UserOut, users)
     except SQLAlchemyError as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 @router.put("/by-id/{user_id}")
-def update_user(
+async def update_user(
     user_id: int, 
     user: UserUpdate, 
-    db: Session = Depends(get_db),
+    db: DbSession = Depends(get_session),
     user_token: UserOut = Depends(get_current_user)
 ):
     try:
         id_rol = user_token.id_rol
 
-        if not verify_permissions(db, id_rol, modulo, 'insertar'):
+        if not await run_db(db, verify_permissions, id_rol, modulo, 'insertar'):
             raise HTTPException(status_code=401, detail="Usuario no autorizado")
 
-        success = crud_users.update_user(db, user_id, user)
+        success = await run_db(db, crud_users.update_user, user_id, user)
         if not success:
             raise HTTPException(status_code=400, detail="No se pudo actualizar el usuario")
         return {"message": "Usuario actualizado correctamente"}
@@ -21,4 +21,18 @@ class FincaEstado(BaseModel):
     estado: Optional[bool] = None
 
 class FincaOut(FincaBase):
-    id_finca: int
\ No newline at end of file
+    id_finca: int
+
+class FincaCercana(FincaOut):
+    distancia_km: float
+
+class FincaCluster(BaseModel):
+    latitud: float
+    longitud: float
+    cantidad: int
+    min_lat: float
+    min_lon: float
+    max_lat: float
+    max_lon: float
+    # Solo cuando el cluster es una única finca
+    id_finca: Optional[int] = None
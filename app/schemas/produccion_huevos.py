@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import Optional
+from typing import List, Optional
 from datetime import date
 
 class ProduccionHuevosBase(BaseModel):
@@ -26,3 +26,28 @@ class ProduccionHuevosOut(BaseModel):
 
     class Config:
         orm_mode = True
+
+class ProduccionHuevosPage(BaseModel):
+    items: List[ProduccionHuevosOut]
+    next_cursor: Optional[str] = None
+
+class ProduccionResumenOut(BaseModel):
+    inicio: date
+    id_grupo: Optional[int] = None
+    nombre_grupo: Optional[str] = None
+    cantidad: int
+
+class ProduccionHuevosLoteError(BaseModel):
+    indice: int
+    detalle: str
+
+class ProduccionHuevosLoteOut(BaseModel):
+    ids: List[Optional[int]]
+    creados: int
+    errores: List[ProduccionHuevosLoteError]
+
+class ProduccionHuevosIncremento(BaseModel):
+    id_galpon: int = Field(..., gt=0)
+    cantidad: int = Field(..., gt=0)
+    fecha: date = Field(default_factory=date.today)
+    id_tipo_huevo: int = Field(..., gt=0)
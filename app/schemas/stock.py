@@ -16,3 +16,10 @@ class StockUpdate(BaseModel):
 
 class StockOut(StockBase):
     id_producto: int
+
+class StockDelta(BaseModel):
+    delta: int = Field(..., description="Unidades a sumar (positivo) o restar (negativo)")
+
+class StockDeltaOut(BaseModel):
+    id_producto: int
+    cantidad_disponible: int
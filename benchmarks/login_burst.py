@@ -0,0 +1,109 @@
+"""
+Latencia de peticiones que no son login durante una ráfaga de inicios de sesión.
+
+Compara la verificación bcrypt en el event loop (como antes) con el pool de
+`core.security.password_verifier`. Mientras `--logins` inicios de sesión llegan
+a la vez, un cliente hace peticiones livianas seguidas y se reportan sus
+percentiles de latencia. No usa la base de datos: solo mide el costo de bcrypt.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.login_burst --logins 50 --executor process --workers 4
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI, HTTPException
+
+from core.security import PasswordVerifier, get_hashed_password, verify_password
+
+CLAVE = "clave-de-prueba"
+
+
+def crear_app(verifier: PasswordVerifier, hashed: str) -> FastAPI:
+    app = FastAPI()
+
+    @app.post("/login-en-loop")
+    async def login_en_loop():
+        # Comportamiento anterior: bcrypt bloquea el event loop del worker
+        if not verify_password(CLAVE, hashed):
+            raise HTTPException(status_code=401)
+        return {"ok": True}
+
+    @app.post("/login")
+    async def login():
+        if not await verifier.verify(CLAVE, hashed):
+            raise HTTPException(status_code=401)
+        return {"ok": True}
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+async def medir(client: httpx.AsyncClient, ruta_login: str, logins: int, intervalo: float = 0.005) -> dict:
+    latencias = []
+    terminado = asyncio.Event()
+
+    async def trafico():
+        # Una petición cada `intervalo`; la latencia se mide desde el momento en que
+        # debía salir, así también cuenta el tiempo que el event loop la tuvo esperando
+        programada = time.perf_counter()
+        while True:
+            await client.get("/ping")
+            latencias.append(time.perf_counter() - programada)
+            if terminado.is_set():
+                break
+            programada += intervalo
+            await asyncio.sleep(max(0.0, programada - time.perf_counter()))
+
+    tarea = asyncio.create_task(trafico())
+    # Que el tráfico ya esté en curso cuando empieza la ráfaga
+    await asyncio.sleep(0.05)
+    inicio = time.perf_counter()
+    respuestas = await asyncio.gather(*(client.post(ruta_login) for _ in range(logins)))
+    duracion = time.perf_counter() - inicio
+    terminado.set()
+    await tarea
+
+    latencias.sort()
+    return {
+        "logins_ok": sum(r.status_code == 200 for r in respuestas),
+        "duracion_s": duracion,
+        "pings": len(latencias),
+        "p50_ms": statistics.median(latencias) * 1000,
+        "p99_ms": latencias[min(len(latencias) - 1, int(len(latencias) * 0.99))] * 1000,
+        "max_ms": latencias[-1] * 1000,
+    }
+
+
+async def main(args) -> None:
+    hashed = get_hashed_password(CLAVE)
+    verifier = PasswordVerifier(args.executor, args.workers, max_pending=max(args.logins, 1))
+    app = crear_app(verifier, hashed)
+    transport = httpx.ASGITransport(app=app)
+    try:
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+            # Calentamiento: arranca los procesos del pool antes de medir
+            await client.post("/login")
+            for nombre, ruta in (("bcrypt en el event loop", "/login-en-loop"), (f"pool {args.executor}", "/login")):
+                r = await medir(client, ruta, args.logins)
+                print(
+                    f"{nombre:<24} {r['logins_ok']} logins en {r['duracion_s']:.2f}s | "
+                    f"{r['pings']} pings p50={r['p50_ms']:.1f}ms p99={r['p99_ms']:.1f}ms max={r['max_ms']:.1f}ms"
+                )
+    finally:
+        verifier.shutdown()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--logins", type=int, default=50)
+    parser.add_argument("--executor", choices=("process", "thread"), default="process")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,83 @@
+"""
+Serialización de listados grandes: response_model (un modelo pydantic por fila) frente
+a core.serialization.json_list (una sola llamada de pydantic-core).
+
+Las filas salen de SQLite en memoria como RowMapping, igual que de app.crud, con una
+columna extra que el modelo descarta. Antes de medir se comprueba que ambos caminos
+producen los mismos bytes. Para UserOut se mide también la primera llamada ("frío"):
+los emails se validan con email_validator la primera vez y luego se recuerdan.
+
+Uso (desde la raíz del proyecto):
+    python -m benchmarks.serialization --rows 10000
+"""
+import argparse
+import os
+import time
+from typing import List
+
+# core.config exige un secreto JWT al importarse
+os.environ.setdefault("JWT_SECRET", "benchmark")
+
+from pydantic import TypeAdapter
+from sqlalchemy import create_engine, text
+
+from app.schemas.fincas import FincaOut
+from app.schemas.produccion_huevos import ProduccionHuevosOut
+from app.schemas.users import UserOut
+from core import serialization
+
+TABLAS = [
+    (ProduccionHuevosOut, "produccion", """
+        CREATE TABLE produccion (id_produccion INT, nombre_galpon TEXT, cantidad INT, fecha DATE, "tamaño" TEXT, extra INT)
+    """, "INSERT INTO produccion VALUES (:i, 'G1', :i, '2024-01-02', 'grande', 1)"),
+    (UserOut, "usuarios", """
+        CREATE TABLE usuarios (id_usuario INT, nombre TEXT, id_rol INT, email TEXT, telefono TEXT,
+                               documento TEXT, estado BOOL, nombre_rol TEXT, extra INT)
+    """, "INSERT INTO usuarios VALUES (:i, 'Nombre', 3, 'usuario' || :i || '@example.com', '3001234567', "
+         "'12345678', 1, 'operario', 1)"),
+    (FincaOut, "fincas", """
+        CREATE TABLE fincas (id_finca INT, nombre TEXT, longitud FLOAT, latitud FLOAT, id_usuario INT, estado BOOL, extra INT)
+    """, "INSERT INTO fincas VALUES (:i, 'Finca', -74.1, 4.6, 1, 1, 1)"),
+]
+
+
+def con_modelo(model, rows) -> bytes:
+    # Lo que hace FastAPI con response_model
+    return TypeAdapter(List[model]).dump_json([model.model_validate(dict(row)) for row in rows])
+
+
+def medir_ms(fn, repeticiones: int) -> float:
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        fn()
+    return (time.perf_counter() - inicio) / repeticiones * 1000
+
+
+def main(args) -> None:
+    engine = create_engine("sqlite://")
+    with engine.begin() as conn:
+        for _, tabla, crear, insertar in TABLAS:
+            conn.execute(text(crear))
+            conn.execute(text(insertar), [{"i": i} for i in range(args.rows)])
+
+    print(f"{args.rows} filas por listado")
+    with engine.connect() as conn:
+        for model, tabla, _, _ in TABLAS:
+            rows = conn.execute(text(f"SELECT * FROM {tabla}")).mappings().all()
+            serialization._email.cache_clear()
+            frio = medir_ms(lambda: serialization.dump_list(model, rows), 1)
+            assert serialization.dump_list(model, rows) == con_modelo(model, rows), model.__name__
+
+            antes = medir_ms(lambda: con_modelo(model, rows), args.repeat)
+            ahora = medir_ms(lambda: serialization.dump_list(model, rows), args.repeat)
+            print(
+                f"{model.__name__:<20} response_model {antes:7.1f} ms | json_list {ahora:6.1f} ms "
+                f"(primera llamada {frio:6.1f} ms)"
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=10000)
+    parser.add_argument("--repeat", type=int, default=5)
+    main(parser.parse_args())
@@ -0,0 +1,325 @@
+"""
+Índice de clusters por nivel de zoom para mostrar muchas ubicaciones en un mapa.
+
+Los puntos se agrupan en una grilla sobre coordenadas de píxel Web Mercator (las
+mismas de los mapas de teselas): en el zoom z el mundo mide 256·2^z píxeles y cada
+celda `cell_px` píxeles. Como el mundo duplica su tamaño en cada zoom, una celda del
+zoom z contiene exactamente 4 celdas del zoom z+1; así un cambio toca una celda por
+nivel y el bbox de una celda se recalcula solo desde sus 4 hijas.
+
+El índice vive en memoria de cada worker: se carga con `load_fn` en la primera
+consulta, las funciones de app.crud lo actualizan después del commit y se recarga
+completo cada `max_age` segundos para incluir los cambios hechos en otros workers.
+Los cambios que llegan mientras se recarga se guardan y se aplican sobre el índice
+nuevo antes de reemplazar al anterior.
+"""
+from math import cos, floor, log, pi, radians, tan
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+import threading
+import time
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
+
+# Límite de latitud de Web Mercator
+LAT_MAX = 85.05112878
+
+Celda = Tuple[int, int]
+
+
+class _Grupo:
+    __slots__ = ("cantidad", "suma_lat", "suma_lon", "suma_ids", "min_lat", "min_lon", "max_lat", "max_lon")
+
+    def __init__(self):
+        self.cantidad = 0
+        self.suma_lat = 0.0
+        self.suma_lon = 0.0
+        # Con un solo punto, la suma de ids es su id
+        self.suma_ids = 0
+        self.min_lat = self.min_lon = float("inf")
+        self.max_lat = self.max_lon = float("-inf")
+
+    def agregar(self, id_punto: int, lat: float, lon: float) -> None:
+        self.cantidad += 1
+        self.suma_lat += lat
+        self.suma_lon += lon
+        self.suma_ids += id_punto
+        self.min_lat = min(self.min_lat, lat)
+        self.min_lon = min(self.min_lon, lon)
+        self.max_lat = max(self.max_lat, lat)
+        self.max_lon = max(self.max_lon, lon)
+
+    def quitar(self, id_punto: int, lat: float, lon: float) -> bool:
+        """
+        Descuenta el punto; retorna True si estaba en el borde del bbox y hay que recalcularlo.
+        """
+        self.cantidad -= 1
+        self.suma_lat -= lat
+        self.suma_lon -= lon
+        self.suma_ids -= id_punto
+        return lat in (self.min_lat, self.max_lat) or lon in (self.min_lon, self.max_lon)
+
+    def combinar(self, otro: "_Grupo") -> None:
+        self.cantidad += otro.cantidad
+        self.suma_lat += otro.suma_lat
+        self.suma_lon += otro.suma_lon
+        self.suma_ids += otro.suma_ids
+        self.min_lat = min(self.min_lat, otro.min_lat)
+        self.min_lon = min(self.min_lon, otro.min_lon)
+        self.max_lat = max(self.max_lat, otro.max_lat)
+        self.max_lon = max(self.max_lon, otro.max_lon)
+
+    def bbox_desde(self, grupos: Iterable["_Grupo"]) -> None:
+        self.min_lat = self.min_lon = float("inf")
+        self.max_lat = self.max_lon = float("-inf")
+        for grupo in grupos:
+            self.min_lat = min(self.min_lat, grupo.min_lat)
+            self.min_lon = min(self.min_lon, grupo.min_lon)
+            self.max_lat = max(self.max_lat, grupo.max_lat)
+            self.max_lon = max(self.max_lon, grupo.max_lon)
+
+    def como_dict(self) -> Dict[str, Any]:
+        return {
+            "latitud": self.suma_lat / self.cantidad,
+            "longitud": self.suma_lon / self.cantidad,
+            "cantidad": self.cantidad,
+            "min_lat": self.min_lat,
+            "min_lon": self.min_lon,
+            "max_lat": self.max_lat,
+            "max_lon": self.max_lon,
+            "id_punto": self.suma_ids if self.cantidad == 1 else None,
+        }
+
+
+class ClusterIndex:
+    """
+    Clusters (centroide, cantidad, bbox) por zoom de 0 a `max_zoom`.
+
+    - `upsert` / `remove` actualizan todos los niveles (O(max_zoom) por cambio).
+    - `clusters(db, zoom, ...)` retorna los clusters cuyas celdas tocan el viewport;
+      con zoom mayor que `max_zoom` se usa el último nivel.
+    - `load_fn(db)` retorna (id, latitud, longitud) de todos los puntos.
+    - `session_factory()` entrega una sesión síncrona para cargar en el threadpool
+      cuando `clusters` se llama dentro de run_sync (modo DB_ASYNC, en el hilo del
+      event loop); con la Session de la petición se carga con ella en su hilo.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        load_fn: Callable[[Any], Iterable[Tuple[int, float, float]]],
+        session_factory: Callable[[], Any],
+        max_zoom: int = 16,
+        cell_px: int = 64,
+        max_age: float = 300
+    ):
+        self.name = name
+        self.load_fn = load_fn
+        self.session_factory = session_factory
+        self.max_zoom = max_zoom
+        self.cell_px = cell_px
+        self.max_age = max_age
+        self._lock = threading.Lock()
+        # Una carga a la vez; mientras corre, upsert/remove se anotan aquí para repetirlos
+        self._carga_lock = threading.Lock()
+        self._cambios: Optional[List[Tuple[int, Optional[float], Optional[float]]]] = None
+        self._puntos: Optional[Dict[int, Tuple[float, float]]] = None
+        self._niveles: List[Dict[Celda, _Grupo]] = []
+        # Puntos de cada celda del zoom máximo, para recalcular su bbox al quitar uno
+        self._hojas: Dict[Celda, Dict[int, Tuple[float, float]]] = {}
+        self._cargado_en = 0.0
+
+    def _celda(self, lat: float, lon: float) -> Celda:
+        """
+        Celda del punto en el zoom máximo; la del zoom z es (x >> (max_zoom - z), y >> ...).
+        """
+        lat = max(-LAT_MAX, min(LAT_MAX, lat))
+        escala = 256 * (1 << self.max_zoom) / self.cell_px
+        x = (lon + 180.0) / 360.0 * escala
+        y = (1.0 - log(tan(radians(lat)) + 1.0 / cos(radians(lat))) / pi) / 2.0 * escala
+        ultima = int(escala) - 1
+        return min(max(floor(x), 0), ultima), min(max(floor(y), 0), ultima)
+
+    def _agregar(self, id_punto: int, lat: float, lon: float) -> None:
+        x, y = self._celda(lat, lon)
+        for zoom in range(self.max_zoom, -1, -1):
+            desplazamiento = self.max_zoom - zoom
+            celda = (x >> desplazamiento, y >> desplazamiento)
+            grupo = self._niveles[zoom].get(celda)
+            if grupo is None:
+                grupo = self._niveles[zoom][celda] = _Grupo()
+            grupo.agregar(id_punto, lat, lon)
+        self._puntos[id_punto] = (lat, lon)
+        self._hojas.setdefault((x, y), {})[id_punto] = (lat, lon)
+
+    def _quitar(self, id_punto: int) -> None:
+        lat, lon = self._puntos.pop(id_punto)
+        x, y = self._celda(lat, lon)
+        hoja = self._hojas[(x, y)]
+        del hoja[id_punto]
+        if not hoja:
+            del self._hojas[(x, y)]
+        # Del zoom máximo hacia arriba: las celdas hijas ya están actualizadas al recalcular el bbox
+        for zoom in range(self.max_zoom, -1, -1):
+            desplazamiento = self.max_zoom - zoom
+            cx, cy = x >> desplazamiento, y >> desplazamiento
+            nivel = self._niveles[zoom]
+            grupo = nivel[(cx, cy)]
+            en_borde = grupo.quitar(id_punto, lat, lon)
+            if grupo.cantidad == 0:
+                del nivel[(cx, cy)]
+            elif en_borde:
+                if zoom == self.max_zoom:
+                    grupo.bbox_desde(self._miembros(cx, cy))
+                else:
+                    hijas = self._niveles[zoom + 1]
+                    grupo.bbox_desde(
+                        hijas[hija] for hija in (
+                            (2 * cx, 2 * cy), (2 * cx + 1, 2 * cy), (2 * cx, 2 * cy + 1), (2 * cx + 1, 2 * cy + 1)
+                        ) if hija in hijas
+                    )
+
+    def _miembros(self, cx: int, cy: int) -> Iterable[_Grupo]:
+        for id_punto, (lat, lon) in self._hojas.get((cx, cy), {}).items():
+            grupo = _Grupo()
+            grupo.agregar(id_punto, lat, lon)
+            yield grupo
+
+    def _cargar(self, db: Any) -> None:
+        with self._lock:
+            self._cambios = []
+        try:
+            self._construir(db)
+        finally:
+            with self._lock:
+                self._cambios = None
+
+    def _construir(self, db: Any) -> None:
+        # Se construye fuera del lock (las consultas siguen usando el índice anterior):
+        # primero el zoom máximo y luego cada nivel combinando las celdas del siguiente
+        puntos: Dict[int, Tuple[float, float]] = {}
+        hojas: Dict[Celda, Dict[int, Tuple[float, float]]] = {}
+        ultimo: Dict[Celda, _Grupo] = {}
+        for id_punto, lat, lon in self.load_fn(db):
+            celda = self._celda(lat, lon)
+            puntos[id_punto] = (lat, lon)
+            hojas.setdefault(celda, {})[id_punto] = (lat, lon)
+            grupo = ultimo.get(celda)
+            if grupo is None:
+                grupo = ultimo[celda] = _Grupo()
+            grupo.agregar(id_punto, lat, lon)
+
+        niveles = [ultimo]
+        for _ in range(self.max_zoom):
+            nivel: Dict[Celda, _Grupo] = {}
+            for (x, y), hija in niveles[-1].items():
+                padre = nivel.get((x >> 1, y >> 1))
+                if padre is None:
+                    padre = nivel[(x >> 1, y >> 1)] = _Grupo()
+                padre.combinar(hija)
+            niveles.append(nivel)
+        niveles.reverse()
+
+        with self._lock:
+            self._puntos = puntos
+            self._hojas = hojas
+            self._niveles = niveles
+            self._cargado_en = time.monotonic()
+            # La consulta pudo leer filas anteriores a estos cambios: se repiten en orden
+            # sobre el índice nuevo antes de que otra consulta lo vea
+            for id_punto, lat, lon in self._cambios:
+                self._aplicar(id_punto, lat, lon)
+
+    def _aplicar(self, id_punto: int, lat: Optional[float], lon: Optional[float]) -> None:
+        # lat None = quitar el punto
+        if id_punto in self._puntos:
+            self._quitar(id_punto)
+        if lat is not None:
+            self._agregar(id_punto, lat, lon)
+
+    def _vencido(self) -> bool:
+        return self._puntos is None or time.monotonic() - self._cargado_en > self.max_age
+
+    def _recargar(self, db: Any) -> None:
+        # Con un índice ya cargado, si otra consulta lo está recargando se sigue usando
+        # el anterior; sin índice, se espera a que termine esa carga
+        if not self._carga_lock.acquire(blocking=self._puntos is None):
+            return
+        try:
+            if self._vencido():
+                self._cargar(db)
+        finally:
+            self._carga_lock.release()
+
+    def _recargar_en_hilo(self) -> None:
+        db = self.session_factory()
+        try:
+            self._recargar(db)
+        finally:
+            db.close()
+
+    def _registrar(self, id_punto: int, lat: Optional[float], lon: Optional[float]) -> None:
+        with self._lock:
+            if self._cambios is not None:
+                self._cambios.append((id_punto, lat, lon))
+            if self._puntos is not None:
+                self._aplicar(id_punto, lat, lon)
+            # sin índice todavía: se cargará completo en la primera consulta
+
+    def upsert(self, id_punto: int, lat: float, lon: float) -> None:
+        self._registrar(id_punto, lat, lon)
+
+    def remove(self, id_punto: int) -> None:
+        self._registrar(id_punto, None, None)
+
+    def clusters(
+        self,
+        db: Any,
+        zoom: int,
+        min_lat: float,
+        min_lon: float,
+        max_lat: float,
+        max_lon: float
+    ) -> List[Dict[str, Any]]:
+        """
+        Clusters del zoom cuyas celdas tocan el viewport. Si min_lon > max_lon el
+        viewport cruza el meridiano 180.
+        """
+        if self._vencido():
+            if in_greenlet():
+                # Dentro de run_sync (hilo del event loop): la consulta y la construcción
+                # de los niveles toman segundos con muchos puntos, así que van al threadpool
+                await_only(run_in_threadpool(self._recargar_en_hilo))
+            else:
+                self._recargar(db)
+
+        zoom = min(zoom, self.max_zoom)
+        desplazamiento = self.max_zoom - zoom
+        rangos_lon = [(min_lon, max_lon)] if min_lon <= max_lon else [(min_lon, 180.0), (-180.0, max_lon)]
+        resultado = []
+        with self._lock:
+            nivel = self._niveles[zoom]
+            for desde_lon, hasta_lon in rangos_lon:
+                x0, y0 = self._celda(max_lat, desde_lon)
+                x1, y1 = self._celda(min_lat, hasta_lon)
+                x0, y0, x1, y1 = (v >> desplazamiento for v in (x0, y0, x1, y1))
+                if (x1 - x0 + 1) * (y1 - y0 + 1) <= len(nivel):
+                    celdas = (
+                        (celda, nivel[celda])
+                        for celda in ((x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1))
+                        if celda in nivel
+                    )
+                else:
+                    celdas = nivel.items()
+                for (x, y), grupo in celdas:
+                    if x0 <= x <= x1 and y0 <= y <= y1:
+                        resultado.append(grupo.como_dict())
+        return resultado
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "puntos": len(self._puntos or {}),
+                "celdas": sum(len(nivel) for nivel in self._niveles),
+            }
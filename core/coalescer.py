@@ -0,0 +1,157 @@
+"""
+Acumulador de escrituras en memoria para ingestas de alta frecuencia.
+
+Los incrementos se suman por clave en un diccionario y se escriben en lote cada
+`interval_ms` milisegundos o cuando llegan `max_events` eventos, lo que ocurra
+primero. Así miles de transacciones pequeñas por minuto se convierten en unas
+pocas. Cada worker tiene su propio acumulador.
+"""
+from typing import Callable, Dict, Hashable, Optional
+import asyncio
+import logging
+import time
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class CoalescerFull(Exception):
+    """
+    El acumulador llegó a su máximo de claves y no se liberó espacio a tiempo.
+    """
+
+
+class WriteCoalescer:
+    """
+    Suma incrementos por clave y los entrega a `flush_fn(lote)` en el threadpool.
+
+    - El buffer está acotado a `max_keys` claves distintas. Si se llena, `add`
+      adelanta la escritura y espera hasta `interval_ms` a que haya espacio;
+      si no lo hay lanza CoalescerFull (backpressure hacia el cliente).
+    - Si `flush_fn` falla, el lote vuelve al buffer y se reintenta en el
+      siguiente ciclo: `flush_fn` debe escribir todo el lote en una transacción.
+    - `close` detiene el ciclo y escribe lo pendiente (llamarlo al apagar).
+    """
+
+    def __init__(
+        self,
+        name: str,
+        flush_fn: Callable[[Dict[Hashable, int]], None],
+        interval_ms: int,
+        max_events: int,
+        max_keys: int
+    ):
+        self.name = name
+        self.flush_fn = flush_fn
+        self.interval = interval_ms / 1000
+        self.max_events = max_events
+        self.max_keys = max_keys
+        self._buffer: Dict[Hashable, int] = {}
+        self._events = 0
+        self._task: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._closing = False
+        # Estadísticas
+        self.events_total = 0
+        self.flushes = 0
+        self.rows_flushed = 0
+        self.errors = 0
+        self.rejected = 0
+        self.flush_seconds = 0.0
+
+    def _ensure_started(self) -> None:
+        # Se inicia con el primer evento, dentro del event loop del worker
+        if self._task is None:
+            self._wake = asyncio.Event()
+            self._space = asyncio.Condition()
+            self._flush_lock = asyncio.Lock()
+            self._task = asyncio.create_task(self._run())
+
+    def __len__(self) -> int:
+        return len(self._buffer)
+
+    async def add(self, key: Hashable, amount: int) -> None:
+        if self._closing:
+            raise CoalescerFull()
+        self._ensure_started()
+
+        if key not in self._buffer and len(self._buffer) >= self.max_keys:
+            self._wake.set()
+            try:
+                async with self._space:
+                    await asyncio.wait_for(
+                        self._space.wait_for(lambda: key in self._buffer or len(self._buffer) < self.max_keys),
+                        timeout=self.interval
+                    )
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                raise CoalescerFull()
+
+        self._buffer[key] = self._buffer.get(key, 0) + amount
+        self._events += 1
+        self.events_total += 1
+        if self._events >= self.max_events:
+            self._wake.set()
+
+    async def _run(self) -> None:
+        while not self._closing:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        if self._flush_lock is None:
+            return
+        async with self._flush_lock:
+            if not self._buffer:
+                return
+            lote, self._buffer = self._buffer, {}
+            eventos, self._events = self._events, 0
+
+            start = time.perf_counter()
+            try:
+                await run_in_threadpool(self.flush_fn, lote)
+                self.flushes += 1
+                self.rows_flushed += len(lote)
+            except Exception as e:
+                # El lote no se escribió (rollback): se devuelve al buffer para reintentarlo
+                self.errors += 1
+                logger.error(f"Error al escribir el lote de '{self.name}' ({len(lote)} claves): {e}")
+                for key, amount in lote.items():
+                    self._buffer[key] = self._buffer.get(key, 0) + amount
+                self._events += eventos
+            finally:
+                self.flush_seconds += time.perf_counter() - start
+
+        async with self._space:
+            self._space.notify_all()
+
+    async def close(self) -> None:
+        """
+        Detiene el ciclo de escritura y escribe lo que quede en el buffer.
+        """
+        self._closing = True
+        if self._task is None:
+            return
+        self._wake.set()
+        await self._task
+        await self.flush()
+        if self._buffer:
+            logger.error(f"'{self.name}' se cerró con {len(self._buffer)} claves sin escribir")
+
+    def stats(self) -> dict:
+        return {
+            "pending_keys": len(self._buffer),
+            "events": self.events_total,
+            "flushes": self.flushes,
+            "rows": self.rows_flushed,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "flush_seconds": self.flush_seconds,
+        }
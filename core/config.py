@@ -18,12 +18,96 @@ class Settings(BaseSettings):
     DB_NAME: str = os.getenv("DB_NAME", "")
 
     DATABASE_URL: str = f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+
+    # Réplica de solo lectura para los GET (vacío = todo va al servidor principal)
+    DB_REPLICA_HOST: str = os.getenv("DB_REPLICA_HOST", "")
+    DB_REPLICA_PORT: int = int(os.getenv("DB_REPLICA_PORT", str(DB_PORT)))
+    REPLICA_DATABASE_URL: str = (
+        f"mysql+pymysql://{DB_USER}:{DB_PASSWORD}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}"
+        if DB_REPLICA_HOST else ""
+    )
+    # Segundos después de una escritura en que las lecturas del mismo cliente van al principal (cookie)
+    DB_READ_YOUR_WRITES_SECONDS: int = int(os.getenv("DB_READ_YOUR_WRITES_SECONDS", "5"))
+
+    # Modo asíncrono: AsyncSession con el driver aiomysql (las consultas usan SQL de MySQL)
+    DB_ASYNC: bool = os.getenv("DB_ASYNC", "false").lower() in ("1", "true", "yes")
+    ASYNC_DATABASE_URL: str = os.getenv(
+        "ASYNC_DATABASE_URL",
+        f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+    )
+    ASYNC_REPLICA_DATABASE_URL: str = (
+        f"mysql+aiomysql://{DB_USER}:{DB_PASSWORD}@{DB_REPLICA_HOST}:{DB_REPLICA_PORT}/{DB_NAME}"
+        if DB_REPLICA_HOST else ""
+    )
+
+    # Pool de conexiones (por proceso) y límite de conexiones del servidor MySQL
+    DB_POOL_SIZE: int = int(os.getenv("DB_POOL_SIZE", "10"))
+    DB_MAX_OVERFLOW: int = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+    DB_POOL_TIMEOUT: int = int(os.getenv("DB_POOL_TIMEOUT", "30"))
+    DB_POOL_RECYCLE: int = int(os.getenv("DB_POOL_RECYCLE", "3600"))
+    DB_MAX_CONNECTIONS: int = int(os.getenv("DB_MAX_CONNECTIONS", "151"))
+    # Intentos totales de una transacción que falla por deadlock o lock wait timeout
+    DB_DEADLOCK_RETRIES: int = int(os.getenv("DB_DEADLOCK_RETRIES", "3"))
+    # Listados idénticos concurrentes comparten una sola consulta (run_db_shared)
+    DB_SINGLE_FLIGHT: bool = os.getenv("DB_SINGLE_FLIGHT", "true").lower() in ("1", "true", "yes")
+
+    # Instrumentación de SQL: echo imprime cada sentencia (solo para depurar)
+    DB_ECHO: bool = os.getenv("DB_ECHO", "false").lower() in ("1", "true", "yes")
+    SQL_SLOW_QUERY_MS: float = float(os.getenv("SQL_SLOW_QUERY_MS", "200"))
+
+    # Token opcional para proteger /metrics (vacío = acceso libre)
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
     
     # Configuración JWT
     jwt_secret: str = os.getenv("JWT_SECRET")
     jwt_algorithm: str = os.getenv("JWT_ALGORITHM", "HS256")
     jwt_access_token_expire_minutes: int = int(os.getenv("JWT_ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
 
+    # Configuración de cachés en memoria (segundos)
+    PERMISOS_CACHE_TTL: int = int(os.getenv("PERMISOS_CACHE_TTL", "300"))
+    PRINCIPAL_CACHE_TTL: int = int(os.getenv("PRINCIPAL_CACHE_TTL", "30"))
+    PRINCIPAL_CACHE_SIZE: int = int(os.getenv("PRINCIPAL_CACHE_SIZE", "1024"))
+    # Respuestas ya serializadas de catálogos (tipo_huevos); el TTL acota cuánto tarda
+    # un cambio hecho en otro worker en verse, en el mismo worker se invalida al instante
+    CATALOGO_CACHE_TTL: int = int(os.getenv("CATALOGO_CACHE_TTL", "300"))
+    CATALOGO_CACHE_SIZE: int = int(os.getenv("CATALOGO_CACHE_SIZE", "256"))
+    # Caché de consultas por id de app.crud (core/query_cache.py), invalidada por tabla.
+    # Con varios workers conviene el backend "redis" para que todos vean las invalidaciones
+    QUERY_CACHE_ENABLED: bool = os.getenv("QUERY_CACHE_ENABLED", "false").lower() in ("1", "true", "yes")
+    QUERY_CACHE_BACKEND: str = os.getenv("QUERY_CACHE_BACKEND", "memory")
+    QUERY_CACHE_REDIS_URL: str = os.getenv("QUERY_CACHE_REDIS_URL", "redis://localhost:6379/0")
+    QUERY_CACHE_SIZE: int = int(os.getenv("QUERY_CACHE_SIZE", "4096"))
+    QUERY_CACHE_TTL: int = int(os.getenv("QUERY_CACHE_TTL", "60"))
+
+    # Verificación de contraseñas fuera del event loop ("process" o "thread").
+    # PASSWORD_WORKERS=0: las CPUs repartidas entre los workers de core.serve
+    PASSWORD_EXECUTOR: str = os.getenv("PASSWORD_EXECUTOR", "process")
+    PASSWORD_WORKERS: int = int(os.getenv("PASSWORD_WORKERS", "0"))
+    PASSWORD_QUEUE_MAX: int = int(os.getenv("PASSWORD_QUEUE_MAX", "64"))
+
+    # Ingesta de incrementos de producción: escritura en lote cada N ms o M eventos
+    INGESTA_FLUSH_MS: int = int(os.getenv("INGESTA_FLUSH_MS", "1000"))
+    INGESTA_FLUSH_EVENTOS: int = int(os.getenv("INGESTA_FLUSH_EVENTOS", "5000"))
+    INGESTA_MAX_CLAVES: int = int(os.getenv("INGESTA_MAX_CLAVES", "10000"))
+
+    # Canal WebSocket de contadores: eventos por lote, espera máxima antes de confirmar
+    # y segundos para enviar el token en el primer mensaje
+    WS_LOTE_EVENTOS: int = int(os.getenv("WS_LOTE_EVENTOS", "500"))
+    WS_LOTE_MS: int = int(os.getenv("WS_LOTE_MS", "250"))
+    WS_AUTH_SEGUNDOS: float = float(os.getenv("WS_AUTH_SEGUNDOS", "10"))
+
+    # Stream de stock (SSE): latido para proxies y relectura para cambios de otros workers
+    SSE_HEARTBEAT_SECONDS: int = int(os.getenv("SSE_HEARTBEAT_SECONDS", "15"))
+    SSE_RESYNC_SECONDS: int = int(os.getenv("SSE_RESYNC_SECONDS", "30"))
+
+    # Clusters de fincas para el mapa: zoom máximo indexado y recarga para cambios de otros workers
+    FINCAS_CLUSTER_MAX_ZOOM: int = int(os.getenv("FINCAS_CLUSTER_MAX_ZOOM", "16"))
+    FINCAS_CLUSTER_RESYNC_SECONDS: int = int(os.getenv("FINCAS_CLUSTER_RESYNC_SECONDS", "300"))
+
+    # Lanzador de producción (core.serve); 0 = calcular según CPUs y pool de conexiones
+    SERVE_WORKERS: int = int(os.getenv("SERVE_WORKERS", "0"))
+    SERVE_GRACEFUL_TIMEOUT: int = int(os.getenv("SERVE_GRACEFUL_TIMEOUT", "30"))
+
     class Config:
         env_file = ".env"
 
@@ -1,46 +1,225 @@
-from typing import Generator
+from typing import AsyncGenerator, Callable, Generator, TypeVar, Union
+import asyncio
 import logging
+import random
+import time
 
-from sqlalchemy import create_engine, text, MetaData
-from sqlalchemy.orm import sessionmaker, declarative_base
+from fastapi import Response
+from fastapi.concurrency import run_in_threadpool
+from starlette.requests import HTTPConnection
+from sqlalchemy import create_engine, event, text, MetaData
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker, declarative_base
 from sqlalchemy.exc import SQLAlchemyError, OperationalError, DisconnectionError
-from sqlalchemy.pool import QueuePool
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
 
 from core.config import settings 
+from core.instrumentation import instrument_engine, InstrumentedQueuePool, InstrumentedAsyncQueuePool
+from core.singleflight import SingleFlight
 
 # Configurar el módulo de logging de Python y se usa para crear un registrador de eventos (logger)
 logger = logging.getLogger(__name__)
 
+# Opciones del pool, iguales para el servidor principal y la réplica
+_pool_options = dict(
+    echo=settings.DB_ECHO,  # Activar o desactivar el modo debug para imprimir en consola todas las sentencias SQL
+    pool_pre_ping=True,  # Verifica que las conexiones estén activas antes de usarlas
+    pool_recycle=settings.DB_POOL_RECYCLE,  # Recicla conexiones (por defecto una hora) para evitar el error "connection has been closed"
+    pool_size=settings.DB_POOL_SIZE,        # Número máximo de conexiones permanentes en el pool
+    max_overflow=settings.DB_MAX_OVERFLOW,  # Conexiones adicionales permitidas temporalmente cuando el pool está lleno
+    pool_timeout=settings.DB_POOL_TIMEOUT,  # Tiempo máximo de espera para obtener una conexión del pool
+)
+
 # Crear el motor de base de datos con configuraciones óptimas
 engine = create_engine(
     settings.DATABASE_URL,
-    echo=True,           # Activar o desactivar el modo debug para imprimir en consola todas las sentencias SQL
-    pool_pre_ping=True,  # Verifica que las conexiones estén activas antes de usarlas
-    pool_recycle=3600,   # Recicla conexiones después de una hora para evitar el error "connection has been closed"
-    pool_size=10,        # Número máximo de conexiones permanentes en el pool
-    max_overflow=20,     # Conexiones adicionales permitidas temporalmente cuando el pool está lleno
-    pool_timeout=30,     # Tiempo máximo de espera para obtener una conexión del pool
-    poolclass=QueuePool  # Clase de pool para manejo eficiente de conexiones
+    poolclass=InstrumentedQueuePool,  # QueuePool que además mide la espera por conexiones (ver /metrics)
+    **_pool_options
 )
 
+# Tiempos por sentencia, consultas lentas y conteo por petición (ver core/instrumentation.py)
+instrument_engine(engine)
+
 # Crear la fábrica de sesiones
 # - autocommit=False: Los cambios solo se guardan cuando se hace commit explícitamente
 # - autoflush=False: Las operaciones pendientes solo se envían a la BD cuando se hace flush explícitamente
 # - bind=engine: Vincula la sesión al motor creado anteriormente
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Réplica de solo lectura (DB_REPLICA_HOST). Sin réplica configurada apunta al motor principal.
+REPLICA_ACTIVA = bool(settings.REPLICA_DATABASE_URL)
+replica_engine = engine
+if REPLICA_ACTIVA:
+    replica_engine = create_engine(
+        settings.REPLICA_DATABASE_URL,
+        poolclass=InstrumentedQueuePool,
+        **_pool_options
+    )
+    instrument_engine(replica_engine)
+ReplicaSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=replica_engine)
+
+# Motor asíncrono (DB_ASYNC=true). Usa el driver indicado en ASYNC_DATABASE_URL
+# (aiomysql; las consultas de app.crud son de MySQL) y solo se crea si se activa.
+async_engine = None
+async_replica_engine = None
+AsyncSessionLocal = None
+AsyncReplicaSessionLocal = None
+if settings.DB_ASYNC:
+    async_engine = create_async_engine(
+        settings.ASYNC_DATABASE_URL,
+        poolclass=InstrumentedAsyncQueuePool,
+        **_pool_options
+    )
+    # Los eventos de cursor se registran sobre el Engine síncrono que envuelve al asíncrono
+    instrument_engine(async_engine.sync_engine)
+    async_replica_engine = async_engine
+    if REPLICA_ACTIVA:
+        async_replica_engine = create_async_engine(
+            settings.ASYNC_REPLICA_DATABASE_URL,
+            poolclass=InstrumentedAsyncQueuePool,
+            **_pool_options
+        )
+        instrument_engine(async_replica_engine.sync_engine)
+    # expire_on_commit=False: los resultados siguen siendo legibles después del commit sin nuevas consultas
+    AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+    AsyncReplicaSessionLocal = async_sessionmaker(async_replica_engine, autoflush=False, expire_on_commit=False)
+
+# Sesión que reciben los endpoints: síncrona o asíncrona según la configuración
+DbSession = Union[Session, AsyncSession]
+
 # Declarar la base para los modelos ORM
 Base = declarative_base()
 
 # Instancia de MetaData para trabajar con tablas
 metadata = MetaData()
 
-def get_db() -> Generator:
+# Métodos que pueden atenderse desde la réplica
+METODOS_LECTURA = ("GET", "HEAD")
+
+# Después de un commit que escribió filas, la respuesta lleva esta cookie con la hora de
+# la escritura: durante DB_READ_YOUR_WRITES_SECONDS las lecturas del mismo cliente van al
+# principal para que vea sus propios cambios aunque la réplica tenga retraso. Como la hora
+# viaja en la cookie, cualquier worker lo decide sin guardar estado.
+COOKIE_PRINCIPAL = "avisena_db_principal"
+
+# Sentencias que modifican filas; su rowcount indica si la transacción escribió algo
+_ESCRITURAS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+def _marcar_filas_escritas(conn, cursor, statement, parameters, context, executemany):
+    marca = conn.info.get("filas_escritas")
+    if marca is not None and cursor.rowcount > 0 and statement.lstrip()[:7].upper().startswith(_ESCRITURAS):
+        marca[0] = True
+
+
+# Solo el servidor principal recibe escrituras
+event.listen(engine, "after_cursor_execute", _marcar_filas_escritas)
+if async_engine is not None:
+    event.listen(async_engine.sync_engine, "after_cursor_execute", _marcar_filas_escritas)
+
+
+def _al_confirmar_escritura(db: Session, callback: Callable[[], None]) -> None:
+    """
+    Llama a `callback` después de cada commit de `db` en el que alguna sentencia
+    INSERT/UPDATE/DELETE afectó filas (un UPDATE sin coincidencias no cuenta).
+    """
+    marcas = []
+
+    def iniciar(session, transaction, connection):
+        # Una marca por conexión de la transacción; _marcar_filas_escritas la activa
+        marca = [False]
+        connection.info["filas_escritas"] = marca
+        marcas.append(marca)
+
+    def confirmar(session):
+        escribio = any(marca[0] for marca in marcas)
+        marcas.clear()
+        if escribio:
+            callback()
+
+    def revertir(session):
+        marcas.clear()
+
+    event.listen(db, "after_begin", iniciar)
+    event.listen(db, "after_commit", confirmar)
+    event.listen(db, "after_rollback", revertir)
+
+
+def _es_lectura(connection: HTTPConnection) -> bool:
+    return connection.scope["type"] == "http" and connection.scope["method"] in METODOS_LECTURA
+
+
+def usar_replica(connection: HTTPConnection) -> bool:
+    """
+    Decide si la petición puede leer de la réplica: solo GET/HEAD, y nunca si el
+    cliente escribió dentro de la ventana de lectura de escrituras propias (según la
+    hora que trae la cookie). Las escrituras y los websockets siempre usan el servidor principal.
+    """
+    if not REPLICA_ACTIVA or not _es_lectura(connection):
+        return False
+    marca = connection.cookies.get(COOKIE_PRINCIPAL)
+    if marca:
+        try:
+            escrito_en = float(marca)
+        except ValueError:
+            escrito_en = 0.0
+        if time.time() - escrito_en < settings.DB_READ_YOUR_WRITES_SECONDS:
+            return False
+    return True
+
+
+def lee_de_replica(db: DbSession) -> bool:
+    """
+    True si la sesión está enlazada a la réplica, que puede ir atrasada respecto del
+    servidor principal: lo que lee no debe guardarse en cachés que se invalidan al
+    escribir. Sirve tanto para la AsyncSession de la petición como para la Session
+    síncrona que recibe una función dentro de run_sync (enlazada al Engine síncrono).
+    """
+    if not REPLICA_ACTIVA:
+        return False
+    bind = db.bind
+    if isinstance(bind, AsyncEngine):
+        bind = bind.sync_engine
+    return bind is replica_engine or (
+        async_replica_engine is not None and bind is async_replica_engine.sync_engine
+    )
+
+
+def registrar_escritura(connection: HTTPConnection, response: Response, db: Session) -> None:
+    """
+    Después de cada commit de `db` que escriba filas, agrega a la respuesta la cookie
+    con la hora de la escritura, para que las siguientes lecturas del cliente vayan al
+    servidor principal. El commit ocurre dentro del endpoint, antes de armar la respuesta.
+    """
+    if not REPLICA_ACTIVA or settings.DB_READ_YOUR_WRITES_SECONDS <= 0 or connection.scope["type"] != "http":
+        return
+
+    marcada = False
+
+    def marcar():
+        # Una sola cookie por respuesta aunque el endpoint haga varios commits
+        nonlocal marcada
+        if marcada:
+            return
+        marcada = True
+        response.set_cookie(
+            COOKIE_PRINCIPAL, f"{time.time():.3f}",
+            max_age=settings.DB_READ_YOUR_WRITES_SECONDS,
+            httponly=True,
+            samesite="lax"
+        )
+
+    _al_confirmar_escritura(db, marcar)
+
+
+def get_db(connection: HTTPConnection, response: Response) -> Generator:
     """
     Dependencia para obtener una sesión de base de datos en FastAPI.
     
     Crea una nueva sesión por cada solicitud y la cierra automáticamente
-    al finalizar, incluso si ocurre alguna excepción.
+    al finalizar, incluso si ocurre alguna excepción. Las lecturas (GET) usan
+    la réplica cuando está configurada (ver `usar_replica`).
     
     Yields:
         Session: Una sesión de SQLAlchemy para interactuar con la base de datos.
@@ -52,7 +231,11 @@ def get_db() -> Generator:
             return db.query(Item).all()
         ```
     """
-    db = SessionLocal()
+    if usar_replica(connection):
+        db = ReplicaSessionLocal()
+    else:
+        db = SessionLocal()
+        registrar_escritura(connection, response, db)
     try:
         yield db  # El 'yield' permite que la función de endpoint use la sesión.
     except SQLAlchemyError as e:
@@ -64,6 +247,118 @@ def get_db() -> Generator:
         # Esto es esencial para evitar fugas de memoria y conexiones abiertas.
 
 
+async def get_async_db(connection: HTTPConnection, response: Response) -> AsyncGenerator:
+    """
+    Igual que get_db, pero con una AsyncSession del motor asíncrono.
+    """
+    replica = usar_replica(connection)
+    async with (AsyncReplicaSessionLocal if replica else AsyncSessionLocal)() as db:
+        if not replica:
+            # Los eventos de sesión se registran en la Session síncrona que envuelve la AsyncSession
+            registrar_escritura(connection, response, db.sync_session)
+        try:
+            yield db
+        except SQLAlchemyError as e:
+            await db.rollback()
+            logger.error(f"Error de base de datos: {str(e)}")
+            raise
+
+
+# Dependencia que usan los routers: entrega la sesión del modo configurado (DB_ASYNC),
+# enlazada a la réplica o al servidor principal según la petición
+get_session = get_async_db if settings.DB_ASYNC else get_db
+
+
+T = TypeVar("T")
+
+
+async def run_db(db: DbSession, fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Ejecuta una función de app.crud con la sesión de la petición sin bloquear el event loop.
+
+    Con una AsyncSession la función corre mediante `run_sync`, donde cada consulta
+    cede el control al event loop mientras espera a la base de datos. Con una
+    Session síncrona se ejecuta en el threadpool, como los endpoints `def`.
+    """
+    if isinstance(db, AsyncSession):
+        return await db.run_sync(fn, *args, **kwargs)
+    return await run_in_threadpool(fn, db, *args, **kwargs)
+
+
+# Listados idénticos que se están consultando en este worker (ver core/singleflight.py)
+lecturas = SingleFlight("lecturas")
+
+
+def _con_sesion_propia(sesiones: sessionmaker, fn: Callable[..., T], *args, **kwargs) -> T:
+    db = sesiones()
+    try:
+        return fn(db, *args, **kwargs)
+    finally:
+        db.close()
+
+
+async def _run_db_aparte(db: DbSession, fn: Callable[..., T], *args, **kwargs) -> T:
+    # Sesión propia, de la misma base que `db`: la ejecución compartida sigue aunque la
+    # petición que la inició se cancele y get_db cierre su sesión
+    if isinstance(db, AsyncSession):
+        async with (AsyncReplicaSessionLocal if lee_de_replica(db) else AsyncSessionLocal)() as propia:
+            return await propia.run_sync(fn, *args, **kwargs)
+    sesiones = ReplicaSessionLocal if lee_de_replica(db) else SessionLocal
+    return await run_in_threadpool(_con_sesion_propia, sesiones, fn, *args, **kwargs)
+
+
+async def run_db_shared(db: DbSession, fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Igual que run_db, para listados de solo lectura: si otra petición ya está
+    ejecutando la misma función con los mismos argumentos contra la misma base
+    (principal o réplica), espera ese resultado en vez de repetir la consulta.
+
+    La consulta compartida usa una sesión propia y corta de esa base, no la de la
+    petición que llegó primero. Los permisos se verifican antes, en cada petición.
+    El resultado es compartido y no debe modificarse.
+    """
+    if not settings.DB_SINGLE_FLIGHT:
+        return await run_db(db, fn, *args, **kwargs)
+    key = (fn, db.bind, args, tuple(sorted(kwargs.items())))
+    label = f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+    return await lecturas.do(key, lambda: _run_db_aparte(db, fn, *args, **kwargs), label=label)
+
+
+# Errores de MySQL en los que conviene repetir la transacción completa:
+# 1213 = deadlock (InnoDB ya revirtió la transacción), 1205 = lock wait timeout
+ERRORES_REINTENTABLES = (1213, 1205)
+
+
+def with_deadlock_retry(db: Session, fn: Callable[..., T], *args, **kwargs) -> T:
+    """
+    Ejecuta `fn(db, ...)` y, si falla por deadlock o por lock wait timeout, hace
+    rollback y la repite hasta DB_DEADLOCK_RETRIES veces en total.
+
+    `fn` debe contener la transacción completa (incluido el commit) para que
+    repetirla sea seguro.
+
+    En modo DB_ASYNC esto corre dentro de `run_sync`, en el hilo del event loop: la
+    espera entre intentos se hace con asyncio.sleep (como las consultas, mediante
+    el greenlet de SQLAlchemy) para no detener las demás peticiones.
+    """
+    intentos = max(settings.DB_DEADLOCK_RETRIES, 1)
+    for intento in range(1, intentos + 1):
+        try:
+            return fn(db, *args, **kwargs)
+        except OperationalError as e:
+            codigo = e.orig.args[0] if e.orig is not None and e.orig.args else None
+            if codigo not in ERRORES_REINTENTABLES or intento == intentos:
+                raise
+            db.rollback()
+            logger.warning(f"Transacción repetida ({intento}/{intentos - 1}) por error MySQL {codigo}")
+            # Espera corta y aleatoria para que las transacciones en conflicto no choquen otra vez
+            espera = random.uniform(0, 0.01 * intento)
+            if in_greenlet():
+                await_only(asyncio.sleep(espera))
+            else:
+                time.sleep(espera)
+
+
 def check_database_connection() -> bool:
     """
     Verifica la conexión a la base de datos.
@@ -0,0 +1,143 @@
+"""
+Difusión de cambios en memoria del proceso (Server-Sent Events).
+
+Un EventHub por tipo de dato y por worker: las funciones de app.crud publican el
+cambio después del commit y el hub lo reparte a las colas de todos los suscriptores,
+así N clientes conectados cuestan una notificación y no N consultas.
+
+Los cambios hechos en otro worker no pasan por este hub; para cubrirlos, mientras
+haya suscriptores el hub relee la tabla cada `resync_seconds` (una consulta por
+worker, sin importar cuántos clientes haya) y publica las filas que cambiaron.
+"""
+from typing import Any, Callable, Dict, Iterable, List, Optional, Set
+import asyncio
+import logging
+
+from fastapi.concurrency import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+
+class EventHub:
+    """
+    Reparte eventos (dict con la llave `key` y los campos que cambiaron) a los suscriptores.
+
+    - `publish` puede llamarse desde cualquier hilo (threadpool de los endpoints).
+    - Cada suscriptor tiene una cola acotada; si se llena, se vacía y recibe None
+      para que cierre su stream y se vuelva a conectar (recibirá un snapshot nuevo).
+    - `snapshot` entrega el estado completo guardado en memoria (lo carga con
+      `load_fn` la primera vez) para enviarlo al conectarse. Los eventos que llegan
+      mientras se carga se guardan y se aplican sobre lo leído antes de usarlo.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        key: str,
+        load_fn: Callable[[], Iterable[Dict[str, Any]]],
+        resync_seconds: float = 30,
+        max_queue: int = 1000
+    ):
+        self.name = name
+        self.key = key
+        self.load_fn = load_fn
+        self.resync_seconds = resync_seconds
+        self.max_queue = max_queue
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Set[asyncio.Queue] = set()
+        self._state: Optional[Dict[Any, Dict[str, Any]]] = None
+        self._resync_task: Optional[asyncio.Task] = None
+        # Eventos recibidos durante cada carga en curso (snapshot o relectura)
+        self._en_carga: List[List[Dict[str, Any]]] = []
+        self._seq = 0
+        # Estadísticas
+        self.published = 0
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._subscribers)
+
+    def subscribe(self) -> asyncio.Queue:
+        self._loop = asyncio.get_running_loop()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=self.max_queue)
+        self._subscribers.add(queue)
+        if self._resync_task is None and self.resync_seconds > 0:
+            self._resync_task = asyncio.create_task(self._resync_loop())
+        return queue
+
+    def unsubscribe(self, queue: asyncio.Queue) -> None:
+        self._subscribers.discard(queue)
+        if not self._subscribers:
+            # Sin suscriptores no se mantiene el estado ni se relee la tabla
+            if self._resync_task is not None:
+                self._resync_task.cancel()
+                self._resync_task = None
+            self._state = None
+
+    def publish(self, event: Dict[str, Any]) -> None:
+        loop = self._loop
+        if loop is None or not self._subscribers:
+            return
+        try:
+            loop.call_soon_threadsafe(self._dispatch, event)
+        except RuntimeError:
+            # El event loop ya se cerró (apagado del worker)
+            pass
+
+    def _dispatch(self, event: Dict[str, Any]) -> None:
+        if self._state is not None:
+            self._state.setdefault(event[self.key], {}).update(event)
+        for pendientes in self._en_carga:
+            pendientes.append(event)
+        self._seq += 1
+        self.published += 1
+        mensaje = (self._seq, event)
+        for queue in list(self._subscribers):
+            try:
+                queue.put_nowait(mensaje)
+            except asyncio.QueueFull:
+                # Cliente lento: se descarta lo pendiente y se le pide reconectar
+                self.dropped += 1
+                while not queue.empty():
+                    queue.get_nowait()
+                queue.put_nowait(None)
+                self._subscribers.discard(queue)
+
+    async def _load(self) -> Dict[Any, Dict[str, Any]]:
+        # La consulta puede haber leído filas anteriores a un evento publicado mientras
+        # corría: esos eventos se aplican encima, en orden, para no perderlos
+        pendientes: List[Dict[str, Any]] = []
+        self._en_carga.append(pendientes)
+        try:
+            rows = await run_in_threadpool(lambda: [dict(row) for row in self.load_fn()])
+        finally:
+            self._en_carga.remove(pendientes)
+        state = {row[self.key]: row for row in rows}
+        for event in pendientes:
+            state.setdefault(event[self.key], {}).update(event)
+        return state
+
+    async def snapshot(self) -> List[Dict[str, Any]]:
+        if self._state is None:
+            state = await self._load()
+            # Otra conexión pudo cargarlo mientras tanto; ambos incluyen todos los eventos
+            if self._state is None and self._subscribers:
+                self._state = state
+            return list((self._state or state).values())
+        return list(self._state.values())
+
+    async def _resync_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.resync_seconds)
+            if self._state is None:
+                continue
+            try:
+                actual = await self._load()
+            except Exception as e:
+                logger.error(f"Error al releer '{self.name}': {e}")
+                continue
+            if self._state is None:
+                continue
+            for key, row in actual.items():
+                if self._state.get(key) != row:
+                    self._dispatch(row)
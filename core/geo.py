@@ -0,0 +1,153 @@
+"""
+Geohash y distancias para búsquedas espaciales (fincas cercanas o dentro de un área).
+
+El geohash intercala los bits de longitud y latitud y los codifica en base 32, así
+cada prefijo es una celda rectangular y todas las ubicaciones dentro de ella
+comparten ese prefijo. Guardado en una columna indexada, "las celdas que cubren un
+área" se traduce en unos pocos rangos del índice (prefijo <= geohash < prefijo + 1),
+que descartan casi todas las filas antes de la verificación exacta.
+"""
+from math import asin, cos, degrees, floor, radians, sin, sqrt
+from typing import List, Optional, Tuple
+
+_BASE32 = "0123456789bcdefghjkmnpqrstuvwxyz"
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+# Caracteres guardados por finca (celdas de ~5 m); las búsquedas usan prefijos más cortos
+PRECISION = 9
+# Máximo de celdas (rangos del índice) por búsqueda; con más se usa una celda más grande
+MAX_CELDAS = 16
+
+RADIO_TIERRA_KM = 6371.0088
+
+# (min_lat, min_lon, max_lat, max_lon)
+Caja = Tuple[float, float, float, float]
+
+
+def encode(latitud: float, longitud: float, precision: int = PRECISION) -> str:
+    lat_min, lat_max = -90.0, 90.0
+    lon_min, lon_max = -180.0, 180.0
+    caracteres = []
+    bits = 0
+    valor = 0
+    par = True  # el primer bit es de longitud
+    while len(caracteres) < precision:
+        if par:
+            medio = (lon_min + lon_max) / 2
+            if longitud >= medio:
+                valor = (valor << 1) | 1
+                lon_min = medio
+            else:
+                valor <<= 1
+                lon_max = medio
+        else:
+            medio = (lat_min + lat_max) / 2
+            if latitud >= medio:
+                valor = (valor << 1) | 1
+                lat_min = medio
+            else:
+                valor <<= 1
+                lat_max = medio
+        par = not par
+        bits += 1
+        if bits == 5:
+            caracteres.append(_BASE32[valor])
+            bits = 0
+            valor = 0
+    return "".join(caracteres)
+
+
+def haversine_km(lat1: float, lon1: float, lat2: float, lon2: float) -> float:
+    dlat = radians(lat2 - lat1)
+    dlon = radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return 2 * RADIO_TIERRA_KM * asin(min(1.0, sqrt(a)))
+
+
+def cajas_area(min_lat: float, min_lon: float, max_lat: float, max_lon: float) -> List[Caja]:
+    """
+    Cajas a consultar para un área; si min_lon > max_lon el área cruza el
+    antimeridiano (180°) y se divide en dos.
+    """
+    if min_lon <= max_lon:
+        return [(min_lat, min_lon, max_lat, max_lon)]
+    return [(min_lat, min_lon, max_lat, 180.0), (min_lat, -180.0, max_lat, max_lon)]
+
+
+def cajas_radio(latitud: float, longitud: float, radio_km: float) -> List[Caja]:
+    """
+    Cajas que contienen el círculo de `radio_km` alrededor del punto.
+    """
+    dlat = degrees(radio_km / RADIO_TIERRA_KM)
+    min_lat = max(-90.0, latitud - dlat)
+    max_lat = min(90.0, latitud + dlat)
+    # Cerca de los polos el círculo abarca todas las longitudes
+    if min_lat <= -90.0 or max_lat >= 90.0:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    dlon = degrees(asin(min(1.0, sin(radians(dlat)) / cos(radians(latitud)))))
+    if dlon >= 180.0:
+        return [(min_lat, -180.0, max_lat, 180.0)]
+    min_lon = longitud - dlon
+    max_lon = longitud + dlon
+    if min_lon < -180.0:
+        return cajas_area(min_lat, min_lon + 360.0, max_lat, max_lon)
+    if max_lon > 180.0:
+        return cajas_area(min_lat, min_lon, max_lat, max_lon - 360.0)
+    return [(min_lat, min_lon, max_lat, max_lon)]
+
+
+def _celdas_caja(caja: Caja, precision: int) -> Tuple[range, range, float, float]:
+    lat_bits = 5 * precision // 2
+    lon_bits = 5 * precision - lat_bits
+    alto = 180.0 / (1 << lat_bits)
+    ancho = 360.0 / (1 << lon_bits)
+    min_lat, min_lon, max_lat, max_lon = caja
+    filas = range(
+        floor((min_lat + 90.0) / alto),
+        min(floor((max_lat + 90.0) / alto), (1 << lat_bits) - 1) + 1
+    )
+    columnas = range(
+        floor((min_lon + 180.0) / ancho),
+        min(floor((max_lon + 180.0) / ancho), (1 << lon_bits) - 1) + 1
+    )
+    return filas, columnas, alto, ancho
+
+
+def prefijos(cajas: List[Caja], max_celdas: int = MAX_CELDAS) -> List[str]:
+    """
+    Prefijos geohash que cubren las cajas, con la mayor precisión que no supere
+    `max_celdas`. Lista vacía si ni las celdas de un carácter alcanzan (área
+    demasiado grande para que el índice ayude).
+    """
+    for precision in range(PRECISION, 0, -1):
+        celdas = [_celdas_caja(caja, precision) for caja in cajas]
+        if sum(len(filas) * len(columnas) for filas, columnas, _, _ in celdas) > max_celdas:
+            continue
+        resultado = set()
+        for filas, columnas, alto, ancho in celdas:
+            for i in filas:
+                for j in columnas:
+                    resultado.add(encode(-90.0 + (i + 0.5) * alto, -180.0 + (j + 0.5) * ancho, precision))
+        return sorted(resultado)
+    return []
+
+
+def rango(prefijo: str) -> Tuple[str, Optional[str]]:
+    """
+    [inicio, fin) de los geohash que empiezan con `prefijo`, para comparar en el
+    índice; fin es None cuando no hay prefijo siguiente ("zz...").
+    """
+    caracteres = list(prefijo)
+    while caracteres:
+        indice = _DECODE[caracteres[-1]]
+        if indice < len(_BASE32) - 1:
+            caracteres[-1] = _BASE32[indice + 1]
+            return prefijo, "".join(caracteres)
+        # "...z" no tiene siguiente: se acarrea al carácter anterior
+        caracteres.pop()
+    return prefijo, None
+
+
+def en_caja(latitud: float, longitud: float, caja: Caja) -> bool:
+    min_lat, min_lon, max_lat, max_lon = caja
+    return min_lat <= latitud <= max_lat and min_lon <= longitud <= max_lon
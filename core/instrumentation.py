@@ -0,0 +1,196 @@
+"""
+Instrumentación de SQL basada en eventos del Engine de SQLAlchemy.
+
+- Latencia de cada sentencia en un histograma, agrupada por operación y tabla.
+- Registro de consultas lentas (umbral SQL_SLOW_QUERY_MS) con sus parámetros.
+- Conteo de consultas y tiempo total por petición HTTP, que se agrega a los logs
+  y a las cabeceras X-DB-Queries / X-DB-Time-Ms de la respuesta.
+- Tiempo de espera por una conexión del pool y cantidad de timeouts.
+"""
+from contextvars import ContextVar
+from typing import Optional
+import logging
+import re
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+from core.config import settings
+from core.metrics import Counter, Histogram
+
+logger = logging.getLogger(__name__)
+
+query_duration = Histogram(
+    "db_query_duration_seconds",
+    "Duración de las sentencias SQL por operación y tabla principal",
+    labelnames=("operation", "table")
+)
+pool_wait = Histogram(
+    "db_pool_wait_seconds",
+    "Tiempo para obtener una conexión del pool (incluye abrir una conexión nueva)"
+)
+pool_timeouts = Counter(
+    "db_pool_timeouts_total",
+    "Veces que se agotó pool_timeout esperando una conexión"
+)
+
+_WHITESPACE = re.compile(r"\s+")
+# Listas de parámetros (IN expandidos, VALUES de varias filas) se reducen a una sola marca
+_PARAM_LIST = re.compile(r"%\(\w+\)s(?:\s*,\s*%\(\w+\)s)+|\?(?:\s*,\s*\?)+")
+_PARAM = re.compile(r"%\(\w+\)s|\?")
+_REPEATED_GROUPS = re.compile(r"\(\?\)(?:\s*,\s*\(\?\))+")
+
+_OPERATION = re.compile(r"^\W*(\w+)")
+_TABLE = re.compile(r"\b(?:FROM|INTO|UPDATE)\s+`?(\w+)", re.IGNORECASE)
+
+# Las sentencias se repiten mucho: se guarda la versión normalizada de cada una
+_normalized_cache = {}
+_NORMALIZED_CACHE_MAX = 2048
+
+# Cada par de etiquetas es una serie en /metrics: pasado el límite se agrupan en "otra"
+_labels_seen = set()
+_LABELS_MAX = 200
+_OTHER_LABELS = ("otra", "otra")
+
+
+def normalize_sql(statement: str) -> str:
+    return _describe(statement)[0]
+
+
+def statement_labels(normalized: str) -> tuple:
+    """
+    Etiquetas (operación, tabla principal) de una sentencia normalizada, p. ej.
+    ("select", "usuarios"). Es un conjunto acotado, a diferencia del SQL completo.
+    """
+    operation = _OPERATION.match(normalized)
+    table = _TABLE.search(normalized)
+    labels = (
+        operation.group(1).lower() if operation else "",
+        table.group(1).lower() if table else "",
+    )
+    if labels not in _labels_seen:
+        if len(_labels_seen) >= _LABELS_MAX:
+            return _OTHER_LABELS
+        _labels_seen.add(labels)
+    return labels
+
+
+def _describe(statement: str) -> tuple:
+    described = _normalized_cache.get(statement)
+    if described is None:
+        normalized = _WHITESPACE.sub(" ", statement).strip()
+        normalized = _PARAM_LIST.sub("?", normalized)
+        normalized = _PARAM.sub("?", normalized)
+        normalized = _REPEATED_GROUPS.sub("(?), ...", normalized)
+        described = (normalized, statement_labels(normalized))
+        if len(_normalized_cache) < _NORMALIZED_CACHE_MAX:
+            _normalized_cache[statement] = described
+    return described
+
+
+class InstrumentedQueuePool(QueuePool):
+    """
+    QueuePool que mide cuánto se espera por cada conexión y cuenta los timeouts.
+    """
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            pool_timeouts.inc()
+            raise
+        finally:
+            pool_wait.observe(time.perf_counter() - start)
+
+
+class InstrumentedAsyncQueuePool(InstrumentedQueuePool, AsyncAdaptedQueuePool):
+    """
+    Variante para el motor asíncrono (usa la cola compatible con asyncio).
+    """
+
+
+class RequestQueryStats:
+    __slots__ = ("count", "seconds")
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+
+# Estadísticas de la petición en curso. Es un objeto mutable para que los hilos del
+# threadpool (que reciben una copia del contexto) acumulen sobre la misma instancia.
+_request_stats: ContextVar[Optional[RequestQueryStats]] = ContextVar("request_query_stats", default=None)
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["query_start_time"].pop()
+    normalized, labels = _describe(statement)
+    query_duration.observe(elapsed, *labels)
+
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.count += 1
+        stats.seconds += elapsed
+
+    if elapsed * 1000 >= settings.SQL_SLOW_QUERY_MS:
+        params = repr(parameters)
+        if len(params) > 1000:
+            params = params[:1000] + "..."
+        logger.warning(f"Consulta lenta ({elapsed * 1000:.1f} ms): {normalized} | parámetros: {params}")
+
+
+def _handle_error(exception_context):
+    # Si la sentencia falla no se llama after_cursor_execute; se descarta su marca de inicio
+    conn = exception_context.connection
+    if conn is not None:
+        starts = conn.info.get("query_start_time")
+        if starts:
+            starts.pop()
+
+
+def instrument_engine(engine: Engine) -> None:
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+    event.listen(engine, "handle_error", _handle_error)
+
+
+class QueryStatsMiddleware:
+    """
+    Middleware ASGI que mide cuántas consultas hizo cada petición y cuánto tardaron.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        stats = RequestQueryStats()
+        token = _request_stats.set(stats)
+
+        async def send_with_headers(message):
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-db-queries", str(stats.count).encode()))
+                headers.append((b"x-db-time-ms", f"{stats.seconds * 1000:.1f}".encode()))
+                message["headers"] = headers
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_headers)
+        finally:
+            _request_stats.reset(token)
+            if stats.count:
+                logger.info(
+                    f"{scope['method']} {scope['path']}: {stats.count} consultas, "
+                    f"{stats.seconds * 1000:.1f} ms en base de datos"
+                )
@@ -0,0 +1,189 @@
+"""
+Métricas en memoria del proceso con salida en formato de texto de Prometheus.
+
+Los histogramas y contadores se registran al crearse; los valores que ya existen
+en otros objetos (pool de conexiones, cachés) se publican con colectores, que son
+funciones llamadas al momento de generar la salida de /metrics.
+"""
+from bisect import bisect_left
+from typing import Callable, Dict, Iterable, List, Sequence, Tuple
+import threading
+import time
+
+# Límites (en segundos) de los buckets por defecto, pensados para consultas y peticiones HTTP
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Muestra de un colector: (nombre, tipo, descripción, [(etiquetas, valor)])
+Sample = Tuple[str, str, str, List[Tuple[Dict[str, str], float]]]
+
+_registry: List["Metric"] = []
+_collectors: List[Callable[[], Iterable[Sample]]] = []
+
+
+class Metric:
+    type = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+
+class Counter(Metric):
+    type = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *labelvalues: str, amount: float = 1) -> None:
+        with self._lock:
+            self._values[labelvalues] = self._values.get(labelvalues, 0) + amount
+
+    def snapshot(self) -> List[Tuple[Tuple[str, ...], float]]:
+        with self._lock:
+            return list(self._values.items())
+
+
+class Histogram(Metric):
+    """
+    Histograma con etiquetas, acumulado en memoria del proceso.
+
+    `observe` solo hace una búsqueda binaria y unas sumas bajo un lock, así que
+    puede dejarse activo en producción.
+    """
+    type = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # etiquetas -> [conteo por bucket (+Inf al final), suma, conteo total]
+        self._series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *labelvalues: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            serie = self._series.get(labelvalues)
+            if serie is None:
+                serie = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[labelvalues] = serie
+            serie[0][index] += 1
+            serie[1] += value
+            serie[2] += 1
+
+    def snapshot(self) -> List[Tuple[Tuple[str, ...], List[int], float, int]]:
+        """
+        Copia de las series: (etiquetas, conteos por bucket, suma, conteo total).
+        """
+        with self._lock:
+            return [
+                (labels, list(serie[0]), serie[1], serie[2])
+                for labels, serie in self._series.items()
+            ]
+
+
+def register_collector(collector: Callable[[], Iterable[Sample]]) -> None:
+    _collectors.append(collector)
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _escape_help(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n")
+
+
+def _labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render() -> str:
+    """
+    Genera el texto de exposición de Prometheus (versión 0.0.4).
+    """
+    lines: List[str] = []
+
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {_escape_help(metric.documentation)}")
+        lines.append(f"# TYPE {metric.name} {metric.type}")
+        if isinstance(metric, Histogram):
+            for labels, counts, total, count in metric.snapshot():
+                acumulado = 0
+                for bound, bucket_count in zip(metric.buckets + (float("inf"),), counts):
+                    acumulado += bucket_count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{metric.name}_bucket{_labels(metric.labelnames, labels, le)} {acumulado}")
+                lines.append(f"{metric.name}_sum{_labels(metric.labelnames, labels)} {_format_value(total)}")
+                lines.append(f"{metric.name}_count{_labels(metric.labelnames, labels)} {count}")
+        else:
+            for labels, value in metric.snapshot():
+                lines.append(f"{metric.name}{_labels(metric.labelnames, labels)} {_format_value(value)}")
+
+    for collector in _collectors:
+        for name, metric_type, documentation, samples in collector():
+            lines.append(f"# HELP {name} {_escape_help(documentation)}")
+            lines.append(f"# TYPE {name} {metric_type}")
+            for labels, value in samples:
+                label_text = _labels(list(labels.keys()), list(labels.values()))
+                lines.append(f"{name}{label_text} {_format_value(value)}")
+
+    lines.append("")
+    return "\n".join(lines)
+
+
+http_requests = Counter(
+    "http_requests_total",
+    "Peticiones HTTP atendidas por ruta, método y código de estado",
+    labelnames=("method", "route", "status")
+)
+http_request_duration = Histogram(
+    "http_request_duration_seconds",
+    "Duración de las peticiones HTTP por ruta y método",
+    labelnames=("method", "route")
+)
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI que cuenta peticiones y mide su duración.
+
+    La ruta se etiqueta con la plantilla de la ruta de FastAPI (por ejemplo
+    /fincas/by-id/{finca_id}) para que los ids no generen series nuevas.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        start = time.perf_counter()
+        status_code = [500]
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status_code[0] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            route = scope.get("route")
+            route_path = getattr(route, "path", None) or "sin_ruta"
+            http_requests.inc(scope["method"], route_path, str(status_code[0]))
+            http_request_duration.observe(time.perf_counter() - start, scope["method"], route_path)
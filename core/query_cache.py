@@ -0,0 +1,183 @@
+"""
+Caché opcional de resultados de consultas de app.crud, invalidada por etiquetas.
+
+Cada función cacheada declara las tablas que lee (sus etiquetas) y cada escritura
+invalida las tablas que modificó, después del commit:
+
+    @query_cache.cached("fincas")
+    def get_finca_by_id(db, finca_id): ...
+
+    db.commit()
+    query_cache.invalidate("fincas")
+
+Cada etiqueta tiene un número de versión e invalidar la incrementa. La llave de
+una entrada incluye la función, sus argumentos y las versiones de sus etiquetas
+leídas antes de consultar, así que después de una invalidación las entradas
+viejas simplemente dejan de encontrarse (y salen por LRU o TTL). Tampoco se
+guarda un resultado viejo si la escritura termina mientras la lectura consulta:
+queda con las versiones anteriores. Lo leído de la réplica no se guarda: puede
+ir atrasada respecto de escrituras que ya invalidaron (se entrega igual).
+
+Los resultados se guardan en memoria del worker (TTLCache: tamaño máximo, TTL y
+aciertos/fallos en /metrics). Dónde viven las versiones lo decide el backend:
+- "memory": en el proceso; una escritura solo invalida en su propio worker y en
+  los demás la entrada vence por QUERY_CACHE_TTL.
+- "redis": compartidas entre workers (y servidores); requiere el paquete redis.
+  El cliente es síncrono: con DB_ASYNC las funciones de app.crud corren en el hilo
+  del event loop (run_sync), así que ahí cada llamada a Redis pasa al threadpool.
+"""
+from functools import wraps
+from typing import Any, Callable, Dict, Iterable, Optional, Sequence, Tuple, TypeVar
+import logging
+import threading
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.engine import RowMapping
+from sqlalchemy.util import await_only
+from sqlalchemy.util.concurrency import in_greenlet
+
+from core.cache import TTLCache
+from core.config import settings
+from core.database import lee_de_replica
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+
+class MemoryTagBackend:
+    """
+    Versiones de etiquetas en memoria del proceso.
+    """
+
+    def __init__(self):
+        self._versions: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def versions(self, tags: Sequence[str]) -> Optional[Tuple[int, ...]]:
+        with self._lock:
+            return tuple(self._versions.get(tag, 0) for tag in tags)
+
+    def bump(self, tags: Iterable[str]) -> None:
+        with self._lock:
+            for tag in tags:
+                self._versions[tag] = self._versions.get(tag, 0) + 1
+
+
+class RedisTagBackend:
+    """
+    Versiones de etiquetas en Redis (INCR/MGET), compartidas por todos los workers.
+
+    Si Redis no responde, `versions` retorna None y la lectura va directo a la base
+    de datos; una invalidación fallida se registra en el log y esas entradas pueden
+    durar hasta su TTL.
+    """
+
+    def __init__(self, url: str, prefix: str = "avisena:query_cache"):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("QUERY_CACHE_BACKEND=redis requiere el paquete redis (pip install redis)") from e
+        self._errors = redis.exceptions.RedisError
+        self._client = redis.Redis.from_url(url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self.prefix = prefix
+
+    def _key(self, tag: str) -> str:
+        return f"{self.prefix}:tag:{tag}"
+
+    def _fuera_del_loop(self, fn: Callable, *args) -> Any:
+        # Dentro de run_sync (DB_ASYNC) se está en el hilo del event loop: no bloquearlo
+        if in_greenlet():
+            return await_only(run_in_threadpool(fn, *args))
+        return fn(*args)
+
+    def versions(self, tags: Sequence[str]) -> Optional[Tuple[int, ...]]:
+        try:
+            values = self._fuera_del_loop(self._client.mget, [self._key(tag) for tag in tags])
+        except self._errors as e:
+            logger.warning(f"Caché de consultas sin Redis, se consulta la base de datos: {e}")
+            return None
+        return tuple(int(value) if value is not None else 0 for value in values)
+
+    def bump(self, tags: Iterable[str]) -> None:
+        tags = list(tags)
+        try:
+            pipe = self._client.pipeline(transaction=False)
+            for tag in tags:
+                pipe.incr(self._key(tag))
+            self._fuera_del_loop(pipe.execute)
+        except self._errors as e:
+            logger.error(f"No se pudieron invalidar las etiquetas {tags} en Redis: {e}")
+
+
+def _guardable(value: Any) -> Any:
+    # Los RowMapping quedan ligados al resultado de la consulta; se guardan como dict
+    if isinstance(value, RowMapping):
+        return dict(value)
+    if isinstance(value, (list, tuple)) and all(isinstance(row, RowMapping) for row in value):
+        return [dict(row) for row in value]
+    return value
+
+
+class QueryCache:
+    """
+    Resultados de funciones de app.crud con firma `fn(db, *args)`, por función,
+    argumentos y versiones de sus etiquetas. Los resultados se comparten entre
+    peticiones y no deben modificarse.
+    """
+
+    def __init__(self, name: str, backend: Any, maxsize: int, ttl: float, enabled: bool = True):
+        self.enabled = enabled
+        self.backend = backend
+        self._entries = TTLCache(name, maxsize=maxsize, ttl=ttl)
+        self.invalidations = 0
+
+    def cached(self, *tags: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+        def decorator(fn: Callable[..., T]) -> Callable[..., T]:
+            nombre = f"{fn.__module__}.{fn.__qualname__}"
+
+            @wraps(fn)
+            def wrapper(db, *args, **kwargs):
+                if not self.enabled:
+                    return fn(db, *args, **kwargs)
+                versiones = self.backend.versions(tags)
+                if versiones is None:
+                    return fn(db, *args, **kwargs)
+                key = (nombre, args, tuple(sorted(kwargs.items())), versiones)
+                entrada = self._entries.get(key)
+                if entrada is not None:
+                    return entrada[0]
+                value = _guardable(fn(db, *args, **kwargs))
+                if not lee_de_replica(db):
+                    # En una tupla para poder guardar también None (por ejemplo, un id inexistente)
+                    self._entries.set(key, (value,))
+                return value
+
+            return wrapper
+        return decorator
+
+    def invalidate(self, *tags: str) -> None:
+        """
+        Invalida las etiquetas; llamar después del commit de la escritura.
+        """
+        if self.enabled and tags:
+            self.invalidations += 1
+            self.backend.bump(tags)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _crear_backend():
+    if settings.QUERY_CACHE_BACKEND == "redis":
+        return RedisTagBackend(settings.QUERY_CACHE_REDIS_URL)
+    return MemoryTagBackend()
+
+
+query_cache = QueryCache(
+    "consultas",
+    backend=_crear_backend() if settings.QUERY_CACHE_ENABLED else MemoryTagBackend(),
+    maxsize=settings.QUERY_CACHE_SIZE,
+    ttl=settings.QUERY_CACHE_TTL,
+    enabled=settings.QUERY_CACHE_ENABLED
+)
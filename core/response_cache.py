@@ -0,0 +1,104 @@
+"""
+Caché de respuestas HTTP ya serializadas para catálogos que casi no cambian.
+
+Cada entrada guarda el JSON, su versión gzip (comprimida una sola vez) y un ETag
+fuerte calculado sobre el contenido. Como el ETag depende solo de los bytes, todos
+los workers generan el mismo para los mismos datos y el cliente recibe 304 aunque
+la revalidación caiga en otro worker.
+
+La invalidación la hacen las funciones de app.crud después del commit. Solo llega
+al worker que hizo el cambio; en los demás la entrada vence por TTL.
+"""
+from hashlib import sha256
+from typing import Hashable, NamedTuple, Optional
+import gzip
+import threading
+
+from fastapi import Request, Response
+
+from core.cache import TTLCache
+
+
+class CachedBody(NamedTuple):
+    body: bytes
+    etag: str
+    # None cuando comprimir no reduce el tamaño (respuestas muy pequeñas)
+    gzip_body: Optional[bytes]
+    gzip_etag: str
+
+
+def _comprimir(body: bytes) -> CachedBody:
+    digest = sha256(body).hexdigest()[:32]
+    # mtime=0: el mismo contenido produce los mismos bytes en todos los workers
+    comprimido = gzip.compress(body, compresslevel=9, mtime=0)
+    if len(comprimido) >= len(body):
+        comprimido = None
+    return CachedBody(body, f'"{digest}"', comprimido, f'"{digest}-gz"')
+
+
+def _etags(if_none_match: str) -> set:
+    # Para If-None-Match la comparación es débil: W/"x" equivale a "x"
+    return {
+        etag.strip().removeprefix("W/")
+        for etag in if_none_match.split(",")
+        if etag.strip()
+    }
+
+
+class ResponseCache:
+    """
+    Cuerpos de respuesta por llave (por ejemplo "all" o ("by-id", 3)).
+
+    Para no guardar datos viejos cuando una escritura ocurre mientras otra petición
+    consulta la base, se toma `generation()` antes de consultar y se pasa a `put`:
+    si hubo una invalidación en medio, el cuerpo se entrega pero no se guarda.
+    Lo leído de la réplica tampoco se guarda (`guardar=False`): puede ser anterior
+    a la última invalidación.
+    """
+
+    def __init__(self, name: str, maxsize: int, ttl: float):
+        self._entries = TTLCache(name, maxsize=maxsize, ttl=ttl)
+        self._generation = 0
+        self._lock = threading.Lock()
+
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, key: Hashable) -> Optional[CachedBody]:
+        return self._entries.get(key)
+
+    def put(self, key: Hashable, body: bytes, generation: int, guardar: bool = True) -> CachedBody:
+        entrada = _comprimir(body)
+        with self._lock:
+            if guardar and generation == self._generation:
+                self._entries.set(key, entrada)
+        return entrada
+
+    def invalidate(self) -> None:
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+
+
+def cached_response(request: Request, entrada: CachedBody) -> Response:
+    """
+    304 si el cliente ya tiene esta versión (If-None-Match); si no, el cuerpo
+    guardado, comprimido cuando el cliente acepta gzip.
+    """
+    usar_gzip = entrada.gzip_body is not None and "gzip" in request.headers.get("accept-encoding", "")
+    etag = entrada.gzip_etag if usar_gzip else entrada.etag
+    headers = {
+        "ETag": etag,
+        # Requiere autenticación: solo caché privada y siempre revalidando
+        "Cache-Control": "private, no-cache",
+        "Vary": "Accept-Encoding, Authorization",
+    }
+
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and (if_none_match.strip() == "*" or _etags(if_none_match) & {entrada.etag, entrada.gzip_etag}):
+        return Response(status_code=304, headers=headers)
+
+    if usar_gzip:
+        headers["Content-Encoding"] = "gzip"
+        return Response(entrada.gzip_body, media_type="application/json", headers=headers)
+    return Response(entrada.body, media_type="application/json", headers=headers)
@@ -0,0 +1,380 @@
+"""
+Definición de las tablas de AVISENA y de los índices que necesitan las consultas de app.crud.
+
+Uso:
+    python -m core.schema            # crea tablas faltantes y agrega columnas/índices faltantes
+    python -m core.schema --explain  # ejecuta EXPLAIN sobre las consultas de app.crud
+
+`ensure_schema` nunca borra ni modifica columnas o índices existentes: solo agrega
+lo que falta, así que puede ejecutarse en cada despliegue. `--explain` falla (código
+de salida 1) si alguna consulta que debería usar un índice recorre la tabla completa;
+no modifica datos (todo se revierte) y conviene ejecutarlo contra una base local con
+datos representativos. tests/test_explain_crud.py hace lo mismo con datos de ejemplo.
+"""
+from datetime import date
+from typing import Any, Callable, Iterator, List, Tuple
+import logging
+import sys
+
+from sqlalchemy import (
+    Boolean, BigInteger, Column, Date, Enum, Float, ForeignKey, Index, Integer,
+    String, Table, event, func, inspect, select, text
+)
+from sqlalchemy.engine import Engine
+from sqlalchemy.schema import CreateColumn
+
+from core.database import metadata
+
+logger = logging.getLogger(__name__)
+
+roles = Table(
+    "roles", metadata,
+    Column("id_rol", Integer, primary_key=True, autoincrement=True),
+    Column("nombre_rol", String(50), nullable=False),
+    Column("estado", Boolean, nullable=False, default=True),
+)
+
+modulos = Table(
+    "modulos", metadata,
+    Column("id_modulo", Integer, primary_key=True, autoincrement=True),
+    Column("nombre_modulo", String(50), nullable=False),
+)
+
+usuarios = Table(
+    "usuarios", metadata,
+    Column("id_usuario", Integer, primary_key=True, autoincrement=True),
+    Column("nombre", String(80), nullable=False),
+    Column("id_rol", Integer, ForeignKey("roles.id_rol"), nullable=False),
+    Column("email", String(100), nullable=False),
+    Column("telefono", String(15), nullable=False),
+    Column("documento", String(20), nullable=False),
+    Column("pass_hash", String(255), nullable=False),
+    Column("estado", Boolean, nullable=False, default=True),
+    # Login y /users/by-email buscan por email
+    Index("ux_usuarios_email", "email", unique=True),
+    Index("ix_usuarios_id_rol", "id_rol"),
+)
+
+permisos = Table(
+    "permisos", metadata,
+    Column("id_rol", Integer, ForeignKey("roles.id_rol"), primary_key=True),
+    Column("id_modulo", Integer, ForeignKey("modulos.id_modulo"), primary_key=True),
+    Column("insertar", Boolean, nullable=False, default=False),
+    Column("actualizar", Boolean, nullable=False, default=False),
+    Column("seleccionar", Boolean, nullable=False, default=False),
+    Column("borrar", Boolean, nullable=False, default=False),
+    # Si la tabla existente usa otra llave primaria, este índice cubre la búsqueda por (rol, módulo)
+    Index("ix_permisos_rol_modulo", "id_rol", "id_modulo"),
+)
+
+fincas = Table(
+    "fincas", metadata,
+    Column("id_finca", Integer, primary_key=True, autoincrement=True),
+    Column("nombre", String(30), nullable=False),
+    Column("longitud", Float, nullable=False),
+    Column("latitud", Float, nullable=False),
+    Column("id_usuario", Integer, ForeignKey("usuarios.id_usuario"), nullable=False),
+    Column("estado", Boolean, nullable=False, default=True),
+    # Geohash de (latitud, longitud), ver core/geo.py; lo calcula app.crud.fincas.
+    # Las filas anteriores a la columna se completan con `python -m app.crud.fincas`
+    Column("geohash", String(12, collation="ascii_bin"), nullable=True),
+    Index("ix_fincas_id_usuario", "id_usuario"),
+    # /fincas/cercanas y /fincas/en-area consultan rangos de prefijos de geohash
+    Index("ix_fincas_geohash", "geohash"),
+)
+
+galpones = Table(
+    "galpones", metadata,
+    Column("id_galpon", Integer, primary_key=True, autoincrement=True),
+    Column("id_finca", Integer, ForeignKey("fincas.id_finca"), nullable=False),
+    Column("nombre", String(50), nullable=False),
+    Index("ix_galpones_id_finca", "id_finca"),
+)
+
+tipo_huevos = Table(
+    "tipo_huevos", metadata,
+    Column("id_tipo_huevo", Integer, primary_key=True, autoincrement=True),
+    Column("Color", String(30), nullable=False),
+    Column("Tamaño", String(30), nullable=False),
+)
+
+produccion_huevos = Table(
+    "produccion_huevos", metadata,
+    Column("id_produccion", Integer, primary_key=True, autoincrement=True),
+    Column("id_galpon", Integer, ForeignKey("galpones.id_galpon"), nullable=False),
+    Column("cantidad", Integer, nullable=False),
+    Column("fecha", Date, nullable=False),
+    Column("id_tipo_huevo", Integer, ForeignKey("tipo_huevos.id_tipo_huevo"), nullable=False),
+    # NULL en los registros manuales; 'contador' en la fila donde se suman los incrementos
+    # de los contadores, una por (galpón, fecha, tipo) gracias a ux_produccion_contador
+    # (los NULL no se repiten entre sí en un índice único)
+    Column("origen", Enum("contador"), nullable=True),
+    # Orden y paginación por cursor (fecha, id_produccion) y filtros por rango de fechas
+    Index("ix_produccion_fecha_id", "fecha", "id_produccion"),
+    Index("ix_produccion_id_galpon", "id_galpon"),
+    Index("ix_produccion_id_tipo_huevo", "id_tipo_huevo"),
+    Index("ux_produccion_contador", "id_galpon", "fecha", "id_tipo_huevo", "origen", unique=True),
+)
+
+produccion_huevos_resumen = Table(
+    "produccion_huevos_resumen", metadata,
+    Column("periodo", Enum("dia", "semana", "mes"), primary_key=True),
+    Column("inicio", Date, primary_key=True),
+    Column("id_galpon", Integer, primary_key=True),
+    Column("id_tipo_huevo", Integer, primary_key=True),
+    Column("cantidad", BigInteger, nullable=False, default=0),
+)
+
+stock = Table(
+    "stock", metadata,
+    Column("id_producto", Integer, primary_key=True, autoincrement=True),
+    Column("unidad_medida", Enum("unidad", "panal", "docena", "medio_panal"), nullable=False),
+    Column("id_produccion", Integer, ForeignKey("produccion_huevos.id_produccion"), nullable=False),
+    Column("cantidad_disponible", Integer, nullable=False),
+    # Se incrementa en cada escritura; es el ETag de GET /stock/by-id y se compara con If-Match en el PUT
+    Column("version", Integer, nullable=False, server_default="1"),
+    Index("ix_stock_id_produccion", "id_produccion"),
+)
+
+
+def _covered(columns: Tuple[str, ...], unique: bool, existing: List[Tuple[Tuple[str, ...], bool]]) -> bool:
+    # Un índice existente que empieza con las mismas columnas ya sirve para las mismas búsquedas;
+    # uno único solo está cubierto por otro único sobre exactamente esas columnas
+    if unique:
+        return any(cols == columns and es_unico for cols, es_unico in existing)
+    return any(tuple(cols[:len(columns)]) == columns for cols, _ in existing)
+
+
+def _duplicados(conn, table: Table, columns: Tuple[str, ...], limite: int = 5) -> List[tuple]:
+    cols = [table.c[name] for name in columns]
+    # Las filas con algún NULL no chocan en un índice único
+    return conn.execute(
+        select(*cols).where(*(col.isnot(None) for col in cols))
+        .group_by(*cols).having(func.count() > 1).limit(limite)
+    ).all()
+
+
+def ensure_schema(engine: Engine) -> None:
+    """
+    Crea las tablas que no existen y agrega a las existentes las columnas e índices declarados.
+
+    Si un índice único no puede crearse porque la tabla ya tiene valores repetidos
+    (por ejemplo, emails duplicados en usuarios), se registra el error con algunos de
+    esos valores y se crea en su lugar un índice normal para que las búsquedas no
+    recorran la tabla; al volver a ejecutarlo, después de corregir los duplicados, se
+    crea el índice único.
+    """
+    inspector = inspect(engine)
+    existentes = set(inspector.get_table_names())
+
+    with engine.begin() as conn:
+        for table in metadata.sorted_tables:
+            if table.name not in existentes:
+                table.create(conn)
+                logger.info(f"Tabla creada: {table.name}")
+                continue
+
+            columnas = {col["name"].lower() for col in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name.lower() not in columnas:
+                    ddl = CreateColumn(column).compile(dialect=engine.dialect)
+                    conn.execute(text(f"ALTER TABLE {engine.dialect.identifier_preparer.quote(table.name)} ADD COLUMN {ddl}"))
+                    logger.info(f"Columna agregada: {table.name}.{column.name}")
+
+            indices = [
+                (tuple(idx["column_names"]), bool(idx.get("unique")))
+                for idx in inspector.get_indexes(table.name)
+            ]
+            pk = inspector.get_pk_constraint(table.name).get("constrained_columns") or []
+            indices.append((tuple(pk), True))
+            for index in table.indexes:
+                columns = tuple(col.name for col in index.columns)
+                if _covered(columns, bool(index.unique), indices):
+                    continue
+                if index.unique:
+                    repetidos = _duplicados(conn, table, columns)
+                    if repetidos:
+                        logger.error(
+                            f"No se creó el índice único {index.name}: {table.name}{list(columns)} tiene "
+                            f"valores repetidos, por ejemplo {[tuple(fila) for fila in repetidos]}. "
+                            f"Corríjalos y vuelva a ejecutar ensure_schema"
+                        )
+                        if not _covered(columns, False, indices):
+                            # Con DDL directo: un Index() sobre estas columnas quedaría agregado a la tabla declarada
+                            quote = engine.dialect.identifier_preparer.quote
+                            respaldo = index.name.replace("ux_", "ix_", 1)
+                            conn.execute(text(
+                                f"CREATE INDEX {quote(respaldo)} ON {quote(table.name)} "
+                                f"({', '.join(quote(name) for name in columns)})"
+                            ))
+                            indices.append((columns, False))
+                            logger.info(f"Índice creado: {respaldo} (no único, mientras existan duplicados)")
+                        continue
+                index.create(conn)
+                indices.append((columns, bool(index.unique)))
+                logger.info(f"Índice creado: {index.name}")
+
+
+# Con menos filas estimadas, recorrer la tabla es más barato que usar un índice
+# (catálogos como roles o tipo_huevos) y el optimizador lo prefiere con razón
+MAX_FILAS_SCAN = 100
+
+
+def _casos_crud() -> List[Tuple[str, Callable, tuple, bool]]:
+    """
+    Llamadas a revisar, una o más por cada función pública de app.crud que recibe `db`:
+    (nombre, función, argumentos, se permite recorrer toda la tabla). Los listados
+    completos, las recargas y los backfill leen todas las filas por diseño.
+
+    Los ids corresponden a los datos de ejemplo de tests/conftest.py; contra otra base
+    algunas llamadas pueden tomar el camino de "no existe".
+    """
+    from app.crud import crud_stock, fincas as crud_fincas, permisos, produccion_huevos as crud_produccion
+    from app.crud import resumen_produccion, tipo_huevos as crud_tipo_huevos, users as crud_users
+    from app.schemas.fincas import FincaCreate, FincaUpdate
+    from app.schemas.produccion_huevos import ProduccionHuevosCreate, ProduccionHuevosUpdate
+    from app.schemas.stock import StockCreate, StockUpdate
+    from app.schemas.tipo_huevos import TipoHuevosCreate, TipoHuevosUpdate
+    from app.schemas.users import UserCreate, UserUpdate
+
+    cursor = crud_produccion.encode_cursor(date(2024, 3, 1), 1)
+    produccion = ProduccionHuevosCreate(id_galpon=1, cantidad=120, fecha=date(2024, 3, 2), id_tipo_huevo=1)
+    return [
+        ("users.create_user", crud_users.create_user, (UserCreate(
+            nombre="Usuario EXPLAIN", id_rol=3, email="explain@example.com", telefono="3000000000",
+            documento="99999999", estado=True, pass_hash="clave-explain"
+        ),), False),
+        ("users.get_user_by_email_for_login", crud_users.get_user_by_email_for_login, ("usuario7@example.com",), False),
+        ("users.get_user_by_email", crud_users.get_user_by_email, ("usuario7@example.com",), False),
+        ("users.get_user_by_id", crud_users.get_user_by_id, (7,), False),
+        ("users.get_principal", crud_users.get_principal, (8,), False),
+        ("users.get_all_user_except_admins", crud_users.get_all_user_except_admins, (), True),
+        ("users.update_user", crud_users.update_user, (7, UserUpdate(telefono="3001111111")), False),
+        ("users.update_user_by_id", crud_users.update_user_by_id, (8, UserUpdate(nombre="Usuario ocho")), False),
+        ("fincas.create_finca", crud_fincas.create_finca, (FincaCreate(
+            nombre="Finca EXPLAIN", latitud=4.6, longitud=-74.08, id_usuario=1
+        ),), False),
+        ("fincas.get_finca_by_id", crud_fincas.get_finca_by_id, (3,), False),
+        ("fincas.get_fincas_by_usuario", crud_fincas.get_fincas_by_usuario, (3,), False),
+        ("fincas.get_all_finca", crud_fincas.get_all_finca, (), True),
+        ("fincas.update_finca_by_id", crud_fincas.update_finca_by_id, (3, FincaUpdate(latitud=4.7, longitud=-74.1)), False),
+        ("fincas.get_fincas_cercanas", crud_fincas.get_fincas_cercanas, (4.6, -74.08, 10), False),
+        ("fincas.get_fincas_en_area", crud_fincas.get_fincas_en_area, (4.5, -74.2, 4.7, -74.0), False),
+        # La carga del índice de clusters lee las coordenadas de todas las fincas
+        ("fincas.get_fincas_clusters", crud_fincas.get_fincas_clusters, (5, -5.0, -80.0, 13.0, -66.0), True),
+        ("fincas.backfill", crud_fincas.backfill, (), False),
+        ("permisos.reload_permissions", permisos.reload_permissions, (), True),
+        ("permisos.verify_permissions", permisos.verify_permissions, (1, 24, "seleccionar"), False),
+        ("produccion.create_produccion_huevos", crud_produccion.create_produccion_huevos, (produccion, "panal"), False),
+        ("produccion.create_produccion_huevos_bulk", crud_produccion.create_produccion_huevos_bulk,
+         ([produccion] * 3, 1000, "docena"), False),
+        ("produccion.upsert_produccion_incrementos", crud_produccion.upsert_produccion_incrementos,
+         ({(1, date(2024, 3, 2), 1): 5, (2, date(2024, 3, 3), 2): 3},), False),
+        ("produccion.get_produccion_huevos_by_id", crud_produccion.get_produccion_huevos_by_id, (10,), False),
+        ("produccion.get_all_produccion_huevos", crud_produccion.get_all_produccion_huevos,
+         (10, 0, "2024-03-01", "2024-03-31"), False),
+        ("produccion.get_produccion_huevos_keyset", crud_produccion.get_produccion_huevos_keyset,
+         (10, cursor), False),
+        ("produccion.iter_produccion_huevos", crud_produccion.iter_produccion_huevos,
+         ("2024-03-01", "2024-03-07"), False),
+        ("produccion.update_produccion_huevos_by_id", crud_produccion.update_produccion_huevos_by_id,
+         (10, ProduccionHuevosUpdate(cantidad=50), "panal"), False),
+        # Sin stock que la referencie (el de ejemplo cubre las producciones 1 a 5000)
+        ("produccion.delete_produccion_huevos_by_id", crud_produccion.delete_produccion_huevos_by_id, (15000,), False),
+        ("resumen.apply_deltas", resumen_produccion.apply_deltas, ([(1, 1, date(2024, 3, 2), 10)],), False),
+        ("resumen.get_resumen", resumen_produccion.get_resumen, ("dia", "galpon", "2024-03-01", "2024-03-31"), False),
+        ("resumen.backfill", resumen_produccion.backfill, (), True),
+        ("stock.create_stock", crud_stock.create_stock, (StockCreate(
+            unidad_medida="panal", id_produccion=12, cantidad_disponible=5
+        ),), False),
+        ("stock.get_stock_by_id", crud_stock.get_stock_by_id, (5,), False),
+        ("stock.get_all_stock", crud_stock.get_all_stock, (), True),
+        ("stock.update_stock_by_id", crud_stock.update_stock_by_id, (5, StockUpdate(cantidad_disponible=10)), False),
+        ("stock.increment_stock", crud_stock.increment_stock, (5, -1), False),
+        ("stock.insert_stock_derivado", crud_stock.insert_stock_derivado, ([(13, 60)], "docena"), False),
+        ("stock.sync_stock_derivado", crud_stock.sync_stock_derivado, (14, "panal", 30, 60), False),
+        ("tipo_huevos.create_tipo_huevo", crud_tipo_huevos.create_tipo_huevo, (TipoHuevosCreate(
+            Color="verde", Tamaño="B"
+        ),), False),
+        ("tipo_huevos.get_tipo_huevo_by_id", crud_tipo_huevos.get_tipo_huevo_by_id, (1,), False),
+        ("tipo_huevos.get_all_tipo_huevos", crud_tipo_huevos.get_all_tipo_huevos, (), True),
+        ("tipo_huevos.update_tipo_huevo_by_id", crud_tipo_huevos.update_tipo_huevo_by_id,
+         (1, TipoHuevosUpdate(Color="blanco")), False),
+    ]
+
+
+def explain_crud(engine: Engine) -> List[str]:
+    """
+    Ejecuta los casos de `_casos_crud` y después EXPLAIN sobre cada SELECT/UPDATE/DELETE
+    que emitieron, con los mismos parámetros y en un cursor aparte. Así las funciones
+    reciben sus resultados reales y recorren todas sus consultas (incluidas las que
+    dependen de una lectura anterior).
+
+    Todo ocurre en una transacción que se revierte al final: los commit de app.crud
+    solo liberan un savepoint, así que no se modifican datos.
+
+    Retorna la lista de problemas: errores al ejecutar un caso y planes con type=ALL
+    sobre más de MAX_FILAS_SCAN filas en consultas que deberían usar un índice.
+    """
+    from sqlalchemy.orm import Session
+
+    problemas: List[str] = []
+    emitidas: List[Tuple[str, Any]] = []
+
+    def registrar(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "UPDATE", "DELETE")):
+            emitidas.append((statement, parameters[0] if executemany else parameters))
+
+    with engine.connect() as conn:
+        transaccion = conn.begin()
+        event.listen(conn, "after_cursor_execute", registrar)
+        try:
+            with Session(bind=conn, autoflush=False, join_transaction_mode="create_savepoint") as db:
+                for caso, funcion, args, permitir_scan in _casos_crud():
+                    emitidas.clear()
+                    try:
+                        resultado = funcion(db, *args)
+                        if isinstance(resultado, Iterator):
+                            for _ in resultado:
+                                pass
+                    except Exception as e:
+                        problemas.append(f"{caso}: error al ejecutar ({e})")
+                        continue
+
+                    cursor = conn.connection.cursor()
+                    try:
+                        for statement, parameters in list(emitidas):
+                            cursor.execute("EXPLAIN " + statement, parameters)
+                            nombres = [d[0] for d in cursor.description]
+                            for fila in cursor.fetchall():
+                                plan = dict(zip(nombres, fila))
+                                logger.info(
+                                    f"{caso}: tabla={plan.get('table')} type={plan.get('type')} "
+                                    f"key={plan.get('key')} rows={plan.get('rows')}"
+                                )
+                                if (
+                                    plan.get("type") == "ALL"
+                                    and (plan.get("rows") or 0) > MAX_FILAS_SCAN
+                                    and not permitir_scan
+                                ):
+                                    problemas.append(
+                                        f"{caso}: recorrido completo de '{plan.get('table')}' en: {statement.strip()}"
+                                    )
+                    finally:
+                        cursor.close()
+        finally:
+            event.remove(conn, "after_cursor_execute", registrar)
+            transaccion.rollback()
+    return problemas
+
+
+if __name__ == "__main__":
+    from core.database import engine
+
+    logging.basicConfig(level=logging.INFO)
+    if "--explain" in sys.argv[1:]:
+        errores = explain_crud(engine)
+        for error in errores:
+            logger.error(error)
+        sys.exit(1 if errores else 0)
+    ensure_schema(engine)
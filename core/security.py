@@ -1,7 +1,13 @@
 from passlib.context import CryptContext
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta, timezone
 from jose import JWTError, jwt
 from core.config import settings
+import asyncio
+import multiprocessing
+import os
+import threading
+import time
 
 # Configurar hashing de contraseñas
 pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
@@ -14,6 +20,109 @@ def get_hashed_password(password: str):
 def verify_password(plain_password: str, hashed_password: str):
     return pwd_context.verify(plain_password, hashed_password)
 
+
+class PasswordQueueFull(Exception):
+    """La cola de verificación de contraseñas alcanzó su límite."""
+
+
+class PasswordVerifier:
+    """
+    Ejecuta bcrypt (verificación y hash de contraseñas) fuera del event loop.
+
+    Usa un pool de procesos (o de hilos, según PASSWORD_EXECUTOR) con un número
+    fijo de workers y una cola acotada: si ya hay PASSWORD_QUEUE_MAX verificaciones
+    pendientes se lanza PasswordQueueFull en lugar de seguir acumulando trabajo.
+    Lleva estadísticas de profundidad de cola y latencia (espera + cómputo).
+    """
+
+    def __init__(self, kind: str, workers: int, max_pending: int):
+        self.kind = kind
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Executor = None
+        self._lock = threading.Lock()
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+
+    def _get_executor(self) -> Executor:
+        # Se crea de forma perezosa para no lanzar procesos al importar el módulo
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == "process":
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.workers,
+                            mp_context=multiprocessing.get_context("spawn")
+                        )
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.workers,
+                            thread_name_prefix="password"
+                        )
+        return self._executor
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    async def hash(self, password: str) -> str:
+        return await self._run(get_hashed_password, password)
+
+    async def _run(self, fn, *args):
+        with self._lock:
+            if self.pending >= self.max_pending:
+                self.rejected += 1
+                raise PasswordQueueFull()
+            self.pending += 1
+
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                self.pending -= 1
+                self.completed += 1
+                self.total_seconds += elapsed
+                self.max_seconds = max(self.max_seconds, elapsed)
+
+    def stats(self) -> dict:
+        return {
+            "executor": self.kind,
+            "workers": self.workers,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+            "avg_seconds": self.total_seconds / self.completed if self.completed else 0.0,
+            "max_seconds": self.max_seconds,
+        }
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+
+def password_workers(server_workers: int = 1) -> int:
+    """
+    Procesos de verificación por worker del servidor: PASSWORD_WORKERS si se
+    configuró, si no las CPUs repartidas entre los workers para que todos juntos
+    no lancen más procesos bcrypt que núcleos.
+    """
+    if settings.PASSWORD_WORKERS > 0:
+        return settings.PASSWORD_WORKERS
+    return max(1, (os.cpu_count() or 1) // max(server_workers, 1))
+
+
+password_verifier = PasswordVerifier(
+    kind=settings.PASSWORD_EXECUTOR,
+    workers=password_workers(),
+    max_pending=settings.PASSWORD_QUEUE_MAX
+)
+
 # Función para crear un token JWT
 def create_access_token(data: dict):
     to_encode = data.copy()
@@ -0,0 +1,68 @@
+"""
+Serialización rápida de listados grandes.
+
+Con `response_model=List[Modelo]` FastAPI crea un objeto pydantic por fila y luego
+lo vuelve a convertir a JSON. Para listados de miles de filas ese trabajo domina
+el CPU de la respuesta.
+
+`json_list` valida y serializa la lista completa en una sola llamada de
+pydantic-core contra un TypedDict con los mismos campos y restricciones del
+modelo (sin instanciar el modelo), y entrega los bytes directamente en la
+respuesta. El `response_model` del endpoint se conserva para la documentación.
+"""
+from functools import lru_cache
+from typing import Annotated, Any, Iterable, List, Type
+
+from fastapi import Response
+from pydantic import AfterValidator, BaseModel, EmailStr, TypeAdapter
+from typing_extensions import NotRequired, TypedDict
+
+_email_adapter = TypeAdapter(EmailStr)
+
+
+@lru_cache(maxsize=65536)
+def _email(valor: str) -> str:
+    # Mismo resultado (normalizado) y mismos errores que EmailStr; validar con
+    # email_validator es lo más costoso de un listado de usuarios y los mismos
+    # emails se repiten en cada listado, así que se recuerda por valor
+    return _email_adapter.validate_python(valor)
+
+
+# Tipos equivalentes para la salida: EmailStr es str_schema + validación posterior
+_TIPOS_SALIDA = {EmailStr: Annotated[str, AfterValidator(_email)]}
+
+
+@lru_cache(maxsize=None)
+def row_type(model: Type[BaseModel]) -> type:
+    """
+    TypedDict equivalente a `model`: mismos campos, tipos y restricciones (Field).
+    Los campos con valor por defecto no son obligatorios en la fila.
+    """
+    campos = {}
+    for name, field in model.model_fields.items():
+        tipo = _TIPOS_SALIDA.get(field.annotation, field.annotation)
+        if field.metadata:
+            tipo = Annotated[(tipo, *field.metadata)]
+        if not field.is_required():
+            tipo = NotRequired[tipo]
+        campos[name] = tipo
+    return TypedDict(f"{model.__name__}Row", campos)
+
+
+@lru_cache(maxsize=None)
+def list_adapter(model: Type[BaseModel]) -> TypeAdapter:
+    # Construir el validador es costoso; se hace una vez por modelo
+    return TypeAdapter(List[row_type(model)])
+
+
+def dump_list(model: Type[BaseModel], rows: Iterable[Any]) -> bytes:
+    """
+    Valida `rows` (RowMapping o dict) con los campos de `model` y retorna el JSON.
+    Las columnas que no están en el modelo se descartan, igual que con response_model.
+    """
+    adapter = list_adapter(model)
+    return adapter.dump_json(adapter.validate_python(rows))
+
+
+def json_list(model: Type[BaseModel], rows: Iterable[Any]) -> Response:
+    return Response(content=dump_list(model, rows), media_type="application/json")
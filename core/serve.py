@@ -0,0 +1,192 @@
+"""
+Lanzador de producción con varios workers.
+
+Uso:
+    python -m core.serve --host 0.0.0.0 --port 8000
+
+El proceso maestro importa y calienta la aplicación una sola vez, abre el socket
+de escucha y luego crea los workers con fork(). Cada worker hereda la aplicación
+ya cargada pero crea su propio pool de conexiones. El maestro reinicia los
+workers que mueran y, al recibir SIGTERM/SIGINT, los detiene de forma ordenada.
+"""
+import argparse
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+import uvicorn
+
+from core.config import settings
+
+logger = logging.getLogger(__name__)
+
+
+def default_workers() -> int:
+    """
+    Un worker por CPU, sin superar las conexiones que MySQL puede atender
+    considerando que cada worker puede abrir pool_size + max_overflow conexiones.
+    """
+    if settings.SERVE_WORKERS > 0:
+        return settings.SERVE_WORKERS
+    cpus = os.cpu_count() or 1
+    conexiones_por_worker = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+    por_conexiones = settings.DB_MAX_CONNECTIONS // max(conexiones_por_worker, 1)
+    return max(1, min(cpus, por_conexiones))
+
+
+def preload_app():
+    """
+    Importa la aplicación y prepara lo que es igual para todos los workers
+    (rutas, esquemas de validación y el documento OpenAPI).
+    """
+    from main import app
+    from core.database import engine, replica_engine
+
+    app.openapi()
+    # Si el calentamiento abrió conexiones no deben compartirse con los hijos
+    engine.dispose()
+    replica_engine.dispose()
+    return app
+
+
+def bind_socket(host: str, port: int) -> socket.socket:
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def run_worker(app, sock: socket.socket, args) -> None:
+    from core.database import engine, replica_engine
+
+    # Descarta el pool heredado sin cerrar conexiones ajenas; el worker crea las suyas
+    engine.dispose(close=False)
+    replica_engine.dispose(close=False)
+
+    config = uvicorn.Config(
+        app,
+        proxy_headers=True,
+        forwarded_allow_ips="*",
+        log_level=args.log_level,
+        timeout_graceful_shutdown=settings.SERVE_GRACEFUL_TIMEOUT,
+    )
+    server = uvicorn.Server(config)
+    # uvicorn instala sus propios manejadores de SIGTERM/SIGINT y termina las peticiones en curso
+    server.run(sockets=[sock])
+
+
+class Master:
+    def __init__(self, app, sock: socket.socket, args):
+        self.app = app
+        self.sock = sock
+        self.args = args
+        self.workers = {}
+        self.stopping = False
+
+    def spawn(self) -> None:
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            code = 0
+            try:
+                run_worker(self.app, self.sock, self.args)
+            except Exception:
+                logger.exception("Error en el worker")
+                code = 1
+            finally:
+                os._exit(code)
+        self.workers[pid] = time.monotonic()
+        logger.info(f"Worker {pid} iniciado")
+
+    def handle_stop(self, signum, frame) -> None:
+        self.stopping = True
+
+    def run(self) -> None:
+        signal.signal(signal.SIGTERM, self.handle_stop)
+        signal.signal(signal.SIGINT, self.handle_stop)
+
+        for _ in range(self.args.workers):
+            self.spawn()
+
+        while not self.stopping:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                pid = 0
+            if pid and pid in self.workers:
+                iniciado = self.workers.pop(pid)
+                logger.warning(f"Worker {pid} terminó con estado {status}")
+                # Evita un ciclo de reinicios inmediato si el worker falla al arrancar
+                if time.monotonic() - iniciado < 1:
+                    time.sleep(1)
+                if not self.stopping:
+                    self.spawn()
+            else:
+                time.sleep(0.5)
+
+        self.shutdown()
+
+    def shutdown(self) -> None:
+        logger.info("Deteniendo workers...")
+        for pid in list(self.workers):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                self.workers.pop(pid, None)
+
+        limite = time.monotonic() + settings.SERVE_GRACEFUL_TIMEOUT + 5
+        while self.workers and time.monotonic() < limite:
+            try:
+                pid, _ = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid:
+                self.workers.pop(pid, None)
+            else:
+                time.sleep(0.1)
+
+        for pid in list(self.workers):
+            logger.warning(f"Worker {pid} no terminó a tiempo, se fuerza su cierre")
+            try:
+                os.kill(pid, signal.SIGKILL)
+            except ProcessLookupError:
+                pass
+        self.sock.close()
+
+
+def main(argv=None) -> None:
+    parser = argparse.ArgumentParser(description="Servidor de producción de AVISENA")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    parser.add_argument("--workers", type=int, default=default_workers())
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=args.log_level.upper())
+
+    app = preload_app()
+
+    from core.security import password_verifier, password_workers
+
+    # El pool de verificación se crea en cada worker al primer login,
+    # y se reparten las CPUs entre los workers en vez de lanzar un proceso por CPU en cada uno
+    password_verifier.workers = password_workers(args.workers if hasattr(os, "fork") else 1)
+
+    if not hasattr(os, "fork"):
+        # Windows no tiene fork(): se atiende con un solo proceso
+        uvicorn.run(app, host=args.host, port=args.port, log_level=args.log_level)
+        return
+
+    sock = bind_socket(args.host, args.port)
+    logger.info(f"Escuchando en {args.host}:{args.port} con {args.workers} workers")
+    Master(app, sock, args).run()
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
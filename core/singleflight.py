@@ -0,0 +1,65 @@
+"""
+Single-flight para lecturas idénticas concurrentes.
+
+Cuando varias peticiones piden lo mismo al mismo tiempo (por ejemplo /stock/all
+en el cambio de turno), la primera ejecuta la consulta y las demás esperan ese
+mismo resultado en vez de repetirla. No es una caché: en cuanto la ejecución
+termina la llave se libera y la siguiente petición consulta de nuevo, así que
+nunca se entregan datos anteriores a la petición.
+
+Funciona dentro de un worker (un event loop); los resultados se comparten entre
+peticiones y no deben modificarse.
+"""
+from typing import Any, Awaitable, Callable, Dict, Hashable, TypeVar
+import asyncio
+
+T = TypeVar("T")
+
+# Registro por nombre para /metrics
+grupos: Dict[str, "SingleFlight"] = {}
+
+
+class SingleFlight:
+    """
+    `await do(key, fn)` ejecuta `fn()` una vez por llave en curso; quien llega
+    mientras tanto recibe el mismo resultado (o la misma excepción).
+
+    La ejecución corre en su propia tarea: si la petición que la inició se
+    cancela, las que la esperan igual reciben el resultado.
+
+    Estadísticas por etiqueta (`label`): llamadas y ejecuciones reales; la
+    diferencia son las llamadas que se resolvieron con una ejecución compartida.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._en_curso: Dict[Hashable, asyncio.Future] = {}
+        self.calls: Dict[str, int] = {}
+        self.executions: Dict[str, int] = {}
+        grupos[name] = self
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]], label: str = "") -> T:
+        self.calls[label] = self.calls.get(label, 0) + 1
+        tarea = self._en_curso.get(key)
+        if tarea is None:
+            self.executions[label] = self.executions.get(label, 0) + 1
+            tarea = asyncio.ensure_future(fn())
+            self._en_curso[key] = tarea
+            tarea.add_done_callback(lambda _, key=key: self._en_curso.pop(key, None))
+        return await asyncio.shield(tarea)
+
+    def __len__(self) -> int:
+        return len(self._en_curso)
+
+    def stats(self) -> Dict[str, Dict[str, Any]]:
+        resultado = {}
+        # list(): /metrics lo lee desde el threadpool mientras el event loop agrega etiquetas
+        for label, calls in list(self.calls.items()):
+            executions = self.executions.get(label, 0)
+            resultado[label] = {
+                "calls": calls,
+                "executions": executions,
+                "shared": calls - executions,
+                "ratio": (calls - executions) / calls if calls else 0.0,
+            }
+        return resultado
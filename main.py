@@ -1,3 +1,4 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -7,8 +8,19 @@ from app.router import auth
 from app.router import produccion_huevos
 from app.router import stock
 from app.router import tipo_huevos  # Nuevo
+from app.router import metrics
+from core.instrumentation import QueryStatsMiddleware
+from core.metrics import MetricsMiddleware
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    # Escribe los incrementos de producción que sigan en memoria antes de terminar
+    await produccion_huevos.ingesta_produccion.close()
+
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(users.router, prefix="/users", tags=["users"])
 app.include_router(auth.router, prefix="/access", tags=["login"])
@@ -16,6 +28,7 @@ app.include_router(fincas.router, prefix="/fincas", tags=["fincas"])
 app.include_router(produccion_huevos.router, prefix="/produccion-huevos", tags=["produccion-huevos"])
 app.include_router(stock.router, prefix="/stock", tags=["stock"])
 app.include_router(tipo_huevos.router, prefix="/tipo-huevos", tags=["tipo-huevos"])
+app.include_router(metrics.router, tags=["metrics"])
 
 app.add_middleware(
     CORSMiddleware,
@@ -23,8 +36,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["GET", "POST", "PUT", "DELETE"],
     allow_headers=["*"],
+    expose_headers=["X-DB-Queries", "X-DB-Time-Ms", "ETag"],
 )
 
+# Conteo y tiempo de consultas SQL por petición (logs y cabeceras de respuesta)
+app.add_middleware(QueryStatsMiddleware)
+
+# Conteo y latencia de peticiones por ruta, expuestos en /metrics
+app.add_middleware(MetricsMiddleware)
+
 @app.get("/")
 def read_root():
     return {
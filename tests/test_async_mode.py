@@ -0,0 +1,91 @@
+"""
+Modo asíncrono (DB_ASYNC): las funciones de app.crud ejecutadas con una AsyncSession
+mediante run_db deben dar lo mismo que con una Session síncrona.
+"""
+import asyncio
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.engine import RowMapping
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import Session
+
+from app.crud import crud_stock, fincas as crud_fincas, produccion_huevos as crud_produccion
+from app.crud import resumen_produccion, tipo_huevos as crud_tipo_huevos, users as crud_users
+from app.schemas.tipo_huevos import TipoHuevosCreate
+from core.database import run_db
+
+LECTURAS = [
+    (crud_users.get_user_by_email, ("usuario7@example.com",)),
+    (crud_users.get_user_by_id, (7,)),
+    (crud_users.get_all_user_except_admins, ()),
+    (crud_fincas.get_finca_by_id, (3,)),
+    (crud_fincas.get_fincas_by_usuario, (3,)),
+    (crud_fincas.get_fincas_cercanas, (4.6, -74.08, 50)),
+    (crud_produccion.get_produccion_huevos_by_id, (10,)),
+    (crud_produccion.get_produccion_huevos_keyset, (50, None, "2024-03-01", "2024-03-31")),
+    (resumen_produccion.get_resumen, ("mes", "galpon", "2024-01-01", "2024-12-31")),
+    (crud_stock.get_stock_by_id, (5,)),
+    (crud_tipo_huevos.get_all_tipo_huevos, ()),
+]
+
+
+def _plano(valor):
+    # RowMapping -> dict para comparar resultados de las dos sesiones
+    if isinstance(valor, RowMapping):
+        return dict(valor)
+    if isinstance(valor, tuple):
+        return tuple(_plano(v) for v in valor)
+    if isinstance(valor, list):
+        return [_plano(v) for v in valor]
+    return valor
+
+
+def _en_async(url: str, fn, *args):
+    async def ejecutar():
+        engine = create_async_engine(url)
+        try:
+            async with AsyncSession(engine, expire_on_commit=False) as db:
+                return await run_db(db, fn, *args)
+        finally:
+            await engine.dispose()
+
+    return asyncio.run(ejecutar())
+
+
+@pytest.mark.parametrize("fn, args", LECTURAS, ids=[fn.__name__ for fn, _ in LECTURAS])
+def test_lecturas_iguales_en_modo_async(mysql_engine, mysql_async_url, fn, args):
+    with Session(mysql_engine) as db:
+        esperado = _plano(fn(db, *args))
+    assert _plano(_en_async(mysql_async_url, fn, *args)) == esperado
+
+
+def test_escritura_en_modo_async(mysql_engine, mysql_async_url):
+    nuevo = TipoHuevosCreate(Color="azul", Tamaño="jumbo")
+    assert _en_async(mysql_async_url, crud_tipo_huevos.create_tipo_huevo, nuevo) is True
+    with Session(mysql_engine) as db:
+        tipos = crud_tipo_huevos.get_all_tipo_huevos(db)
+    assert any(t["Color"] == "azul" and t["Tamaño"] == "jumbo" for t in tipos)
+
+
+def test_consultas_lentas_concurrentes_sin_hilos(mysql_async_url):
+    # Con AsyncSession las esperas a la base no ocupan hilos del threadpool:
+    # 60 consultas de 0.5 s en paralelo terminan en poco más de 0.5 s
+    def lenta(db):
+        return db.execute(text("SELECT SLEEP(0.5)")).scalar()
+
+    async def ejecutar():
+        engine = create_async_engine(mysql_async_url, pool_size=60, max_overflow=0)
+        try:
+            async def una():
+                async with AsyncSession(engine) as db:
+                    return await run_db(db, lenta)
+
+            loop = asyncio.get_running_loop()
+            inicio = loop.time()
+            await asyncio.gather(*(una() for _ in range(60)))
+            return loop.time() - inicio
+        finally:
+            await engine.dispose()
+
+    assert asyncio.run(ejecutar()) < 3.0
@@ -0,0 +1,70 @@
+"""
+Regresiones de planes de consulta: cada consulta de app.crud debe usar un índice
+(ver core/schema.py: `_casos_crud` y `explain_crud`).
+"""
+import inspect
+
+from sqlalchemy import inspect as inspect_db, text
+
+from app.crud import crud_stock, fincas, permisos, produccion_huevos, resumen_produccion, tipo_huevos, users
+from core.schema import _casos_crud, ensure_schema, explain_crud
+
+MODULOS_CRUD = (crud_stock, fincas, permisos, produccion_huevos, resumen_produccion, tipo_huevos, users)
+
+
+def _funciones_con_db():
+    for modulo in MODULOS_CRUD:
+        for nombre, funcion in inspect.getmembers(modulo, inspect.isfunction):
+            if funcion.__module__ != modulo.__name__ or nombre.startswith("_"):
+                continue
+            if next(iter(inspect.signature(funcion).parameters), None) == "db":
+                yield f"{modulo.__name__}.{nombre}"
+
+
+def test_casos_cubren_todas_las_funciones_de_app_crud():
+    cubiertas = {f"{funcion.__module__}.{funcion.__name__}" for _, funcion, _, _ in _casos_crud()}
+    faltantes = sorted(set(_funciones_con_db()) - cubiertas)
+    assert not faltantes, f"Agregar a core.schema._casos_crud: {faltantes}"
+
+
+def test_consultas_de_app_crud_usan_indices(mysql_engine):
+    problemas = explain_crud(mysql_engine)
+    assert not problemas, "\n".join(problemas)
+
+
+def test_explain_no_modifica_datos(mysql_engine):
+    with mysql_engine.connect() as conn:
+        antes = conn.execute(text("SELECT COUNT(*) FROM produccion_huevos")).scalar()
+        explain_crud(mysql_engine)
+        despues = conn.execute(text("SELECT COUNT(*) FROM produccion_huevos")).scalar()
+    assert despues == antes
+
+
+def _indices_email(engine):
+    return {
+        idx["name"]: bool(idx.get("unique"))
+        for idx in inspect_db(engine).get_indexes("usuarios")
+        if idx["column_names"] == ["email"]
+    }
+
+
+def test_ensure_schema_con_emails_duplicados(mysql_engine):
+    with mysql_engine.begin() as conn:
+        conn.execute(text("DROP INDEX ux_usuarios_email ON usuarios"))
+        conn.execute(text("""
+            INSERT INTO usuarios (nombre, id_rol, email, telefono, documento, pass_hash, estado)
+            VALUES ('Duplicado', 3, 'usuario7@example.com', '3000000000', '88888888', 'x', 1)
+        """))
+    try:
+        # Con duplicados no falla: deja un índice normal para que el login no recorra la tabla
+        ensure_schema(mysql_engine)
+        assert _indices_email(mysql_engine) == {"ix_usuarios_email": False}
+    finally:
+        with mysql_engine.begin() as conn:
+            conn.execute(text("DELETE FROM usuarios WHERE nombre = 'Duplicado'"))
+
+    # Corregidos los duplicados, se crea el índice único
+    ensure_schema(mysql_engine)
+    assert _indices_email(mysql_engine)["ux_usuarios_email"] is True
+    with mysql_engine.begin() as conn:
+        conn.execute(text("DROP INDEX ix_usuarios_email ON usuarios"))
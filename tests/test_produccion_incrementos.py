@@ -0,0 +1,57 @@
+"""
+Incrementos de los contadores (upsert_produccion_incrementos) y actualización parcial
+de producciones: los registros manuales y sus acumulados no deben cambiar.
+"""
+from datetime import date
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.crud import produccion_huevos as crud_produccion
+from app.schemas.produccion_huevos import ProduccionHuevosUpdate
+
+FECHA = date(2024, 3, 2)
+
+
+def _sesion(conn) -> Session:
+    # Los commits de app.crud quedan en savepoints y todo se revierte al final
+    return Session(bind=conn, join_transaction_mode="create_savepoint")
+
+
+def _filas(db, origen_sql: str):
+    return db.execute(text(f"""
+        SELECT id_produccion, cantidad FROM produccion_huevos
+        WHERE id_galpon = 1 AND fecha = :fecha AND id_tipo_huevo = 1 AND {origen_sql}
+        ORDER BY id_produccion
+    """), {"fecha": FECHA}).all()
+
+
+def test_incrementos_no_modifican_registros_manuales(mysql_engine):
+    with mysql_engine.connect() as conn, conn.begin() as transaccion:
+        db = _sesion(conn)
+        conn.execute(text("""
+            INSERT INTO produccion_huevos (id_galpon, cantidad, fecha, id_tipo_huevo)
+            VALUES (1, 100, :fecha, 1)
+        """), {"fecha": FECHA})
+        manuales = _filas(db, "origen IS NULL")
+
+        crud_produccion.upsert_produccion_incrementos(db, {(1, FECHA, 1): 5})
+        crud_produccion.upsert_produccion_incrementos(db, {(1, FECHA, 1): 7})
+
+        assert _filas(db, "origen IS NULL") == manuales
+        contador = _filas(db, "origen = 'contador'")
+        assert len(contador) == 1 and contador[0].cantidad == 12
+        transaccion.rollback()
+
+
+def test_actualizar_con_campos_null_conserva_valores(mysql_engine):
+    with mysql_engine.connect() as conn, conn.begin() as transaccion:
+        db = _sesion(conn)
+        antes = db.execute(text("SELECT cantidad, fecha FROM produccion_huevos WHERE id_produccion = 10")).one()
+
+        cambios = ProduccionHuevosUpdate(cantidad=None, fecha=None, id_galpon=2)
+        assert crud_produccion.update_produccion_huevos_by_id(db, 10, cambios) is True
+
+        despues = db.execute(text("SELECT cantidad, fecha, id_galpon FROM produccion_huevos WHERE id_produccion = 10")).one()
+        assert (despues.cantidad, despues.fecha, despues.id_galpon) == (antes.cantidad, antes.fecha, 2)
+        transaccion.rollback()
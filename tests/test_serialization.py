@@ -0,0 +1,50 @@
+"""
+core.serialization.json_list debe entregar lo mismo que response_model: los mismos
+bytes cuando los datos son válidos y un error cuando el modelo los rechazaría.
+"""
+from datetime import date
+from typing import List
+
+import pytest
+from pydantic import TypeAdapter, ValidationError
+
+from app.schemas.fincas import FincaOut
+from app.schemas.produccion_huevos import ProduccionHuevosOut
+from app.schemas.users import UserOut
+from core.serialization import dump_list
+
+USUARIO = {
+    "id_usuario": 7, "nombre": "Nombre", "id_rol": 3, "telefono": "3001234567",
+    "documento": "12345678", "estado": True, "nombre_rol": "operario",
+}
+
+
+def _con_modelo(model, rows) -> bytes:
+    # Lo que hace FastAPI con response_model: un modelo por fila y luego a JSON
+    return TypeAdapter(List[model]).dump_json([model.model_validate(dict(row)) for row in rows])
+
+
+@pytest.mark.parametrize("model, rows", [
+    (ProduccionHuevosOut, [{
+        "id_produccion": 1, "nombre_galpon": "G1", "cantidad": 30, "fecha": date(2024, 1, 2),
+        "tamaño": "AA", "columna_extra": 1,
+    }]),
+    (FincaOut, [{
+        "id_finca": 1, "nombre": "Finca", "longitud": -74.1, "latitud": 4.6, "id_usuario": 1, "estado": True,
+    }]),
+    # EmailStr normaliza (dominio en minúsculas, Unicode NFC); la salida debe hacerlo igual
+    (UserOut, [dict(USUARIO, email=email) for email in (
+        "usuario7@example.com", "Ana.Perez@EXAMPLE.COM", "josé@example.com",
+    )]),
+])
+def test_dump_list_igual_que_response_model(model, rows):
+    assert dump_list(model, rows) == _con_modelo(model, rows)
+
+
+@pytest.mark.parametrize("email", ["no-es-email", "x@localhost"])
+def test_dump_list_rechaza_emails_invalidos(email):
+    rows = [dict(USUARIO, email=email)]
+    with pytest.raises(ValidationError):
+        _con_modelo(UserOut, rows)
+    with pytest.raises(ValidationError):
+        dump_list(UserOut, rows)